@@ -0,0 +1,196 @@
+"""Background, batched writer for the user_activity log."""
+import queue
+import threading
+import time
+
+import db
+from metrics import Histogram
+
+INSERT_ACTIVITY = ("INSERT INTO user_activity (user_id, activity_type, activity_details, points_earned) "
+                   "VALUES (?, ?, ?, ?)")
+FLUSH_RETRIES = 3
+
+
+class _Entry:
+    """One enqueued unit: rows that must land in the same transaction."""
+
+    __slots__ = ("rows", "done", "error")
+
+    def __init__(self, rows, durable):
+        self.rows = rows
+        self.done = threading.Event() if durable else None
+        self.error = None
+
+
+class ActivityLogWriter:
+    """Queue activity rows from request handlers and insert them in grouped transactions.
+
+    A flush happens when ``batch_size`` rows are pending or the oldest pending
+    row has waited ``flush_interval_ms``; a batch holding a durable event is
+    flushed at once with whatever else is already queued. The queue is bounded: best-effort
+    events wait up to ``enqueue_timeout_ms`` for room and are then dropped
+    (and counted), while durable events block until they are written.
+
+    ``on_commit(user_ids)`` is called after each commit with the users whose
+    rows it contained, before any durable caller is released.
+    """
+
+    def __init__(self, max_queue=10000, batch_size=200, flush_interval_ms=50,
+                 enqueue_timeout_ms=50, db_path=None, on_commit=None):
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.enqueue_timeout = enqueue_timeout_ms / 1000.0
+        self.db_path = db_path
+        self.on_commit = on_commit
+
+        self._queue = queue.Queue(maxsize=max(1, int(max_queue)))
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._closed = False
+
+        self.flush_ms_hist = Histogram((1, 2, 5, 10, 25, 50, 100, 250, 500, 1000))
+        self.flush_rows_hist = Histogram((1, 2, 5, 10, 25, 50, 100, 200, 500, 1000))
+        self.written = 0
+        self.dropped = 0
+        self.failed_flushes = 0
+
+    def log(self, user_id, activity_type, details=None, points=0, durable=False):
+        return self.log_many([(user_id, activity_type, details, points)], durable)
+
+    def log_many(self, rows, durable=False):
+        """Enqueue rows to be written together; returns False if they were dropped.
+
+        With ``durable`` the call blocks until the rows are committed, falling
+        back to a synchronous insert if the background flush failed.
+        """
+        rows = list(rows)
+        if not rows:
+            return True
+        entry = _Entry(rows, durable)
+        if self._closed:
+            # Writer already shut down (interpreter exit): write synchronously
+            self._write([entry])
+            return True
+
+        self._ensure_worker()
+        try:
+            if durable:
+                self._queue.put(entry)
+            else:
+                self._queue.put(entry, timeout=self.enqueue_timeout)
+        except queue.Full:
+            self.dropped += len(rows)
+            print(f"Activity log queue full, dropped {len(rows)} event(s)")
+            return False
+
+        if entry.done is not None:
+            entry.done.wait()
+            if entry.error is not None:
+                # Points must never be lost: write them on the caller's thread
+                with db.transaction(self.db_path) as c:
+                    c.executemany(INSERT_ACTIVITY, rows)
+                self._committed(rows)
+        return True
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize(),
+            "queue_capacity": self._queue.maxsize,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed_flushes": self.failed_flushes,
+            "flush_ms": self.flush_ms_hist.snapshot(),
+            "flush_rows": self.flush_rows_hist.snapshot(),
+        }
+
+    def close(self, timeout=5.0):
+        """Flush everything still queued and stop the writer thread"""
+        self._closed = True
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+    def _ensure_worker(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._start_lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="activity-log-writer", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            entry = self._queue.get()
+            if entry is None:
+                break
+            batch = [entry]
+            pending_rows = len(entry.rows)
+            # A durable caller is blocked on this batch: take only what is already queued
+            durable = entry.done is not None
+            deadline = time.perf_counter() + self.flush_interval
+            while pending_rows < self.batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    if durable or remaining <= 0:
+                        entry = self._queue.get_nowait()
+                    else:
+                        entry = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if entry is None:
+                    stopping = True
+                    break
+                batch.append(entry)
+                pending_rows += len(entry.rows)
+                durable = durable or entry.done is not None
+            self._flush(batch)
+
+        # Drain whatever arrived before the shutdown sentinel was seen
+        leftover = []
+        while True:
+            try:
+                entry = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is not None:
+                leftover.append(entry)
+        if leftover:
+            self._flush(leftover)
+
+    def _flush(self, batch):
+        started = time.perf_counter()
+        error = None
+        for attempt in range(FLUSH_RETRIES):
+            try:
+                self._write(batch)
+                error = None
+                break
+            except Exception as e:
+                error = e
+                time.sleep(0.05 * (2 ** attempt))
+        if error is not None:
+            self.failed_flushes += 1
+            lost = sum(len(entry.rows) for entry in batch if entry.done is None)
+            self.dropped += lost
+            print(f"Error logging activity: {error} ({lost} best-effort event(s) dropped)")
+        else:
+            self.flush_ms_hist.observe((time.perf_counter() - started) * 1000.0)
+            self.flush_rows_hist.observe(sum(len(entry.rows) for entry in batch))
+        for entry in batch:
+            if entry.done is not None:
+                entry.error = error
+                entry.done.set()
+
+    def _write(self, batch):
+        rows = [row for entry in batch for row in entry.rows]
+        with db.transaction(self.db_path) as c:
+            c.executemany(INSERT_ACTIVITY, rows)
+        self._committed(rows)
+
+    def _committed(self, rows):
+        self.written += len(rows)
+        if self.on_commit is not None:
+            try:
+                self.on_commit({row[0] for row in rows})
+            except Exception as e:
+                print(f"Error in activity commit hook: {e}")
@@ -1,18 +1,57 @@
-from flask import Flask, request, jsonify, render_template, send_from_directory, redirect, url_for, session, flash
+from flask import Flask, Response, g, request, jsonify, render_template, send_from_directory, redirect, url_for, session, flash
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
-import tensorflow as tf
-from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing import image
+# sqlite3 must be imported before TensorFlow (loaded lazily by model_loader):
+# TF bundles its own SQLite build (without FTS5) whose symbols would
+# otherwise be bound first
+import sqlite3
 import numpy as np
 import os
 import uuid
-import sqlite3
 import re
 import math
+import io
+import atexit
+import hashlib
+import hmac
+import threading
+import time
+import sys
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
 from datetime import datetime
 from geopy.distance import geodesic  # Install with: pip install geopy
+from batching import MicroBatcher
+from prediction_cache import PredictionCache, model_identity
+import near_duplicates
+from near_duplicates import NearDuplicateIndex, perceptual_hash
+from confidence import (ConfidenceEstimator, expected_calibration_error, fit_temperature, negative_log_likelihood,
+                        recyclable_probability)
+from preprocessing import preprocess_bytes, thread_buffer
+from upload_validation import UploadRejected, read_multipart_file, validate_image_bytes
+from upload_store import UploadStore
+from geo_index import SPATIAL_TABLES, drop_spatial_index, nearest
+from recycler_directory import RecyclerDirectory, ensure_directory_version, like_pattern
+from directory_search import ensure_search_indexes, query_terms
+from directory_import import (FORMATS, TABLE_COLUMNS, DirectoryImport, ensure_import_tables, import_status,
+                              tables_being_imported)
+import reclassify
+from reclassify import Reclassification
+import db
+from activity_log import ActivityLogWriter
+from dashboard_cache import DashboardCache, MemoryBackend, RedisBackend
+import points_ledger
+import rewards
+from model_loader import ModelLoader
+from inference_backends import BACKENDS, default_model_path, load_backend
+from inference_pool import InferencePool
+import model_export
+from metrics import MetricsRegistry
+from profiler import StackSampler
+import click
+
+PROCESS_STARTED = time.perf_counter()
 
 # Flask setup
 app = Flask(__name__)
@@ -21,139 +60,275 @@ app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-i
 os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
 ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "webp"}
 
+# Inference micro-batching: concurrent /predict calls share one forward pass
+app.config["BATCH_MAX_SIZE"] = int(os.getenv("BATCH_MAX_SIZE", "16"))
+app.config["BATCH_MAX_WAIT_MS"] = float(os.getenv("BATCH_MAX_WAIT_MS", "5"))
+app.config["BATCH_LATENCY_BUDGET_MS"] = float(os.getenv("BATCH_LATENCY_BUDGET_MS", "250"))
+app.config["BATCH_TIMEOUT_S"] = float(os.getenv("BATCH_TIMEOUT_S", "60"))
+
+# Prediction cache keyed by upload content hash + model identity
+app.config["PREDICTION_CACHE_SIZE"] = int(os.getenv("PREDICTION_CACHE_SIZE", "10000"))
+app.config["PREDICTION_CACHE_TTL"] = float(os.getenv("PREDICTION_CACHE_TTL", str(7 * 24 * 3600)))
+app.config["PREDICTION_CACHE_DB"] = os.getenv("PREDICTION_CACHE_DB", "")  # e.g. users.db to persist
+
+# Confidence: temperature-scaled probabilities, and a second pass on augmented views
+# (test-time augmentation) for images below the confidence threshold (0 = single pass only)
+app.config["PREDICTION_TEMPERATURE"] = float(os.getenv("PREDICTION_TEMPERATURE", "1"))
+app.config["TTA_CONFIDENCE_THRESHOLD"] = float(os.getenv("TTA_CONFIDENCE_THRESHOLD", "0.75"))
+app.config["TTA_VIEWS"] = [view.strip() for view in os.getenv("TTA_VIEWS", "hflip,crop,hflip_crop").split(",")
+                           if view.strip()]
+
+# Near-duplicate uploads: an upload whose perceptual hash is within NEAR_DUPLICATE_DISTANCE
+# bits of a model-labelled one reuses its label; a user's own repeats are a point-farming signal
+# Off by default: it changes classification, since reused labels skip the model
+app.config["NEAR_DUPLICATES"] = os.getenv("NEAR_DUPLICATES", "0") not in ("0", "false", "False")
+app.config["NEAR_DUPLICATE_DISTANCE"] = int(os.getenv("NEAR_DUPLICATE_DISTANCE", "6"))
+app.config["NEAR_DUPLICATE_MAX_ENTRIES"] = int(os.getenv("NEAR_DUPLICATE_MAX_ENTRIES", "1000000"))
+app.config["NEAR_DUPLICATE_REPEAT_WINDOW_S"] = float(os.getenv("NEAR_DUPLICATE_REPEAT_WINDOW_S", str(24 * 3600)))
+app.config["NEAR_DUPLICATE_REPEAT_LIMIT"] = int(os.getenv("NEAR_DUPLICATE_REPEAT_LIMIT", "3"))
+
+# Upload limits: whole request body, one image's bytes and its decoded pixel count
+app.config["MAX_CONTENT_LENGTH"] = int(os.getenv("MAX_CONTENT_LENGTH", str(256 * 1024 * 1024)))
+app.config["UPLOAD_MAX_BYTES"] = int(os.getenv("UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+app.config["UPLOAD_MAX_PIXELS"] = int(os.getenv("UPLOAD_MAX_PIXELS", str(50_000_000)))
+
+# Batch classification API limits
+app.config["BATCH_UPLOAD_MAX_FILES"] = int(os.getenv("BATCH_UPLOAD_MAX_FILES", "64"))
+app.config["BATCH_UPLOAD_MAX_FILE_BYTES"] = int(os.getenv("BATCH_UPLOAD_MAX_FILE_BYTES", str(20 * 1024 * 1024)))
+app.config["PREPROCESS_WORKERS"] = int(os.getenv("PREPROCESS_WORKERS", str(min(8, os.cpu_count() or 1))))
+
+# Uploads are decoded from memory; persisting them is optional and done off the request thread
+app.config["SAVE_UPLOADS"] = os.getenv("SAVE_UPLOADS", "1") not in ("0", "false", "False")
+app.config["JPEG_DRAFT_DECODE"] = os.getenv("JPEG_DRAFT_DECODE", "1") not in ("0", "false", "False")
+
+# Upload storage: sharded originals (transcoded) + thumbnails, each tier with its own retention
+app.config["UPLOAD_FORMAT"] = os.getenv("UPLOAD_FORMAT", "webp")
+app.config["UPLOAD_QUALITY"] = int(os.getenv("UPLOAD_QUALITY", "85"))
+app.config["THUMBNAIL_SIZE"] = int(os.getenv("THUMBNAIL_SIZE", "320"))
+app.config["UPLOAD_RETENTION_DAYS"] = float(os.getenv("UPLOAD_RETENTION_DAYS", "90"))
+app.config["THUMBNAIL_RETENTION_DAYS"] = float(os.getenv("THUMBNAIL_RETENTION_DAYS", "365"))
+app.config["UPLOAD_SWEEP_INTERVAL_S"] = float(os.getenv("UPLOAD_SWEEP_INTERVAL_S", "3600"))
+
+# Dashboard cache: per-user payloads, dropped whenever the user's activity is written
+app.config["DASHBOARD_CACHE_SIZE"] = int(os.getenv("DASHBOARD_CACHE_SIZE", "10000"))
+app.config["DASHBOARD_CACHE_TTL"] = float(os.getenv("DASHBOARD_CACHE_TTL", "300"))
+app.config["DASHBOARD_CACHE_REDIS_URL"] = os.getenv("DASHBOARD_CACHE_REDIS_URL", "")  # e.g. redis://localhost:6379/0
+
+# Recycler directory: both tables served from an in-memory snapshot, reloaded when they change
+app.config["DIRECTORY_REFRESH_S"] = float(os.getenv("DIRECTORY_REFRESH_S", "2"))
+
+# Bulk directory imports: rows per transaction, and the token-protected import API (off without a token)
+app.config["DIRECTORY_IMPORT_CHUNK_SIZE"] = int(os.getenv("DIRECTORY_IMPORT_CHUNK_SIZE", "5000"))
+app.config["DIRECTORY_IMPORT_TOKEN"] = os.getenv("DIRECTORY_IMPORT_TOKEN", "")
+app.config["DIRECTORY_IMPORT_DIR"] = os.getenv("DIRECTORY_IMPORT_DIR", "imports")
+
+# Offline re-classification of stored uploads: images per forward pass (also the resume granularity)
+app.config["RECLASSIFY_BATCH_SIZE"] = int(os.getenv("RECLASSIFY_BATCH_SIZE", "128"))
+
+# ASGI mode (asgi.py): bounded pools for the native routes' DB work and for routes served by Flask
+app.config["ASGI_DB_THREADS"] = int(os.getenv("ASGI_DB_THREADS", "8"))
+app.config["ASGI_WSGI_THREADS"] = int(os.getenv("ASGI_WSGI_THREADS", "16"))
+
+# Activity log: handlers enqueue, a background writer inserts in grouped transactions
+app.config["ACTIVITY_QUEUE_SIZE"] = int(os.getenv("ACTIVITY_QUEUE_SIZE", "10000"))
+app.config["ACTIVITY_BATCH_SIZE"] = int(os.getenv("ACTIVITY_BATCH_SIZE", "200"))
+app.config["ACTIVITY_FLUSH_MS"] = float(os.getenv("ACTIVITY_FLUSH_MS", "50"))
+app.config["ACTIVITY_ENQUEUE_TIMEOUT_MS"] = float(os.getenv("ACTIVITY_ENQUEUE_TIMEOUT_MS", "50"))
+app.config["ACTIVITY_DURABLE_POINTS"] = os.getenv("ACTIVITY_DURABLE_POINTS", "1") not in ("0", "false", "False")
+
+# Reward settlement: classifications record pending rewards, a background settler pays them out
+app.config["REWARD_SETTLE_INTERVAL_S"] = float(os.getenv("REWARD_SETTLE_INTERVAL_S", "5"))
+app.config["REWARD_MAX_ATTEMPTS"] = int(os.getenv("REWARD_MAX_ATTEMPTS", "6"))
+app.config["REWARD_BACKEND_LATENCY_MS"] = float(os.getenv("REWARD_BACKEND_LATENCY_MS", "0"))
+app.config["REWARD_BACKEND_FAILURE_RATE"] = float(os.getenv("REWARD_BACKEND_FAILURE_RATE", "0"))
+
+# Instrumentation: Prometheus metrics at /metrics, and a sampling profiler that
+# can be switched on while serving (/debug/profiler, off without a token)
+app.config["PROFILER_ENABLED"] = os.getenv("PROFILER_ENABLED", "0") not in ("0", "false", "False")
+app.config["PROFILER_INTERVAL_MS"] = float(os.getenv("PROFILER_INTERVAL_MS", "20"))
+app.config["PROFILER_TOKEN"] = os.getenv("PROFILER_TOKEN", "")
+
+# Model warm-up: "background" loads on a thread after the first request, "lazy"
+# on the first prediction, "eager" at import (the old behaviour)
+app.config["MODEL_WARMUP"] = os.getenv("MODEL_WARMUP", "background").lower()
+
+# Request and stage timings (milliseconds, exported in seconds), rendered at /metrics
+# together with the components' own histograms
+metrics_registry = MetricsRegistry()
+REQUEST_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+STAGE_BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 1000, 5000)
+request_ms = metrics_registry.histogram("sortify_http_request_duration_seconds",
+                                        "Request latency by route", REQUEST_BUCKETS_MS, labels=("route", "method"))
+request_count = metrics_registry.counter("sortify_http_requests_total", "Requests by route and status code",
+                                         labels=("route", "method", "status"))
+stage_ms = metrics_registry.histogram("sortify_stage_duration_seconds",
+                                      "Time spent in each stage of /predict and the nearby searches",
+                                      STAGE_BUCKETS_MS, labels=("stage",))
+stage = stage_ms.time  # with stage("preprocess"): ...
+stack_sampler = StackSampler(interval_ms=app.config["PROFILER_INTERVAL_MS"])
+
+def observe_request(route, method, status, elapsed_ms):
+    """Record one finished request (shared with the ASGI app's native routes)"""
+    request_ms.labels(route, method).observe(elapsed_ms)
+    request_count.labels(route, method, str(status)).inc()
+
 # Database setup
 def init_db():
-    conn = sqlite3.connect('users.db')
-    c = conn.cursor()
+    with db.transaction() as c:
+        # Create users table if it doesn't exist
+        c.execute('''CREATE TABLE IF NOT EXISTS users
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      name TEXT NOT NULL,
+                      email TEXT UNIQUE NOT NULL,
+                      password TEXT NOT NULL,
+                      wallet_address TEXT,
+                      latitude REAL,
+                      longitude REAL,
+                      created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
     
-    # Create users table if it doesn't exist
-    c.execute('''CREATE TABLE IF NOT EXISTS users
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  name TEXT NOT NULL,
-                  email TEXT UNIQUE NOT NULL,
-                  password TEXT NOT NULL,
-                  wallet_address TEXT,
-                  latitude REAL,
-                  longitude REAL,
-                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+        # Create user_activity table for dashboard
+        c.execute('''CREATE TABLE IF NOT EXISTS user_activity
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      user_id INTEGER NOT NULL,
+                      activity_type TEXT NOT NULL,
+                      activity_details TEXT,
+                      points_earned INTEGER DEFAULT 0,
+                      created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                      FOREIGN KEY (user_id) REFERENCES users (id))''')
     
-    # Create user_activity table for dashboard
-    c.execute('''CREATE TABLE IF NOT EXISTS user_activity
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  user_id INTEGER NOT NULL,
-                  activity_type TEXT NOT NULL,
-                  activity_details TEXT,
-                  points_earned INTEGER DEFAULT 0,
-                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                  FOREIGN KEY (user_id) REFERENCES users (id))''')
+        # Create recyclers table with location data
+        c.execute('''CREATE TABLE IF NOT EXISTS recyclers
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      name TEXT NOT NULL,
+                      description TEXT,
+                      category TEXT,
+                      email TEXT,
+                      phone TEXT,
+                      website TEXT,
+                      address TEXT,
+                      latitude REAL,
+                      longitude REAL,
+                      city TEXT,
+                      accepts_recyclables BOOLEAN DEFAULT TRUE,
+                      created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
     
-    # Create recyclers table with location data
-    c.execute('''CREATE TABLE IF NOT EXISTS recyclers
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  name TEXT NOT NULL,
-                  description TEXT,
-                  category TEXT,
-                  email TEXT,
-                  phone TEXT,
-                  website TEXT,
-                  address TEXT,
-                  latitude REAL,
-                  longitude REAL,
-                  city TEXT,
-                  accepts_recyclables BOOLEAN DEFAULT TRUE,
-                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+        # Create recycling_centers table (NEW)
+        c.execute('''CREATE TABLE IF NOT EXISTS recycling_centers
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      name TEXT NOT NULL,
+                      type TEXT NOT NULL,
+                      category TEXT,
+                      address TEXT,
+                      latitude REAL,
+                      longitude REAL,
+                      contact_email TEXT,
+                      contact_phone TEXT,
+                      website TEXT,
+                      operating_hours TEXT,
+                      accepted_materials TEXT,
+                      created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
     
-    # Create recycling_centers table (NEW)
-    c.execute('''CREATE TABLE IF NOT EXISTS recycling_centers
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  name TEXT NOT NULL,
-                  type TEXT NOT NULL,
-                  category TEXT,
-                  address TEXT,
-                  latitude REAL,
-                  longitude REAL,
-                  contact_email TEXT,
-                  contact_phone TEXT,
-                  website TEXT,
-                  operating_hours TEXT,
-                  accepted_materials TEXT,
-                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+        # Check if wallet_address column exists, if not add it
+        try:
+            c.execute("SELECT wallet_address FROM users LIMIT 1")
+        except sqlite3.OperationalError:
+            print("Adding wallet_address column to users table...")
+            c.execute("ALTER TABLE users ADD COLUMN wallet_address TEXT")
     
-    # Check if wallet_address column exists, if not add it
-    try:
-        c.execute("SELECT wallet_address FROM users LIMIT 1")
-    except sqlite3.OperationalError:
-        print("Adding wallet_address column to users table...")
-        c.execute("ALTER TABLE users ADD COLUMN wallet_address TEXT")
-    
-    # Check if latitude/longitude columns exist, if not add them
-    try:
-        c.execute("SELECT latitude FROM users LIMIT 1")
-    except sqlite3.OperationalError:
-        print("Adding latitude/longitude columns to users table...")
-        c.execute("ALTER TABLE users ADD COLUMN latitude REAL")
-        c.execute("ALTER TABLE users ADD COLUMN longitude REAL")
+        # Check if latitude/longitude columns exist, if not add them
+        try:
+            c.execute("SELECT latitude FROM users LIMIT 1")
+        except sqlite3.OperationalError:
+            print("Adding latitude/longitude columns to users table...")
+            c.execute("ALTER TABLE users ADD COLUMN latitude REAL")
+            c.execute("ALTER TABLE users ADD COLUMN longitude REAL")
     
-    # Insert sample recyclers if table is empty
-    c.execute("SELECT COUNT(*) FROM recyclers")
-    if c.fetchone()[0] == 0:
-        sample_recyclers = [
-            ('Green Earth Foundation', 'Environmental conservation and waste management', 'Environment', 
-             'contact@greenearth.org', '+1234567890', 'https://greenearth.org', 
-             '123 Eco Street, Green City', 12.9716, 77.5946, 'Bangalore', True),
-            ('Recycle India', 'Nationwide recycling initiative', 'Recycling', 
-             'info@recycleindia.org', '+1987654321', 'https://recycleindia.org', 
-             '456 Green Avenue, Eco Town', 28.6139, 77.2090, 'Delhi', True),
-            ('EcoSavers', 'Community-based environmental organization', 'Community', 
-             'hello@ecosavers.org', '+1122334455', 'https://ecosavers.org', 
-             '789 Nature Road, Sustainable City', 19.0760, 72.8777, 'Mumbai', True),
-            ('Waste Warriors', 'Fighting waste through education and action', 'Education', 
-             'contact@wastewarriors.org', '+1567890123', 'https://wastewarriors.org', 
-             '321 Clean Lane, Green Valley', 13.0827, 80.2707, 'Chennai', True),
-            ('Planet Protectors', 'Youth-led environmental initiative', 'Youth', 
-             'join@planetprotectors.org', '+1456789012', 'https://planetprotectors.org', 
-             '654 Earth Boulevard, Eco District', 17.3850, 78.4867, 'Hyderabad', True)
-        ]
+        # Insert sample recyclers if table is empty
+        c.execute("SELECT COUNT(*) FROM recyclers")
+        if c.fetchone()[0] == 0:
+            sample_recyclers = [
+                ('Green Earth Foundation', 'Environmental conservation and waste management', 'Environment', 
+                 'contact@greenearth.org', '+1234567890', 'https://greenearth.org', 
+                 '123 Eco Street, Green City', 12.9716, 77.5946, 'Bangalore', True),
+                ('Recycle India', 'Nationwide recycling initiative', 'Recycling', 
+                 'info@recycleindia.org', '+1987654321', 'https://recycleindia.org', 
+                 '456 Green Avenue, Eco Town', 28.6139, 77.2090, 'Delhi', True),
+                ('EcoSavers', 'Community-based environmental organization', 'Community', 
+                 'hello@ecosavers.org', '+1122334455', 'https://ecosavers.org', 
+                 '789 Nature Road, Sustainable City', 19.0760, 72.8777, 'Mumbai', True),
+                ('Waste Warriors', 'Fighting waste through education and action', 'Education', 
+                 'contact@wastewarriors.org', '+1567890123', 'https://wastewarriors.org', 
+                 '321 Clean Lane, Green Valley', 13.0827, 80.2707, 'Chennai', True),
+                ('Planet Protectors', 'Youth-led environmental initiative', 'Youth', 
+                 'join@planetprotectors.org', '+1456789012', 'https://planetprotectors.org', 
+                 '654 Earth Boulevard, Eco District', 17.3850, 78.4867, 'Hyderabad', True)
+            ]
         
-        c.executemany('''INSERT INTO recyclers (name, description, category, email, phone, website, 
-                      address, latitude, longitude, city, accepts_recyclables) 
-                      VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', sample_recyclers)
+            c.executemany('''INSERT INTO recyclers (name, description, category, email, phone, website, 
+                          address, latitude, longitude, city, accepts_recyclables) 
+                          VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', sample_recyclers)
     
-    # Insert sample recycling centers if table is empty (NEW)
-    c.execute("SELECT COUNT(*) FROM recycling_centers")
-    if c.fetchone()[0] == 0:
-        sample_centers = [
-            ('Green Earth Recycling', 'NGO', 'Multiple', 
-             '123 Eco Street, Green City', 12.9716, 77.5946,
-             'contact@greenearth.org', '+1234567890', 'https://greenearth.org',
-             'Mon-Fri: 9AM-5PM', 'Plastic, Paper, Glass, Metal'),
-            ('City Recycling Facility', 'Government', 'Multiple',
-             '456 Municipal Road, Metro City', 28.6139, 77.2090,
-             'info@cityrecycle.gov', '+1987654321', 'https://cityrecycle.gov',
-             'Mon-Sat: 8AM-6PM', 'Plastic, Paper, Glass, Metal, Electronics'),
-            ('E-Waste Solutions', 'Private', 'Electronics',
-             '789 Tech Park, Electronics City', 13.0827, 80.2707,
-             'service@ewastesolutions.com', '+1122334455', 'https://ewastesolutions.com',
-             'Mon-Fri: 10AM-4PM', 'Electronics, Batteries'),
-            ('Plastic Renew', 'NGO', 'Plastic',
-             '321 Polymer Avenue, Industrial Area', 17.3850, 78.4867,
-             'info@plasticrenew.org', '+1567890123', 'https://plasticrenew.org',
-             'Tue-Sun: 9AM-5PM', 'Plastic only'),
-            ('Paper Saver', 'Private', 'Paper',
-             '654 Pulp Road, Green Valley', 19.0760, 72.8777,
-             'contact@papersaver.com', '+1456789012', 'https://papersaver.com',
-             'Mon-Fri: 8AM-4PM', 'Paper, Cardboard')
-        ]
+        # Insert sample recycling centers if table is empty (NEW)
+        c.execute("SELECT COUNT(*) FROM recycling_centers")
+        if c.fetchone()[0] == 0:
+            sample_centers = [
+                ('Green Earth Recycling', 'NGO', 'Multiple', 
+                 '123 Eco Street, Green City', 12.9716, 77.5946,
+                 'contact@greenearth.org', '+1234567890', 'https://greenearth.org',
+                 'Mon-Fri: 9AM-5PM', 'Plastic, Paper, Glass, Metal'),
+                ('City Recycling Facility', 'Government', 'Multiple',
+                 '456 Municipal Road, Metro City', 28.6139, 77.2090,
+                 'info@cityrecycle.gov', '+1987654321', 'https://cityrecycle.gov',
+                 'Mon-Sat: 8AM-6PM', 'Plastic, Paper, Glass, Metal, Electronics'),
+                ('E-Waste Solutions', 'Private', 'Electronics',
+                 '789 Tech Park, Electronics City', 13.0827, 80.2707,
+                 'service@ewastesolutions.com', '+1122334455', 'https://ewastesolutions.com',
+                 'Mon-Fri: 10AM-4PM', 'Electronics, Batteries'),
+                ('Plastic Renew', 'NGO', 'Plastic',
+                 '321 Polymer Avenue, Industrial Area', 17.3850, 78.4867,
+                 'info@plasticrenew.org', '+1567890123', 'https://plasticrenew.org',
+                 'Tue-Sun: 9AM-5PM', 'Plastic only'),
+                ('Paper Saver', 'Private', 'Paper',
+                 '654 Pulp Road, Green Valley', 19.0760, 72.8777,
+                 'contact@papersaver.com', '+1456789012', 'https://papersaver.com',
+                 'Mon-Fri: 8AM-4PM', 'Paper, Cardboard')
+            ]
         
-        c.executemany('''INSERT INTO recycling_centers 
-                      (name, type, category, address, latitude, longitude, 
-                       contact_email, contact_phone, website, operating_hours, accepted_materials) 
-                      VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', sample_centers)
+            c.executemany('''INSERT INTO recycling_centers 
+                          (name, type, category, address, latitude, longitude, 
+                           contact_email, contact_phone, website, operating_hours, accepted_materials) 
+                          VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', sample_centers)
     
-    conn.commit()
-    conn.close()
+        # Nearby searches run on the in-memory directory: drop the old R*Tree indexes and their triggers
+        for table in SPATIAL_TABLES:
+            drop_spatial_index(c, table)
+
+        # A bulk import running in another process (e.g. the CLI) has dropped its table's
+        # triggers on purpose; they are recreated when it finishes, not by this worker's start
+        importing = tables_being_imported(c)
+
+        # Version counter that tells the in-memory recycler directory to reload
+        ensure_directory_version(c, skip=importing)
+
+        # Materials mapping and full-text indexes behind the directory search filters
+        for table in SPATIAL_TABLES:
+            if table not in importing:
+                ensure_search_indexes(c, table)
+
+        # Upsert keys for bulk imports, their run log, and repair after a killed import
+        ensure_import_tables(c)
 
-init_db()
+        # Perceptual hashes of classified uploads, reloaded into the near-duplicate index
+        near_duplicates.ensure_upload_hashes(c)
+
+        # Labels from offline re-classification runs, per upload and model, and their run log
+        reclassify.ensure_prediction_tables(c)
+
+        # Materialized points balances + covering index for the activity feed
+        points_ledger.ensure_points_ledger(c)
+
+        # Pending rewards and their batched payouts
+        rewards.ensure_reward_tables(c)
 
 def allowed_file(filename: str) -> bool:
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -168,19 +343,64 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def web_worker_count():
+    """Worker processes of the web server, as far as this process can tell.
+
+    gunicorn and uvicorn both read WEB_CONCURRENCY; a -w/--workers option on
+    their command line takes precedence. A workers setting in a gunicorn
+    config file is not seen.
+    """
+    if os.path.basename(sys.argv[0]).startswith(("gunicorn", "uvicorn")):
+        for i, arg in enumerate(sys.argv[1:], 1):
+            if arg in ("-w", "--workers") and i + 1 < len(sys.argv):
+                return int(sys.argv[i + 1])
+            if arg.startswith("--workers="):
+                return int(arg.split("=", 1)[1])
+            if arg.startswith("-w") and arg[2:].isdigit():
+                return int(arg[2:])
+    return int(os.getenv("WEB_CONCURRENCY") or 1)
+
+# Dashboard data is cached per user until their next activity write
+if app.config["DASHBOARD_CACHE_REDIS_URL"]:
+    dashboard_backend = RedisBackend(app.config["DASHBOARD_CACHE_REDIS_URL"],
+                                     ttl_seconds=app.config["DASHBOARD_CACHE_TTL"])
+else:
+    # Invalidations would not reach the other workers, which would serve stale points until the TTL
+    if app.config["DASHBOARD_CACHE_SIZE"] and web_worker_count() > 1:
+        raise RuntimeError("The in-memory dashboard cache only works in a single web process: set "
+                           "DASHBOARD_CACHE_REDIS_URL to share it between workers, or DASHBOARD_CACHE_SIZE=0")
+    dashboard_backend = MemoryBackend(max_entries=app.config["DASHBOARD_CACHE_SIZE"],
+                                      ttl_seconds=app.config["DASHBOARD_CACHE_TTL"])
+dashboard_cache = DashboardCache(lambda user_id: dashboard_data(user_id), dashboard_backend)
+
 # Log user activity
-def log_activity(user_id, activity_type, details=None, points=0):
+activity_log = ActivityLogWriter(max_queue=app.config["ACTIVITY_QUEUE_SIZE"],
+                                 batch_size=app.config["ACTIVITY_BATCH_SIZE"],
+                                 flush_interval_ms=app.config["ACTIVITY_FLUSH_MS"],
+                                 enqueue_timeout_ms=app.config["ACTIVITY_ENQUEUE_TIMEOUT_MS"],
+                                 on_commit=dashboard_cache.invalidate)
+atexit.register(activity_log.close)
+
+def log_activities(rows):
+    """Queue (user_id, type, details, points) rows to be written in one transaction.
+
+    Rows that earn points wait until they are committed (ACTIVITY_DURABLE_POINTS),
+    so a response never reports points that could still be lost.
+    """
+    durable = app.config["ACTIVITY_DURABLE_POINTS"] and any(row[3] > 0 for row in rows)
     try:
-        conn = sqlite3.connect('users.db')
-        c = conn.cursor()
-        c.execute("INSERT INTO user_activity (user_id, activity_type, activity_details, points_earned) VALUES (?, ?, ?, ?)",
-                 (user_id, activity_type, details, points))
-        conn.commit()
-        conn.close()
+        activity_log.log_many(rows, durable=durable)
     except Exception as e:
+        if durable:
+            raise
         print(f"Error logging activity: {e}")
 
+def log_activity(user_id, activity_type, details=None, points=0):
+    log_activities([(user_id, activity_type, details, points)])
+
 # Geolocation functions
+ROUNDED_DISTANCE_SLACK_KM = 0.05  # results are ranked on distance rounded to 0.1 km
+
 def calculate_distance(lat1, lon1, lat2, lon2):
     """Calculate distance between two coordinates in kilometers"""
     try:
@@ -195,83 +415,60 @@ def calculate_distance(lat1, lon1, lat2, lon2):
         c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
         return R * c
 
-def get_nearby_recyclers(user_lat, user_lon, max_distance_km=50, limit=10):
-    """Find Recyclers near the user's location from SQLite DB"""
-    conn = sqlite3.connect('users.db')
-    c = conn.cursor()
-
-    # Fetch recyclers that accept recyclables
-    c.execute("SELECT * FROM recyclers WHERE accepts_recyclables = 1")
-    all_recyclers = c.fetchall()
-
-    nearby_recyclers = []
-    for recycler in all_recyclers:
-        recycler_lat, recycler_lon = recycler[8], recycler[9]  # latitude & longitude columns
-        if recycler_lat and recycler_lon:
-            distance = calculate_distance(user_lat, user_lon, recycler_lat, recycler_lon)
-            if distance <= max_distance_km:
-                recycler_data = {
-                    'id': recycler[0],
-                    'name': recycler[1],
-                    'description': recycler[2],
-                    'category': recycler[3],
-                    'email': recycler[4],
-                    'phone': recycler[5],
-                    'website': recycler[6],
-                    'address': recycler[7],
-                    'latitude': recycler[8],
-                    'longitude': recycler[9],
-                    'city': recycler[10],
-                    'accepts_recyclables': bool(recycler[11]),
-                    'distance': round(distance, 1)
-                }
-                nearby_recyclers.append(recycler_data)
-
-    # Sort recyclers by distance and limit results
-    nearby_recyclers.sort(key=lambda x: x['distance'])
-    conn.close()
-    return nearby_recyclers[:limit]
-
-def get_nearby_recycling_centers(user_lat, user_lon, max_distance_km=50, category='', limit=10):
-    """Find recycling centers near the user's location"""
-    conn = sqlite3.connect('users.db')
-    c = conn.cursor()
-    
-    # For SQLite, we need to calculate distance for each row
-    if category:
-        c.execute('SELECT * FROM recycling_centers WHERE category LIKE ?', (f'%{category}%',))
-    else:
-        c.execute('SELECT * FROM recycling_centers')
-        
-    all_centers = c.fetchall()
+# Recyclers and recycling centers are read from memory; see recycler_directory.py
+directory = RecyclerDirectory(refresh_interval_s=app.config["DIRECTORY_REFRESH_S"])
+
+def get_nearby_recyclers(user_lat, user_lon, max_distance_km=50, limit=10, query=''):
+    """Find Recyclers near the user's location from the directory snapshot"""
+    snapshot = directory.snapshot
+
+    # Only recyclers that accept recyclables (and match the text query), inside the search circle's bounding box
+    with stage("geo_filter"):
+        where = snapshot.accepting
+        if query_terms(query):
+            where = where & directory.text_mask(snapshot, "recyclers", query)
+    with stage("geo_search"):
+        nearby_recyclers = []
+        for recycler, distance in snapshot.recyclers.nearby(user_lat, user_lon, max_distance_km, limit,
+                                                            calculate_distance, where=where,
+                                                            slack_km=ROUNDED_DISTANCE_SLACK_KM):
+            recycler_data = recycler._asdict()
+            recycler_data['accepts_recyclables'] = bool(recycler.accepts_recyclables)
+            recycler_data['distance'] = round(distance, 1)
+            nearby_recyclers.append(recycler_data)
+
+        # Closest recyclers first; ties keep table order as before
+        return nearest(nearby_recyclers, limit, key=lambda x: (x['distance'], x['id']))
+
+def get_nearby_recycling_centers(user_lat, user_lon, max_distance_km=50, category='', limit=10,
+                                 materials=None, query=''):
+    """Find recycling centers near the user's location, optionally accepting ``materials`` / matching ``query``"""
+    snapshot = directory.snapshot
+    centers = snapshot.centers
     
-    nearby_centers = []
-    for center in all_centers:
-        center_lat, center_lon = center[5], center[6]  # latitude and longitude columns
-        if center_lat and center_lon:
-            distance = calculate_distance(user_lat, user_lon, center_lat, center_lon)
-            if distance <= max_distance_km:
-                center_data = {
-                    'id': center[0],
-                    'name': center[1],
-                    'type': center[2],
-                    'category': center[3],
-                    'address': center[4],
-                    'latitude': center[5],
-                    'longitude': center[6],
-                    'contact_email': center[7],
-                    'contact_phone': center[8],
-                    'website': center[9],
-                    'operating_hours': center[10],
-                    'accepted_materials': center[11],
-                    'distance': round(distance, 1)
-                }
-                nearby_centers.append(center_data)
+    # Filters combine into one row mask, applied before any distance is computed.
+    # Category keeps the old LIKE '%category%' semantics (matched once per distinct value)
+    with stage("geo_filter"):
+        masks = []
+        if category:
+            pattern = like_pattern(category)
+            masks.append(centers.mask("category", lambda value: value is not None and pattern.search(value)))
+        if materials:
+            masks.append(snapshot.material_mask(materials))
+        if query_terms(query):
+            masks.append(directory.text_mask(snapshot, "recycling_centers", query))
+        where = np.logical_and.reduce(masks) if masks else None
     
-    # Sort by distance
-    nearby_centers.sort(key=lambda x: x['distance'])
-    conn.close()
-    return nearby_centers[:limit]
+    with stage("geo_search"):
+        nearby_centers = []
+        for center, distance in centers.nearby(user_lat, user_lon, max_distance_km, limit, calculate_distance,
+                                               where=where, slack_km=ROUNDED_DISTANCE_SLACK_KM):
+            center_data = center._asdict()
+            center_data['distance'] = round(distance, 1)
+            nearby_centers.append(center_data)
+        
+        # Closest centers first; ties keep table order as before
+        return nearest(nearby_centers, limit, key=lambda x: (x['distance'], x['id']))
 
 # Flask route for Find recyclers page
 @app.route('/find_recyclers')
@@ -288,26 +485,159 @@ def send_to_recyclers():
     """Redirect to Find recyclers page after classification output"""
     return redirect(url_for('find_recyclers'))
 
-# Load ML Model
-MODEL_PATH = os.environ.get("MODEL_PATH", "model/Sortify.h5")
-model_loaded = False
-model_error = None
+# Load ML Model (the runtime is imported by the loader, not by this module)
+app.config["INFERENCE_BACKEND"] = os.getenv("INFERENCE_BACKEND", "keras").lower()
+app.config["INFERENCE_THREADS"] = int(os.getenv("INFERENCE_THREADS", "0"))
+MODEL_PATH = os.environ.get("MODEL_PATH", default_model_path(app.config["INFERENCE_BACKEND"]))
+model_loader = ModelLoader(MODEL_PATH, backend=app.config["INFERENCE_BACKEND"],
+                           num_threads=app.config["INFERENCE_THREADS"])
+
+# Optional pool of inference worker processes (0 = run the model in this process)
+app.config["INFERENCE_WORKERS"] = int(os.getenv("INFERENCE_WORKERS", "0"))
+app.config["INFERENCE_WORKER_CORES"] = int(os.getenv("INFERENCE_WORKER_CORES", "0"))
+app.config["INFERENCE_TIMEOUT_S"] = float(os.getenv("INFERENCE_TIMEOUT_S", "30"))
+inference_pool = None  # created by ensure_started(), never at import: spawned workers re-import __main__
+
+if app.config["MODEL_WARMUP"] == "eager" and not app.config["INFERENCE_WORKERS"]:
+    try:
+        model_loader.get()
+    except RuntimeError:
+        pass
+
+def run_inference(batch):
+    """Run a preprocessed batch on the worker pool, or in this process"""
+    if inference_pool is not None:
+        return inference_pool.predict(batch)
+    return model_loader.get().predict(batch)
+
+def model_error():
+    return inference_pool.error if inference_pool is not None else model_loader.error
+
+batcher = MicroBatcher(run_inference,
+                       max_batch_size=app.config["BATCH_MAX_SIZE"],
+                       max_wait_ms=app.config["BATCH_MAX_WAIT_MS"],
+                       latency_budget_ms=app.config["BATCH_LATENCY_BUDGET_MS"],
+                       dispatchers=max(1, app.config["INFERENCE_WORKERS"]),
+                       timeout_s=app.config["BATCH_TIMEOUT_S"])
+
+preprocess_executor = ThreadPoolExecutor(max_workers=app.config["PREPROCESS_WORKERS"],
+                                         thread_name_prefix="preprocess")
+upload_writer = ThreadPoolExecutor(max_workers=2, thread_name_prefix="upload-writer")
+pending_upload_writes = {}  # file_path -> Future, until the background write lands
+upload_store = UploadStore(app.config["UPLOAD_FOLDER"],
+                           original_format=app.config["UPLOAD_FORMAT"],
+                           original_quality=app.config["UPLOAD_QUALITY"],
+                           thumbnail_size=app.config["THUMBNAIL_SIZE"],
+                           original_retention_days=app.config["UPLOAD_RETENTION_DAYS"],
+                           thumbnail_retention_days=app.config["THUMBNAIL_RETENTION_DAYS"],
+                           sweep_interval_s=app.config["UPLOAD_SWEEP_INTERVAL_S"])
 
-try:
-    model = load_model(MODEL_PATH, compile=False)
-    model_loaded = True
-    print("✅ Model loaded successfully")
-except Exception as e:
-    model_error = str(e)
-    model = None
-    print(f"❌ Failed to load model: {model_error}")
+confidence_estimator = ConfidenceEstimator(temperature=app.config["PREDICTION_TEMPERATURE"],
+                                           threshold=app.config["TTA_CONFIDENCE_THRESHOLD"],
+                                           views=app.config["TTA_VIEWS"])
+
+near_duplicate_index = NearDuplicateIndex(radius=app.config["NEAR_DUPLICATE_DISTANCE"],
+                                          max_entries=app.config["NEAR_DUPLICATE_MAX_ENTRIES"]) \
+    if app.config["NEAR_DUPLICATES"] else None
+
+def near_duplicate_lookup(digest, img_array, user_id):
+    """``(phash, match)`` for an upload, hashed from ``img_array`` or, for cache hits, found by digest"""
+    if near_duplicate_index is None:
+        return None, None
+    phash = perceptual_hash(img_array) if img_array is not None else near_duplicates.hash_for_digest(digest)
+    if phash is None:
+        return None, None
+    return phash, near_duplicate_index.match(phash, user_id, app.config["NEAR_DUPLICATE_REPEAT_WINDOW_S"])
+
+def reusable_prediction(match):
+    """Model output rebuilt from a near-duplicate's label probability, or None to run the model"""
+    if match is None or match.probability is None:
+        return None
+    near_duplicate_index.count(reused=1)
+    return np.array([[match.probability]], dtype=np.float32)
+
+def record_upload_hash(digest, phash, preds, user_id, match, source):
+    """Index a classified upload and store its hash off the request thread.
+
+    ``source`` is where its label came from: "model", "near_duplicate" or
+    "cache"; only model labels are reused. Returns the ``near_duplicate``
+    response field; ``flagged`` in it means the upload earns no points.
+    """
+    if phash is None:
+        return None
+    now = time.time()
+    probability = recyclable_probability(preds)
+    own_repeats = match.own_repeats if match is not None else 0
+    flagged = own_repeats >= app.config["NEAR_DUPLICATE_REPEAT_LIMIT"]
+    # Cache hits are indexed so the user's later repeats count them, but their bytes are
+    # already stored: a row is only kept for the user's own repeats, for farming-report
+    near_duplicate_index.add(phash, probability, user_id, now, labelled=source == "model")
+    if source != "cache" or own_repeats:
+        upload_writer.submit(store_upload_hash, digest, phash, probability, user_id, source == "model",
+                             own_repeats, now)
+    if flagged:
+        near_duplicate_index.count(flagged=1)
+        app.logger.warning("Possible point farming: user %s uploaded %d near-identical images within %gh; "
+                           "no points awarded", user_id, own_repeats + 1,
+                           app.config["NEAR_DUPLICATE_REPEAT_WINDOW_S"] / 3600)
+    if match is None or match.distance is None:
+        return None
+    return {"similarity": round(1.0 - match.distance / 64.0, 3), "reused_label": source == "near_duplicate",
+            "flagged": flagged}
+
+def repeat_flagged(near_duplicate):
+    """Whether an upload was flagged as a repeat by record_upload_hash (and earns no points)"""
+    return bool(near_duplicate and near_duplicate["flagged"])
+
+def store_upload_hash(*row):
+    try:
+        near_duplicates.record_hash(*row)
+    except Exception as e:
+        print(f"Error storing upload hash: {e}")
+
+# Draft-decoded JPEGs give the model slightly different pixels, so the setting is part of the cache key
+prediction_cache = PredictionCache(":".join(filter(None, (model_identity(MODEL_PATH), confidence_estimator.identity,
+                                                          "jpeg-draft" if app.config["JPEG_DRAFT_DECODE"] else ""))),
+                                   max_entries=app.config["PREDICTION_CACHE_SIZE"],
+                                   ttl_seconds=app.config["PREDICTION_CACHE_TTL"],
+                                   db_path=app.config["PREDICTION_CACHE_DB"])
 
 def preprocess(img_path):
+    """Reference preprocessing: reload the saved file through Keras' load_img.
+
+    Kept for correctness checks of preprocess_bytes(), which is what the
+    request paths use.
+    """
+    from tensorflow.keras.preprocessing import image
     img = image.load_img(img_path, target_size=(224, 224))
     img_array = image.img_to_array(img) / 255.0
     img_array = np.expand_dims(img_array, axis=0)
     return img_array
 
+def store_upload(data: bytes, digest: str, ext: str):
+    """Queue the upload for storing on a background thread; returns its eventual paths.
+
+    Identical uploads share one stored copy. Returns ``(original_path,
+    thumbnail_path)``, or ``(None, None)`` when SAVE_UPLOADS is disabled.
+    """
+    if not app.config["SAVE_UPLOADS"]:
+        return None, None
+    paths = upload_store.paths(digest, ext)
+    original_path = paths[0]
+    if original_path in pending_upload_writes:
+        return paths
+    if os.path.exists(original_path):
+        upload_store.touch(digest, ext)
+        return paths
+    future = upload_writer.submit(upload_store.save, data, digest, ext)
+    for path in paths:
+        pending_upload_writes[path] = future
+    future.add_done_callback(lambda _: [pending_upload_writes.pop(path, None) for path in paths])
+    return paths
+
+def upload_url(file_path):
+    return "/" + file_path.replace("\\", "/") if file_path else None
+
 def interpret_prediction(preds: np.ndarray) -> bool:
     preds = np.array(preds)
     if preds.ndim == 1:
@@ -320,14 +650,152 @@ def interpret_prediction(preds: np.ndarray) -> bool:
         return int(np.argmax(preds[0])) == 1
     return False
 
-# Simulated Blockchain Reward
-def send_reward_to_user(user_address: str, points: int = 10):
-    """
-    Simulate sending reward. Returns a dummy tx hash.
+# Simulated Blockchain Reward, settled in batches off the request path
+reward_settler = rewards.RewardSettler(
+    rewards.SimulatedRewardBackend(latency_ms=app.config["REWARD_BACKEND_LATENCY_MS"],
+                                   failure_rate=app.config["REWARD_BACKEND_FAILURE_RATE"]),
+    interval_s=app.config["REWARD_SETTLE_INTERVAL_S"],
+    max_attempts=app.config["REWARD_MAX_ATTEMPTS"])
+
+def model_ready():
+    return inference_pool.stats()["ready"] > 0 if inference_pool is not None else model_loader.ready
+
+# Component histograms and counters, read when /metrics is scraped (no DB queries)
+metrics_registry.register_histogram("sortify_batch_size", "Images per inference batch",
+                                    batcher.batch_size_hist, scale=1)
+metrics_registry.register_histogram("sortify_batch_queue_wait_seconds", "Time images wait for their batch",
+                                    batcher.queue_wait_ms_hist)
+metrics_registry.register_histogram("sortify_batch_inference_seconds", "Forward pass time per batch",
+                                    batcher.inference_ms_hist)
+metrics_registry.register_histogram("sortify_upload_write_seconds", "Background upload transcode and write time",
+                                    upload_store.write_ms_hist)
+metrics_registry.register_histogram("sortify_activity_flush_seconds", "Activity log flush transaction time",
+                                    activity_log.flush_ms_hist)
+metrics_registry.register_histogram("sortify_activity_flush_rows", "Rows per activity log flush",
+                                    activity_log.flush_rows_hist, scale=1)
+metrics_registry.register_histogram("sortify_reward_payout_seconds", "Reward backend call time per payout",
+                                    reward_settler.payout_ms_hist)
+metrics_registry.register_histogram("sortify_prediction_confidence",
+                                    "Calibrated confidence of single-pass predictions",
+                                    confidence_estimator.confidence_hist, scale=1)
+metrics_registry.counter_fn("sortify_predictions_total", "Model predictions by path (tta = escalated)",
+                            labels=("path",),
+                            fn=lambda: {("single",): confidence_estimator.predictions - confidence_estimator.escalated,
+                                        ("tta",): confidence_estimator.escalated})
+metrics_registry.counter_fn("sortify_tta_label_flips_total",
+                            "Escalated predictions whose label the second pass changed",
+                            lambda: confidence_estimator.flipped)
+if near_duplicate_index is not None:
+    metrics_registry.gauge("sortify_near_duplicate_entries", "Upload hashes in the near-duplicate index",
+                           lambda: len(near_duplicate_index))
+    metrics_registry.counter_fn("sortify_near_duplicate_lookups_total", "Near-duplicate index lookups by outcome",
+                                labels=("outcome",),
+                                fn=lambda: {("miss",): near_duplicate_index.lookups - near_duplicate_index.matches,
+                                            ("match",): near_duplicate_index.matches - near_duplicate_index.reused,
+                                            ("reused",): near_duplicate_index.reused})
+    metrics_registry.counter_fn("sortify_near_duplicate_flagged_total",
+                                "Uploads past the per-user near-duplicate repeat limit",
+                                lambda: near_duplicate_index.flagged)
+metrics_registry.gauge("sortify_model_loaded", "1 once the model can serve predictions", model_ready)
+metrics_registry.gauge("sortify_batch_queue_depth", "Images waiting for a batch",
+                       lambda: batcher.stats()["queue_depth"])
+metrics_registry.gauge("sortify_activity_queue_depth", "Activity rows waiting for the writer",
+                       lambda: activity_log.stats()["queue_depth"])
+metrics_registry.counter_fn("sortify_cache_hits_total", "Cache hits", labels=("cache",),
+                            fn=lambda: {("prediction",): prediction_cache.hits, ("dashboard",): dashboard_cache.hits})
+metrics_registry.counter_fn("sortify_cache_misses_total", "Cache misses", labels=("cache",),
+                            fn=lambda: {("prediction",): prediction_cache.misses,
+                                        ("dashboard",): dashboard_cache.misses})
+metrics_registry.counter_fn("sortify_reward_payouts_total", "Reward payouts by outcome", labels=("outcome",),
+                            fn=lambda: {("settled",): reward_settler.payouts_settled,
+                                        ("failed",): reward_settler.payouts_failed})
+metrics_registry.counter_fn("sortify_db_connections_opened_total", "SQLite connections opened",
+                            lambda: db.stats["connections_opened"])
+metrics_registry.gauge("sortify_directory_version", "Recycler directory version being served",
+                       lambda: directory.stats()["version"])
+metrics_registry.gauge("sortify_profiler_enabled", "1 while the stack sampler runs",
+                       lambda: stack_sampler.enabled)
+metrics_registry.counter_fn("sortify_profiler_samples_total", "Stack samples taken",
+                            lambda: stack_sampler.samples)
+
+# One-time startup work, deferred to the first request so importing the app
+# (workers, CLI, tests) stays cheap
+_startup_lock = threading.Lock()
+_started = threading.Event()
+startup_timings = {}
+
+def ensure_started():
+    global inference_pool
+    if _started.is_set():
+        return
+    with _startup_lock:
+        if _started.is_set():
+            return
+        started = time.perf_counter()
+        init_db()
+        startup_timings["init_db_s"] = round(time.perf_counter() - started, 3)
+        reward_settler.start()
+        upload_store.start_sweeper()
+        directory.refresh()
+        directory.start()
+        if near_duplicate_index is not None:
+            loading = time.perf_counter()
+            near_duplicates.load_index(near_duplicate_index)
+            startup_timings["near_duplicate_index_s"] = round(time.perf_counter() - loading, 3)
+        if app.config["INFERENCE_WORKERS"] > 0:
+            inference_pool = InferencePool(app.config["INFERENCE_BACKEND"], MODEL_PATH,
+                                           workers=app.config["INFERENCE_WORKERS"],
+                                           max_batch=max(app.config["BATCH_MAX_SIZE"], 16),
+                                           cores_per_worker=app.config["INFERENCE_WORKER_CORES"],
+                                           timeout_s=app.config["INFERENCE_TIMEOUT_S"])
+            inference_pool.start()
+            atexit.register(inference_pool.close)
+            metrics_registry.register_histogram("sortify_worker_inference_seconds",
+                                                "Forward pass time inside the worker processes",
+                                                inference_pool.inference_ms_hist)
+            metrics_registry.register_histogram("sortify_worker_lease_wait_seconds",
+                                                "Time batches wait for a free worker",
+                                                inference_pool.lease_wait_ms_hist)
+        elif app.config["MODEL_WARMUP"] == "background":
+            model_loader.start_background()
+        if app.config["PROFILER_ENABLED"]:
+            stack_sampler.start()
+        startup_timings["first_request_after_import_s"] = round(started - PROCESS_STARTED, 3)
+        _started.set()
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.before_request
+def run_startup():
+    ensure_started()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get("request_started")
+    if started is not None:
+        # Labelled by route pattern, not path, so IDs in URLs don't multiply the series
+        route = request.url_rule.rule if request.url_rule is not None else "[unmatched]"
+        observe_request(route, request.method, response.status_code, (time.perf_counter() - started) * 1000.0)
+    return response
+
+def queue_reward_for_user(user_id, user_address: str, points: int = 10, client_key=None, path="/predict",
+                          activity=()):
+    """Record a pending reward for the settler; returns ``(reward_id, created)``.
+
+    ``client_key`` is the request's Idempotency-Key header: it makes retried
+    requests to ``path`` map to the same reward instead of paying twice, and
+    ``created`` is False for such a retry. The ``activity`` rows that earned
+    the reward are committed with it.
     """
-    if not user_address:
-        return "Error: Invalid wallet"
-    return f"SIMULATED_TX_HASH_{uuid.uuid4().hex[:8]}"
+    key = None
+    if client_key:
+        key = hashlib.sha256(f"{path}:{user_id}:{client_key}".encode()).hexdigest()[:32]
+    reward_id, created = rewards.record_reward(user_id, user_address, points, key, activity)
+    if created and activity:
+        dashboard_cache.invalidate({row[0] for row in activity})
+    return reward_id, created
 
 # Routes
 @app.route("/")
@@ -370,11 +838,7 @@ def handle_login():
             return redirect(url_for('login_page'))
         
         # Check user credentials
-        conn = sqlite3.connect('users.db')
-        c = conn.cursor()
-        c.execute("SELECT id, name, password FROM users WHERE email = ?", (email,))
-        user = c.fetchone()
-        conn.close()
+        user = db.query_one("SELECT id, name, password FROM users WHERE email = ?", (email,))
         
         if user and check_password_hash(user[2], password):
             session['user_id'] = user[0]
@@ -417,21 +881,16 @@ def handle_signup():
             return redirect(url_for('signup_page'))
         
         # Check if user already exists
-        conn = sqlite3.connect('users.db')
-        c = conn.cursor()
-        c.execute("SELECT id FROM users WHERE email = ?", (email,))
-        if c.fetchone():
-            conn.close()
+        if db.query_one("SELECT id FROM users WHERE email = ?", (email,)):
             flash("Email already registered", "error")
             return redirect(url_for('signup_page'))
             
         # Create new user
         hashed_password = generate_password_hash(password)
-        c.execute("INSERT INTO users (name, email, password, wallet_address) VALUES (?, ?, ?, ?)",
-                 (name, email, hashed_password, wallet_address))
-        conn.commit()
-        user_id = c.lastrowid
-        conn.close()
+        with db.transaction() as c:
+            c.execute("INSERT INTO users (name, email, password, wallet_address) VALUES (?, ?, ?, ?)",
+                      (name, email, hashed_password, wallet_address))
+            user_id = c.lastrowid
         
         # Log user in
         session['user_id'] = user_id
@@ -448,11 +907,8 @@ def handle_signup():
         if "no such column: wallet_address" in str(e):
             # Database schema issue - try to fix it
             try:
-                conn = sqlite3.connect('users.db')
-                c = conn.cursor()
-                c.execute("ALTER TABLE users ADD COLUMN wallet_address TEXT")
-                conn.commit()
-                conn.close()
+                with db.transaction() as c:
+                    c.execute("ALTER TABLE users ADD COLUMN wallet_address TEXT")
                 flash("Database updated. Please try signing up again.", "info")
                 return redirect(url_for('signup_page'))
             except:
@@ -485,33 +941,55 @@ def upload_page():
 @login_required
 def dashboard():
     """User dashboard page"""
+    return render_template("dashboard.html", **dashboard_context(session['user_id'], session.get('user_name')))
+
+def dashboard_context(user_id, user_name):
+    """Template variables for the dashboard (shared with the ASGI app)"""
+    return {"user_name": user_name, **dashboard_cache.get(user_id).data}
+
+def dashboard_data(user_id):
+    """The cached part of the dashboard; reloaded after the user's next activity write"""
     # Get user's activity history
-    conn = sqlite3.connect('users.db')
-    c = conn.cursor()
+    c = db.get_db().cursor()
     c.execute('''SELECT activity_type, activity_details, points_earned, created_at 
                  FROM user_activity 
                  WHERE user_id = ? 
                  ORDER BY created_at DESC 
-                 LIMIT 20''', (session['user_id'],))
-    activities = c.fetchall()
+                 LIMIT 20''', (user_id,))
+    activities = [list(row) for row in c.fetchall()]
     
     # Get total points
-    c.execute('''SELECT SUM(points_earned) FROM user_activity WHERE user_id = ?''', 
-              (session['user_id'],))
-    total_points = c.fetchone()[0] or 0
+    total_points = points_ledger.get_balance(user_id)
     
     # Get user's wallet address
-    c.execute('''SELECT wallet_address FROM users WHERE id = ?''', (session['user_id'],))
+    c.execute('''SELECT wallet_address FROM users WHERE id = ?''', (user_id,))
     wallet_result = c.fetchone()
     wallet_address = wallet_result[0] if wallet_result else "Not set"
     
-    conn.close()
-    
-    return render_template("dashboard.html", 
-                         user_name=session.get('user_name'),
-                         activities=activities,
-                         total_points=total_points,
-                         wallet_address=wallet_address)
+    return {"activities": activities,
+            "total_points": total_points,
+            "wallet_address": wallet_address}
+
+@app.route("/api/dashboard")
+@login_required
+def dashboard_api():
+    """Dashboard data as JSON; polls with If-None-Match get a 304 until it changes"""
+    entry = dashboard_cache.get(session['user_id'])
+    if request.if_none_match.contains(entry.etag):
+        response = app.response_class(status=304)
+    else:
+        response = jsonify(dashboard_json(entry.data))
+    response.set_etag(entry.etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+def dashboard_json(data):
+    return {
+        "activities": [{"type": activity_type, "details": details, "points": points, "created_at": created_at}
+                       for activity_type, details, points, created_at in data["activities"]],
+        "total_points": data["total_points"],
+        "wallet_address": data["wallet_address"],
+    }
 
 # Add these routes to your app.py
 @app.route("/api/user/update_profile", methods=["POST"])
@@ -526,31 +1004,24 @@ def update_user_profile():
         if not new_name and not new_password:
             return jsonify({'success': False, 'error': 'No changes provided'}), 400
         
-        conn = sqlite3.connect('users.db')
-        c = conn.cursor()
-        
         # Get current user data
-        c.execute("SELECT name, password FROM users WHERE id = ?", (session['user_id'],))
-        current_user = c.fetchone()
+        current_user = db.query_one("SELECT name, password FROM users WHERE id = ?", (session['user_id'],))
         
         if not current_user:
-            conn.close()
             return jsonify({'success': False, 'error': 'User not found'}), 404
         
         current_name, current_password_hash = current_user
         
-        # Update name if provided and different
-        if new_name and new_name != current_name:
-            c.execute("UPDATE users SET name = ? WHERE id = ?", (new_name, session['user_id']))
-            session['user_name'] = new_name  # Update session
-        
-        # Update password if provided
-        if new_password:
-            hashed_password = generate_password_hash(new_password)
-            c.execute("UPDATE users SET password = ? WHERE id = ?", (hashed_password, session['user_id']))
-        
-        conn.commit()
-        conn.close()
+        with db.transaction() as c:
+            # Update name if provided and different
+            if new_name and new_name != current_name:
+                c.execute("UPDATE users SET name = ? WHERE id = ?", (new_name, session['user_id']))
+                session['user_name'] = new_name  # Update session
+            
+            # Update password if provided
+            if new_password:
+                hashed_password = generate_password_hash(new_password)
+                c.execute("UPDATE users SET password = ? WHERE id = ?", (hashed_password, session['user_id']))
         
         # Log the activity
         changes = []
@@ -592,215 +1063,806 @@ def recycling_centers_page():
 def nearby_recyclers():
     """Get recyclers near the user's location"""
     try:
-        # Get user's location from request
-        user_lat = request.args.get('lat', type=float)
-        user_lon = request.args.get('lon', type=float)
-        
-        # If no coordinates provided, use a default location
-        if user_lat is None or user_lon is None:
-            # Try to get from user's profile if stored
-            conn = sqlite3.connect('users.db')
-            c = conn.cursor()
-            c.execute("SELECT latitude, longitude FROM users WHERE id = ?", (session['user_id'],))
-            location = c.fetchone()
-            conn.close()
-            
-            if location and location[0] and location[1]:
-                user_lat, user_lon = location[0], location[1]
-            else:
-                # Default to Bangalore coordinates
-                user_lat, user_lon = 12.9716, 77.5946
-        
-        max_distance = request.args.get('max_distance', 50, type=float)  # km
-        recyclers = get_nearby_recyclers(user_lat, user_lon, max_distance)
-        
-        return jsonify({
-            'success': True,
-            'user_location': {'lat': user_lat, 'lon': user_lon},
-            'recyclers': recyclers,
-            'count': len(recyclers)
-        })
-        
+        return jsonify(nearby_recyclers_payload(session['user_id'], request.args))
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def resolve_user_location(user_id, args):
+    """(lat, lon) from the query string, else the user's profile, else a default"""
+    # Get user's location from request
+    user_lat = args.get('lat', type=float)
+    user_lon = args.get('lon', type=float)
+    
+    # If no coordinates provided, use a default location
+    if user_lat is None or user_lon is None:
+        # Try to get from user's profile if stored
+        with stage("geo_location"):
+            location = db.query_one("SELECT latitude, longitude FROM users WHERE id = ?", (user_id,))
+        
+        if location and location[0] and location[1]:
+            user_lat, user_lon = location[0], location[1]
+        else:
+            # Default to Bangalore coordinates
+            user_lat, user_lon = 12.9716, 77.5946
+    return user_lat, user_lon
+
+def nearby_recyclers_payload(user_id, args):
+    user_lat, user_lon = resolve_user_location(user_id, args)
+    max_distance = args.get('max_distance', 50, type=float)  # km
+    recyclers = get_nearby_recyclers(user_lat, user_lon, max_distance, query=args.get('q', ''))
+    
+    return {
+        'success': True,
+        'user_location': {'lat': user_lat, 'lon': user_lon},
+        'recyclers': recyclers,
+        'count': len(recyclers)
+    }
+
 @app.route("/api/recycling-centers/nearby", methods=["GET"])
 @login_required
 def nearby_recycling_centers():
     """Get recycling centers near the user's location"""
     try:
-        # Get user's location from request
-        user_lat = request.args.get('lat', type=float)
-        user_lon = request.args.get('lon', type=float)
-        category = request.args.get('category', '')
-        
-        # If no coordinates provided, use a default location
-        if user_lat is None or user_lon is None:
-            # Try to get from user's profile if stored
-            conn = sqlite3.connect('users.db')
-            c = conn.cursor()
-            c.execute("SELECT latitude, longitude FROM users WHERE id = ?", (session['user_id'],))
-            location = c.fetchone()
-            conn.close()
-            
-            if location and location[0] and location[1]:
-                user_lat, user_lon = location[0], location[1]
-            else:
-                # Default to Bangalore coordinates
-                user_lat, user_lon = 12.9716, 77.5946
-        
-        max_distance = request.args.get('max_distance', 20, type=float)  # km
-        centers = get_nearby_recycling_centers(user_lat, user_lon, max_distance, category)
-        
-        return jsonify({
-            'success': True,
-            'user_location': {'lat': user_lat, 'lon': user_lon},
-            'centers': centers,
-            'count': len(centers)
-        })
-        
+        return jsonify(nearby_centers_payload(session['user_id'], request.args))
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def nearby_centers_payload(user_id, args):
+    user_lat, user_lon = resolve_user_location(user_id, args)
+    category = args.get('category', '')
+    max_distance = args.get('max_distance', 20, type=float)  # km
+    materials = args.getlist('materials')  # repeated and/or comma-separated, e.g. materials=plastic,glass
+    centers = get_nearby_recycling_centers(user_lat, user_lon, max_distance, category,
+                                           materials=",".join(materials), query=args.get('q', ''))
+    
+    return {
+        'success': True,
+        'user_location': {'lat': user_lat, 'lon': user_lon},
+        'centers': centers,
+        'count': len(centers)
+    }
+
 @app.route("/api/recyclers/contact", methods=["POST"])
 @login_required
 def contact_recycler():
     """Handle recycler contact form submission"""
     try:
-        data = request.get_json()
-        recycler_id = data.get('recycler_id')
-        message = data.get('message', '')
-        
-        # Get user info
-        conn = sqlite3.connect('users.db')
-        c = conn.cursor()
-        c.execute("SELECT name, email FROM users WHERE id = ?", (session['user_id'],))
-        user = c.fetchone()
-        
-        # Get recycler info
-        c.execute("SELECT name, email FROM recyclers WHERE id = ?", (recycler_id,))
-        recycler = c.fetchone()
-        
-        if not user or not recycler:
-            return jsonify({'success': False, 'error': 'User or recycler not found'}), 404
-        
-        user_name, user_email = user
-        recycler_name, recycler_email = recycler
-        
-        # Here you would typically:
-        # 1. Save the contact request to the database
-        # 2. Send an email to the recycler
-        # 3. Send a confirmation email to the user
-        
-        # For now, we'll just log it
-        print(f"Contact request from {user_name} ({user_email}) to {recycler_name} ({recycler_email}): {message}")
-        
-        # Log the activity
-        log_activity(session['user_id'], 'recycler_contact', 
-                    f"Contacted {recycler_name} about recycling", 0)
-        
-        conn.close()
-        
-        return jsonify({
-            'success': True,
-            'message': 'Contact request sent successfully'
-        })
-        
+        payload, status = contact_recycler_response(session['user_id'], request.get_json())
+        return jsonify(payload), status
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def contact_recycler_response(user_id, data):
+    """``(payload, status)`` for a contact request (shared with the ASGI app)"""
+    recycler_id = data.get('recycler_id')
+    message = data.get('message', '')
+    
+    # Get user info
+    user = db.query_one("SELECT name, email FROM users WHERE id = ?", (user_id,))
+    
+    # Get recycler info
+    recycler = directory.snapshot.recyclers.get(recycler_id)
+    
+    if not user or not recycler:
+        return {'success': False, 'error': 'User or recycler not found'}, 404
+        
+    user_name, user_email = user
+    recycler_name, recycler_email = recycler.name, recycler.email
+    
+    # Here you would typically:
+    # 1. Save the contact request to the database
+    # 2. Send an email to the recycler
+    # 3. Send a confirmation email to the user
+    
+    # For now, we'll just log it
+    print(f"Contact request from {user_name} ({user_email}) to {recycler_name} ({recycler_email}): {message}")
+    
+    # Log the activity
+    log_activity(user_id, 'recycler_contact', 
+                f"Contacted {recycler_name} about recycling", 0)
+    
+    return {
+        'success': True,
+        'message': 'Contact request sent successfully'
+    }, 200
+
+@app.teardown_appcontext
+def release_db(exception=None):
+    db.release()
+
 @app.route("/health")
 def health():
     return jsonify({
-        "model_loaded": model_loaded,
-        "model_error": model_error,
+        "model_loaded": model_ready(),
+        "model_error": model_error(),
+        "model": model_loader.status() if inference_pool is None else None,
+        "inference_pool": inference_pool.stats() if inference_pool is not None else None,
+        "startup": startup_timings,
         "blockchain_connected": False,
-        "contract_loaded": False
+        "contract_loaded": False,
+        "database": db.stats,
+        "activity_log": activity_log.stats(),
+        "dashboard_cache": dashboard_cache.stats(),
+        "directory": directory.stats(),
+        "rewards": reward_settler.stats(),
+        "uploads": upload_store.stats(),
+        "profiler": stack_sampler.stats()
     })
 
+@app.route("/metrics")
+def metrics():
+    """Prometheus text exposition of the request, stage and component metrics"""
+    return Response(metrics_registry.render(), mimetype="text/plain; version=0.0.4")
+
+def bearer_token_valid(token):
+    return hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}")
+
+@app.route("/debug/profiler", methods=["GET", "POST"])
+def profiler_control():
+    """GET: collapsed stacks (flamegraph.pl / speedscope input). POST: switch the sampler on or off"""
+    if not app.config["PROFILER_TOKEN"]:
+        return jsonify({"error": "Profiler is disabled"}), 404
+    if not bearer_token_valid(app.config["PROFILER_TOKEN"]):
+        return jsonify({"error": "Invalid profiler token"}), 401
+    if request.method == "GET":
+        return Response(stack_sampler.collapsed(request.args.get("limit", type=int)), mimetype="text/plain")
+    data = request.get_json(silent=True) or {}
+    if data.get("reset"):
+        stack_sampler.reset()
+    if "enabled" in data:
+        if data["enabled"]:
+            try:
+                stack_sampler.start(data.get("interval_ms"))
+            except (TypeError, ValueError):
+                return jsonify({"error": "interval_ms must be a number"}), 400
+        else:
+            stack_sampler.stop()
+    return jsonify({"success": True, "profiler": stack_sampler.stats()})
+
+@app.route("/api/inference/stats")
+def inference_stats():
+    """Micro-batcher histograms, prediction cache counters, test-time augmentation and near-duplicate rates"""
+    stats = batcher.stats()
+    stats["prediction_cache"] = prediction_cache.stats()
+    stats["confidence"] = confidence_estimator.stats()
+    stats["near_duplicates"] = near_duplicate_index.stats() if near_duplicate_index is not None else None
+    return jsonify(stats)
+
 @app.route("/predict", methods=["POST"])
 @login_required
 def predict():
-    if not model_loaded:
-        return jsonify({"error": f"Model not loaded: {model_error}"}), 500
+    if model_error() is not None:
+        return jsonify({"error": f"Model not loaded: {model_error()}"}), 500
 
-    if "file" not in request.files:
-        return jsonify({"error": "No file uploaded"}), 400
-
-    file = request.files["file"]
-    if file.filename == "":
-        return jsonify({"error": "Empty file"}), 400
-    if not allowed_file(file.filename):
-        return jsonify({"error": f"Unsupported file type. Allowed: {', '.join(sorted(ALLOWED_EXTENSIONS))}"}), 400
+    # Stream the file part, rejecting bad uploads from their first bytes
+    try:
+        with stage("upload_read"):
+            upload = read_multipart_file(request.stream, request.content_type, "file",
+                                         app.config["UPLOAD_MAX_BYTES"], app.config["UPLOAD_MAX_PIXELS"],
+                                         filename_filter=check_upload_filename)
+    except UploadRejected as e:
+        return jsonify({"error": str(e)}), e.status
 
-    # Save file
-    filename = secure_filename(file.filename)
-    ext = os.path.splitext(filename)[1].lower()
-    unique_name = f"{uuid.uuid4().hex}{ext}"
-    file_path = os.path.join(app.config["UPLOAD_FOLDER"], unique_name)
-    file.save(file_path)
+    # Save file under its content hash so repeat uploads are stored once
+    with stage("upload_save"):
+        paths = store_upload(upload.data, upload.digest, upload.extension)
 
     try:
-        img_array = preprocess(file_path)
-        preds = model.predict(img_array, verbose=0)
+        # Repeat images skip preprocessing and inference entirely
+        with stage("cache_lookup"):
+            preds = prediction_cache.get(upload.digest)
+        cached = preds is not None
+        escalated = None
+        user_id = session['user_id']
+        if cached:
+            with stage("near_duplicate"):
+                phash, match = near_duplicate_lookup(upload.digest, None, user_id)
+            source = "cache"
+        else:
+            with stage("preprocess"):
+                img_array = preprocess_bytes(upload.data, out=thread_buffer(1), draft=app.config["JPEG_DRAFT_DECODE"])
+            # A close enough match of an earlier upload lends its label instead of a forward pass
+            with stage("near_duplicate"):
+                phash, match = near_duplicate_lookup(upload.digest, img_array, user_id)
+                preds = reusable_prediction(match)
+            source = "near_duplicate" if preds is not None else "model"
+            if preds is None:
+                with stage("inference"):
+                    preds = batcher.submit(img_array)
+                # Low-confidence images get a second pass: their augmented views share one batch
+                escalated = confidence_estimator.escalate(preds)
+                if escalated:
+                    with stage("tta"):
+                        view_preds = batcher.submit_many(confidence_estimator.augmented_views(img_array))
+                        preds = confidence_estimator.refine(preds, view_preds)
+                # Only model output is cached; a reused label is not this upload's prediction
+                prediction_cache.put(upload.digest, preds)
+        near_duplicate = record_upload_hash(upload.digest, phash, preds, user_id, match, source)
+        return jsonify(prediction_response(user_id, upload.filename, preds, cached, paths,
+                                           request.headers.get("Idempotency-Key"), escalated, near_duplicate))
+    except Exception as e:
+        return jsonify({"error": f"Inference failed: {str(e)}"}), 500
+
+def prediction_response(user_id, filename, preds, cached, paths, client_key=None, escalated=None,
+                        near_duplicate=None):
+    """Record the reward and activity for one classified upload; returns the /predict payload.
+
+    ``escalated`` says whether the image needed the augmented second pass (None when cached);
+    ``near_duplicate`` describes the closest earlier upload, if one was within range. Uploads
+    it flags as repeats earn no points.
+    """
+    filename = secure_filename(filename)
+    file_path, thumbnail_path = paths
+    with stage("interpret"):
         recyclable = interpret_prediction(preds)
-        label = "recyclable" if recyclable else "non-recyclable"
+        probability = confidence_estimator.probability(preds)
+    label = "recyclable" if recyclable else "non-recyclable"
 
-        # Get user's wallet address from database
-        conn = sqlite3.connect('users.db')
-        c = conn.cursor()
-        c.execute("SELECT wallet_address FROM users WHERE id = ?", (session['user_id'],))
+    # Get user's wallet address from database
+    with stage("db_read"):
+        c = db.get_db().cursor()
+        c.execute("SELECT wallet_address FROM users WHERE id = ?", (user_id,))
         wallet_result = c.fetchone()
-        user_wallet = wallet_result[0] if wallet_result and wallet_result[0] else "DEMO_WALLET"
-        
-        reward_tx = None
-        points_earned = 0
-        
-        if recyclable:
-            reward_tx = send_reward_to_user(user_wallet)
-            points_earned = 10
-            # Log recycling activity with points
-            log_activity(session['user_id'], "recycling", 
-                        f"Recycled item: {filename}", points_earned)
-        else:
-            # Log non-recyclable activity
-            log_activity(session['user_id'], "scan", 
+    user_wallet = wallet_result[0] if wallet_result and wallet_result[0] else "DEMO_WALLET"
+    
+    reward_id = None
+    points_earned = 0
+    
+    if recyclable and repeat_flagged(near_duplicate):
+        with stage("log_activity"):
+            log_activity(user_id, "scan", f"Repeat upload, no points: {filename}")
+    elif recyclable:
+        points_earned = 10
+        # The recycling activity and its points are written with the reward, once per Idempotency-Key
+        with stage("reward"):
+            reward_id, _ = queue_reward_for_user(user_id, user_wallet, points_earned, client_key,
+                                                 activity=[(user_id, "recycling", f"Recycled item: {filename}",
+                                                            points_earned)])
+    else:
+        # Log non-recyclable activity
+        with stage("log_activity"):
+            log_activity(user_id, "scan", 
                         f"Scanned non-recyclable item: {filename}")
-        
-        # Get recyclers from database instead of hardcoded list
-        c.execute("SELECT id, name, email FROM recyclers WHERE accepts_recyclables = TRUE LIMIT 5")
-        db_recyclers = [{"id": row[0], "name": row[1], "contact": row[2]} for row in c.fetchall()]
-        
-        conn.close()
+    
+    # Get recyclers from the directory instead of a hardcoded list
+    with stage("recyclers"):
+        db_recyclers = [{"id": recycler.id, "name": recycler.name, "contact": recycler.email}
+                        for recycler in directory.snapshot.accepting_recyclers(5)]
 
-        return jsonify({
-            "prediction": label,
-            "file_path": "/" + file_path.replace("\\", "/"),
-            "reward_tx": reward_tx,
-            "points_earned": points_earned,
-            "recyclers": db_recyclers if recyclable else []
+    return {
+        "prediction": label,
+        "probability": round(probability, 4),  # calibrated P(recyclable)
+        "confidence": round(max(probability, 1.0 - probability), 4),
+        "tta": escalated,
+        "near_duplicate": near_duplicate,
+        "file_path": upload_url(file_path),
+        "thumbnail_url": upload_url(thumbnail_path),
+        "reward_tx": None,  # known once the settler pays the reward out
+        "reward_id": reward_id,
+        "reward_status": rewards.PENDING if reward_id else None,
+        "points_earned": points_earned,
+        "cached": cached,
+        "recyclers": db_recyclers if recyclable else []
+    }
+
+def check_upload_filename(filename):
+    if not allowed_file(filename):
+        raise UploadRejected(f"Unsupported file type. Allowed: {', '.join(sorted(ALLOWED_EXTENSIONS))}", 400)
+
+@app.errorhandler(413)
+def request_too_large(error):
+    return jsonify({"error": f"Request body exceeds {app.config['MAX_CONTENT_LENGTH']} bytes"}), 413
+
+def read_batch_uploads():
+    """Collect (filename, bytes) pairs from multi-file fields and/or zip archives"""
+    max_files = app.config["BATCH_UPLOAD_MAX_FILES"]
+    max_bytes = app.config["BATCH_UPLOAD_MAX_FILE_BYTES"]
+    uploads = []
+
+    for file in request.files.getlist("files") + request.files.getlist("archive"):
+        if not file or file.filename == "":
+            continue
+        filename = secure_filename(file.filename)
+        if filename.lower().endswith(".zip"):
+            try:
+                with zipfile.ZipFile(io.BytesIO(file.read())) as archive:
+                    for info in archive.infolist():
+                        member = secure_filename(os.path.basename(info.filename))
+                        if info.is_dir() or not allowed_file(member):
+                            continue
+                        if info.file_size > max_bytes:
+                            raise ValueError(f"{member} exceeds {max_bytes} bytes")
+                        uploads.append((member, archive.read(info)))
+                        if len(uploads) > max_files:
+                            raise ValueError(f"Too many images (max {max_files})")
+            except zipfile.BadZipFile:
+                raise ValueError(f"{filename} is not a valid zip archive")
+        elif allowed_file(filename):
+            uploads.append((filename, file.read()))
+        else:
+            raise ValueError(f"Unsupported file type for {filename}. Allowed: {', '.join(sorted(ALLOWED_EXTENSIONS))}, zip")
+        if len(uploads) > max_files:
+            raise ValueError(f"Too many images (max {max_files})")
+    return uploads
+
+@app.route("/api/predict/batch", methods=["POST"])
+@login_required
+def predict_batch():
+    """Classify many images (multi-file upload and/or zip archive) in one request"""
+    if model_error() is not None:
+        return jsonify({"error": f"Model not loaded: {model_error()}"}), 500
+
+    try:
+        uploads = read_batch_uploads()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not uploads:
+        return jsonify({"error": "No images uploaded"}), 400
+
+    items = []
+    for filename, data in uploads:
+        try:
+            upload = validate_image_bytes(filename, data, app.config["BATCH_UPLOAD_MAX_FILE_BYTES"],
+                                          app.config["UPLOAD_MAX_PIXELS"])
+        except UploadRejected as e:
+            items.append({"filename": filename, "error": str(e)})
+            continue
+        items.append({
+            "filename": filename,
+            "digest": upload.digest,
+            "paths": store_upload(data, upload.digest, upload.extension),
+            "preds": prediction_cache.get(upload.digest),
+            "data": data
         })
+        items[-1]["cached"] = items[-1]["preds"] is not None
+
+    # Decode cache misses in parallel, each straight into its slot of one batch buffer
+    misses = [item for item in items if "error" not in item and item["preds"] is None]
+    batch = thread_buffer(len(misses)) if misses else None
+    draft = app.config["JPEG_DRAFT_DECODE"]
+    futures = [preprocess_executor.submit(preprocess_bytes, item["data"], batch[i:i + 1], draft)
+               for i, item in enumerate(misses)]
+    decoded = []
+    for i, (item, future) in enumerate(zip(misses, futures)):
+        try:
+            future.result()
+            decoded.append(i)
+        except Exception as e:
+            item["error"] = f"Could not process image: {str(e)}"
+
+    # Near-duplicates of earlier uploads reuse their label; the rest share one forward pass
+    user_id = session['user_id']
+    infer = []
+    with stage("near_duplicate"):
+        for item in items:
+            if item.get("cached"):
+                item["phash"], item["match"] = near_duplicate_lookup(item["digest"], None, user_id)
+                item["source"] = "cache"
+        for i in decoded:
+            item = misses[i]
+            item["phash"], item["match"] = near_duplicate_lookup(item["digest"], batch[i], user_id)
+            item["preds"] = reusable_prediction(item["match"])
+            item["source"] = "model" if item["preds"] is None else "near_duplicate"
+            if item["preds"] is None:
+                infer.append(i)
+
+    try:
+        if infer:
+            preds = np.asarray(run_inference(batch[infer] if len(infer) < len(misses) else batch))
+            escalated = []
+            for row, i in enumerate(infer):
+                item = misses[i]
+                item["preds"] = preds[row:row + 1]
+                item["escalated"] = confidence_estimator.escalate(item["preds"])
+                if item["escalated"]:
+                    escalated.append((item, batch[i]))
+            # Low-confidence images get a second pass: all of their augmented views in one forward call
+            if escalated:
+                with stage("tta"):
+                    views = len(confidence_estimator.views)
+                    view_preds = np.asarray(run_inference(np.concatenate(
+                        [confidence_estimator.augmented_views(image) for _, image in escalated])))
+                    for n, (item, _) in enumerate(escalated):
+                        item["preds"] = confidence_estimator.refine(item["preds"],
+                                                                    view_preds[n * views:(n + 1) * views])
+            for i in infer:
+                prediction_cache.put(misses[i]["digest"], misses[i]["preds"])
     except Exception as e:
         return jsonify({"error": f"Inference failed: {str(e)}"}), 500
 
+    results = []
+    activity_rows = []
+    points_total = 0
+    for item in items:
+        if "error" in item:
+            results.append({"filename": item["filename"], "error": item["error"]})
+            continue
+        recyclable = bool(interpret_prediction(item["preds"]))
+        probability = confidence_estimator.probability(item["preds"])
+        near_duplicate = record_upload_hash(item["digest"], item["phash"], item["preds"], user_id,
+                                            item["match"], item["source"])
+        points_earned = 10 if recyclable and not repeat_flagged(near_duplicate) else 0
+        points_total += points_earned
+        if points_earned:
+            activity_rows.append((session['user_id'], "recycling",
+                                  f"Recycled item: {item['filename']}", points_earned))
+        elif recyclable:
+            activity_rows.append((session['user_id'], "scan",
+                                  f"Repeat upload, no points: {item['filename']}", 0))
+        else:
+            activity_rows.append((session['user_id'], "scan",
+                                  f"Scanned non-recyclable item: {item['filename']}", 0))
+        results.append({
+            "filename": item["filename"],
+            "prediction": "recyclable" if recyclable else "non-recyclable",
+            "probability": round(probability, 4),
+            "confidence": round(max(probability, 1.0 - probability), 4),
+            "tta": item.get("escalated"),
+            "near_duplicate": near_duplicate,
+            "file_path": upload_url(item["paths"][0]),
+            "thumbnail_url": upload_url(item["paths"][1]),
+            "points_earned": points_earned,
+            "cached": item["cached"]
+        })
+
+    c = db.get_db().cursor()
+    c.execute("SELECT wallet_address FROM users WHERE id = ?", (session['user_id'],))
+    wallet_result = c.fetchone()
+    user_wallet = wallet_result[0] if wallet_result and wallet_result[0] else "DEMO_WALLET"
+    reward_id = None
+    if points_total:
+        # All activity rows are written with the reward, once per Idempotency-Key
+        reward_id, _ = queue_reward_for_user(session['user_id'], user_wallet, points_total,
+                                             request.headers.get("Idempotency-Key"), request.path,
+                                             activity=activity_rows)
+    else:
+        log_activities(activity_rows)
+
+    db_recyclers = []
+    if points_total:
+        db_recyclers = [{"id": recycler.id, "name": recycler.name, "contact": recycler.email}
+                        for recycler in directory.snapshot.accepting_recyclers(5)]
+
+    return jsonify({
+        "results": results,
+        "count": len(results),
+        "recyclable_count": sum(1 for r in results if r.get("prediction") == "recyclable"),
+        "points_earned": points_total,
+        "reward_tx": None,
+        "reward_id": reward_id,
+        "reward_status": rewards.PENDING if reward_id else None,
+        "recyclers": db_recyclers
+    })
+
+@app.route("/api/rewards", methods=["GET"])
+@login_required
+def reward_list():
+    """The user's recent rewards with their settlement status"""
+    return jsonify({"success": True, "rewards": rewards.reward_status(session['user_id'])})
+
+@app.route("/api/rewards/<reward_id>", methods=["GET"])
+@login_required
+def reward_detail(reward_id):
+    """Settlement status of one reward"""
+    found = rewards.reward_status(session['user_id'], reward_id, limit=1)
+    if not found:
+        return jsonify({'success': False, 'error': 'Reward not found'}), 404
+    return jsonify({"success": True, "reward": found[0]})
+
+# Bulk directory imports over HTTP, for scripts holding DIRECTORY_IMPORT_TOKEN
+IMPORT_CONTENT_TYPES = {"text/csv": "csv", "application/geo+json": "geojson",
+                        "application/geo+json-seq": "geojsonl", "application/x-ndjson": "geojsonl"}
+directory_import_lock = threading.Lock()  # one import at a time: each drops and rebuilds the indexes
+
+def import_token_valid():
+    return bearer_token_valid(app.config["DIRECTORY_IMPORT_TOKEN"])
+
+def run_directory_import(job):
+    try:
+        job.run()
+        directory.refresh()
+        # Kept until then so that re-posting it resumes an interrupted run
+        os.remove(job.path)
+    except Exception as e:
+        print(f"Error importing directory data (run {job.run_id}): {e}")
+    finally:
+        db.release()
+        directory_import_lock.release()
+
+@app.route("/api/directory/import", methods=["POST"])
+def directory_import_start():
+    """Store the request body and import it in the background; re-posting the same file resumes it"""
+    if not app.config["DIRECTORY_IMPORT_TOKEN"]:
+        return jsonify({"error": "Directory import API is disabled"}), 404
+    if not import_token_valid():
+        return jsonify({"error": "Invalid import token"}), 401
+    table = request.args.get("table", "recycling_centers")
+    fmt = request.args.get("format") or IMPORT_CONTENT_TYPES.get(request.mimetype)
+    source = request.args.get("source")
+    if table not in TABLE_COLUMNS or fmt not in FORMATS or not source:
+        return jsonify({"error": f"Pass source, table ({', '.join(TABLE_COLUMNS)}) and format "
+                                 f"({', '.join(FORMATS)}, or a matching Content-Type)"}), 400
+    if not directory_import_lock.acquire(blocking=False):
+        return jsonify({"error": "Another directory import is running"}), 409
+    try:
+        # Named by content hash, so the same upload lands on the same file and resumes its run
+        folder = app.config["DIRECTORY_IMPORT_DIR"]
+        os.makedirs(folder, exist_ok=True)
+        digest = hashlib.sha256()
+        tmp_path = os.path.join(folder, f"{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, "wb") as f:
+            for chunk in iter(lambda: request.stream.read(1024 * 1024), b""):
+                digest.update(chunk)
+                f.write(chunk)
+        path = os.path.join(folder, f"{digest.hexdigest()}.{fmt}")
+        os.replace(tmp_path, path)
+        job = DirectoryImport(path, table, fmt, source=source,
+                              chunk_size=app.config["DIRECTORY_IMPORT_CHUNK_SIZE"])
+    except Exception as e:
+        directory_import_lock.release()
+        return jsonify({"error": f"Could not start import: {str(e)}"}), 400
+    threading.Thread(target=run_directory_import, args=(job,), name="directory-import", daemon=True).start()
+    return jsonify({"success": True, "run_id": job.run_id, "resumed_from": job.resumed_from}), 202
+
+@app.route("/api/directory/imports/<int:run_id>", methods=["GET"])
+def directory_import_detail(run_id):
+    """Progress and counters of one import run"""
+    if not app.config["DIRECTORY_IMPORT_TOKEN"]:
+        return jsonify({"error": "Directory import API is disabled"}), 404
+    if not import_token_valid():
+        return jsonify({"error": "Invalid import token"}), 401
+    run = import_status(run_id)
+    if run is None:
+        return jsonify({'success': False, 'error': 'Import not found'}), 404
+    return jsonify({"success": True, "import": run})
+
 @app.route("/static/uploads/<path:filename>")
 def serve_uploads(filename):
+    # A just-classified upload may still be in the background writer's queue
+    pending = pending_upload_writes.get(os.path.join(app.config["UPLOAD_FOLDER"], filename))
+    if pending is not None:
+        try:
+            pending.result(timeout=10)
+        except Exception:
+            return jsonify({"error": "Upload could not be stored"}), 404
     return send_from_directory(app.config["UPLOAD_FOLDER"], filename)
 
 # Demo Wallet Balance Route
 @app.route("/wallet/<wallet>")
 @login_required
 def wallet_balance(wallet):
-    # Get user's total points from activity log
-    conn = sqlite3.connect('users.db')
-    c = conn.cursor()
-    c.execute('''SELECT SUM(points_earned) FROM user_activity WHERE user_id = ?''', 
-              (session['user_id'],))
-    total_points = c.fetchone()[0] or 0
-    conn.close()
+    # Get user's total points from the materialized ledger
+    total_points = points_ledger.get_balance(session['user_id'])
     
     return jsonify({"balance": total_points})
 
+# CLI commands (flask --app app <command>)
+@app.cli.command("settle-rewards")
+def settle_rewards_command():
+    """Run one reward settlement pass in the foreground"""
+    init_db()
+    reward_settler.stop()
+    settled = reward_settler.settle_once()
+    click.echo(f"Settled {settled} payout(s)")
+    click.echo(reward_settler.stats()["rewards"])
+
+@app.cli.command("reconcile-points")
+@click.option("--fix", is_flag=True, help="Rebuild the ledger from user_activity if it drifted")
+def reconcile_points_command(fix):
+    """Check materialized point balances against the raw activity log"""
+    init_db()
+    mismatches = points_ledger.reconcile(fix=fix)
+    if fix:
+        dashboard_cache.invalidate(user_id for user_id, _, _ in mismatches)
+    for user_id, ledger_balance, log_balance in mismatches:
+        click.echo(f"user {user_id}: ledger={ledger_balance} activity_log={log_balance}")
+    if not mismatches:
+        click.echo("Points ledger matches the activity log")
+    elif fix:
+        click.echo(f"Rebuilt ledger ({len(mismatches)} user(s) corrected)")
+    else:
+        click.echo(f"{len(mismatches)} mismatch(es); rerun with --fix to rebuild")
+        raise SystemExit(1)
+
+@app.cli.command("export-model")
+@click.option("--format", "fmt", type=click.Choice(["tflite", "onnx"]), required=True)
+@click.option("--quantize", type=click.Choice(model_export.QUANTIZATION_MODES), default="none", show_default=True)
+@click.option("--source", default="model/Sortify.h5", show_default=True, help="Keras model to convert")
+@click.option("--output", default=None, help="Defaults to the source path with the format's extension")
+@click.option("--calibration-dir", default=None, help="Images for int8 calibration [default: UPLOAD_FOLDER]")
+@click.option("--calibration-limit", default=100, show_default=True)
+def export_model_command(fmt, quantize, source, output, calibration_dir, calibration_limit):
+    """Convert the Keras model for the tflite / onnx inference backends"""
+    try:
+        path = model_export.export_model(source, fmt, output, quantize,
+                                         calibration_dir or app.config["UPLOAD_FOLDER"], calibration_limit)
+    except (ValueError, ImportError, OSError) as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Wrote {path} ({os.path.getsize(path) / 1024:.1f} KiB)")
+
+@app.cli.command("compact-uploads")
+@click.option("--dry-run", is_flag=True, help="Only count the flat uploads that would be migrated")
+def compact_uploads_command(dry_run):
+    """Move flat legacy uploads into the sharded, transcoded layout and sweep expired files"""
+    files, before, after = upload_store.compact_legacy(dry_run=dry_run)
+    if dry_run:
+        click.echo(f"{files} flat upload(s), {before / 1024:.1f} KiB would be migrated")
+        return
+    click.echo(f"Migrated {files} upload(s): {before / 1024:.1f} KiB -> {after / 1024:.1f} KiB (incl. thumbnails)")
+    swept = upload_store.sweep()
+    for tier, usage in upload_store.usage.items():
+        click.echo(f"{tier}: {usage['files']} file(s), {usage['bytes'] / 1024:.1f} KiB, "
+                   f"{swept['deleted'][tier]['files']} expired file(s) removed")
+
+@app.cli.command("import-directory")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--table", type=click.Choice(list(TABLE_COLUMNS)), default="recycling_centers", show_default=True)
+@click.option("--format", "fmt", type=click.Choice(FORMATS), default=None, help="Defaults to the file extension")
+@click.option("--source", default=None, help="Namespace of the rows' upsert keys [default: file name]")
+@click.option("--chunk-size", default=None, type=int, help="Rows per transaction [default: DIRECTORY_IMPORT_CHUNK_SIZE]")
+@click.option("--restart", is_flag=True, help="Start over instead of resuming an interrupted import of this file")
+def import_directory_command(path, table, fmt, source, chunk_size, restart):
+    """Bulk-load recyclers or recycling centers from a CSV / GeoJSON file"""
+    init_db()
+    try:
+        job = DirectoryImport(path, table, fmt, source=source, restart=restart,
+                              chunk_size=chunk_size or app.config["DIRECTORY_IMPORT_CHUNK_SIZE"])
+    except (ValueError, OSError) as e:
+        raise click.ClickException(str(e))
+    if job.resumed_from:
+        click.echo(f"Resuming import {job.run_id} after record {job.resumed_from}")
+
+    def progress(report):
+        click.echo(f"{report['rows_done']:>10} records  {report['inserted']} inserted  {report['updated']} updated  "
+                   f"{report['rejected']} rejected  {report['rows_per_s'] or 0:,.0f} rows/s")
+
+    try:
+        report = job.run(progress)
+    except KeyboardInterrupt:
+        click.echo(f"Interrupted after record {job.rows_done}; rerun the same command to resume")
+        raise SystemExit(1)
+    except (ValueError, OSError) as e:
+        raise click.ClickException(f"{e} (committed through record {job.rows_done}; rerun to resume)")
+    click.echo(f"Imported {report['rows_done'] - report['resumed_from']} record(s) into {table} in "
+               f"{report['seconds']:.1f}s ({report['rows_per_s'] or 0:,.0f} rows/s): {report['inserted']} inserted, "
+               f"{report['updated']} updated, {report['rejected']} rejected")
+    for reason, count in sorted(report["reject_reasons"].items(), key=lambda item: -item[1]):
+        click.echo(f"  {count} rejected: {reason}")
+    for sample in report["reject_samples"]:
+        click.echo(f"  e.g. {sample}")
+
+@app.cli.command("calibrate-confidence")
+@click.argument("directory", type=click.Path(exists=True, file_okay=False))
+@click.option("--batch-size", default=32, show_default=True)
+def calibrate_confidence_command(directory, batch_size):
+    """Fit PREDICTION_TEMPERATURE on labelled images in DIRECTORY/recyclable and DIRECTORY/non-recyclable"""
+    paths, labels = [], []
+    for label, folder in ((1, "recyclable"), (0, "non-recyclable")):
+        folder = os.path.join(directory, folder)
+        names = sorted(os.listdir(folder)) if os.path.isdir(folder) else []
+        paths += [os.path.join(folder, name) for name in names if allowed_file(name)]
+        labels += [label] * (len(paths) - len(labels))
+    if not paths:
+        raise click.ClickException(f"No images under {directory}/recyclable or {directory}/non-recyclable")
+    labels = np.array(labels)
+
+    # Single-pass outputs and every image's augmented views, uncalibrated
+    views = len(confidence_estimator.views)
+    single, augmented = [], []
+    for start in range(0, len(paths), batch_size):
+        images = []
+        for path in paths[start:start + batch_size]:
+            with open(path, "rb") as f:
+                images.append(preprocess_bytes(f.read()))
+        images = np.concatenate(images)
+        single.append(np.asarray(run_inference(images)))
+        augmented.append(np.asarray(run_inference(np.concatenate(
+            [confidence_estimator.augmented_views(image) for image in images]))))
+    single, augmented = np.concatenate(single), np.concatenate(augmented)
+    raw = np.array([recyclable_probability(row) for row in single])
+
+    temperature = fit_temperature(raw, labels)
+    fitted = ConfidenceEstimator(temperature, app.config["TTA_CONFIDENCE_THRESHOLD"], confidence_estimator.views)
+    final = []
+    for i, row in enumerate(single):
+        preds = row[None]
+        if fitted.escalate(preds):
+            preds = fitted.refine(preds, augmented[i * views:(i + 1) * views])
+        final.append(fitted.probability(preds))
+    calibrated = np.array([fitted.probability(row[None]) for row in single])
+
+    click.echo(f"{len(paths)} labelled images "
+               f"({int(labels.sum())} recyclable, {int((1 - labels).sum())} non-recyclable)")
+    click.echo(f"temperature 1 -> {temperature:.3g}: NLL {negative_log_likelihood(raw, labels):.4f} -> "
+               f"{negative_log_likelihood(calibrated, labels):.4f}, ECE {expected_calibration_error(raw, labels):.4f}"
+               f" -> {expected_calibration_error(calibrated, labels):.4f}")
+    click.echo(f"single pass: accuracy {np.mean((calibrated > 0.5) == labels):.1%}")
+    stats = fitted.stats()
+    click.echo(f"TTA below {fitted.threshold:g} confidence: {stats['escalated']} escalated "
+               f"({stats['escalation_rate']:.1%}), {stats['flipped']} label(s) changed, "
+               f"accuracy {np.mean((np.array(final) > 0.5) == labels):.1%}")
+    click.echo(f"Set PREDICTION_TEMPERATURE={temperature:.3g}")
+
+@app.cli.command("farming-report")
+@click.option("--days", default=7.0, show_default=True, help="How far back to look")
+@click.option("--min-repeats", default=None, type=int, help="[default: NEAR_DUPLICATE_REPEAT_LIMIT]")
+def farming_report_command(days, min_repeats):
+    """List users who keep uploading near-identical images of their own"""
+    init_db()
+    min_repeats = min_repeats or app.config["NEAR_DUPLICATE_REPEAT_LIMIT"]
+    rows = near_duplicates.repeat_report(time.time() - days * 86400, min_repeats)
+    for user_id, name, email, uploads, repeats, flagged, max_repeats in rows:
+        click.echo(f"user {user_id} ({name or '?'} <{email or '?'}>): {uploads} upload(s), {repeats} near-duplicate "
+                   f"repeat(s), {flagged} at {min_repeats}+ repeats, up to {max_repeats + 1} near-identical")
+    if not rows:
+        click.echo(f"No user reached {min_repeats} near-duplicate repeats in the last {days:g} day(s)")
+
+@app.cli.command("reclassify-uploads")
+@click.option("--model", "model_path", default=None, help="Model file to run [default: MODEL_PATH]")
+@click.option("--backend", type=click.Choice(list(BACKENDS)), default=None, help="[default: INFERENCE_BACKEND]")
+@click.option("--batch-size", default=None, type=int, help="Images per forward pass [default: RECLASSIFY_BATCH_SIZE]")
+@click.option("--workers", default=None, type=int, help="Decode threads [default: PREPROCESS_WORKERS]")
+@click.option("--prefetch", default=2, show_default=True, help="Batches decoded ahead of the model")
+@click.option("--against", default=None, help="Model id, or 'live' for upload-time labels, to compare with "
+                                              "[default: the model run before this one]")
+@click.option("--restart", is_flag=True, help="Start over instead of resuming an interrupted run of this model")
+@click.option("--diff-only", is_flag=True, help="Skip classification; only compare the model's stored labels")
+def reclassify_uploads_command(model_path, backend, batch_size, workers, prefetch, against, restart, diff_only):
+    """Run a model over every stored upload and diff its labels with an earlier model's"""
+    init_db()
+    backend = backend or app.config["INFERENCE_BACKEND"]
+    if model_path is None:
+        model_path = MODEL_PATH if backend == app.config["INFERENCE_BACKEND"] else default_model_path(backend)
+    model_id = model_identity(model_path)
+    click.echo(f"Model {model_path} ({backend}), id {model_id}")
+
+    if not diff_only:
+        try:
+            engine = load_backend(backend, model_path)
+        except (ValueError, ImportError, OSError) as e:
+            raise click.ClickException(str(e))
+        try:
+            job = Reclassification(upload_store, engine.predict, interpret_prediction, model_id, model_path,
+                                   batch_size=batch_size or app.config["RECLASSIFY_BATCH_SIZE"],
+                                   workers=workers or app.config["PREPROCESS_WORKERS"], prefetch=prefetch,
+                                   restart=restart, draft=app.config["JPEG_DRAFT_DECODE"])
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        if job.resumed_from:
+            click.echo(f"Resuming run {job.run_id} after {job.resumed_from} file(s)")
+
+        def progress(report):
+            click.echo(f"{report['files_done']:>10} files  {report['errors']} unreadable  "
+                       f"{report['images_per_s'] or 0:,.1f} images/s  decode wait {report['decode_wait_s']:.1f}s")
+
+        try:
+            report = job.run(progress)
+        except KeyboardInterrupt:
+            click.echo(f"Interrupted after {job.files_done} file(s); rerun the same command to resume")
+            raise SystemExit(1)
+        except Exception as e:
+            raise click.ClickException(f"{e} (committed through {job.files_done} file(s); rerun to resume)")
+        click.echo(f"Classified {report['files_done'] - report['resumed_from']} upload(s) in {report['seconds']:.1f}s "
+                   f"({report['images_per_s'] or 0:,.1f} images/s): {report['inference_s']:.1f}s in the model, "
+                   f"{report['decode_wait_s']:.1f}s waiting for decodes, {report['errors']} unreadable")
+        for sample in report["error_samples"]:
+            click.echo(f"  e.g. {sample}")
+
+    baseline = against or reclassify.previous_model(model_id)
+    diff = reclassify.label_diff(model_id, baseline, lossy_originals=upload_store.original_format != "original")
+    if not diff["compared"]:
+        click.echo(f"No uploads labelled by both {model_id} and {baseline}")
+        return
+    click.echo(f"Against {baseline}: {diff['compared']} upload(s) compared, {diff['agreement']:.1%} agree; "
+               f"{diff['to_recyclable']} now recyclable, {diff['to_non_recyclable']} now non-recyclable; "
+               f"P(recyclable) shifted {diff['mean_probability_shift']:+.4f} on average "
+               f"(mean |shift| {diff['mean_abs_probability_shift']:.4f})")
+    if diff["caveat"]:
+        click.echo(f"Note: {diff['caveat']}")
+    for sample in diff["changed_samples"]:
+        click.echo(f"  {sample['file_path']}: {sample['old_probability']:.4f} -> {sample['new_probability']:.4f}")
+
 # Run App
 if __name__ == "__main__":
+    ensure_started()
     app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 5000)), debug=True)
\ No newline at end of file
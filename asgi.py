@@ -0,0 +1,350 @@
+"""ASGI entry point: the I/O-bound routes as coroutines, everything else through Flask.
+
+    uvicorn asgi:app --workers 1
+
+``/dashboard``, ``/api/dashboard``, the two nearby-search APIs, ``/api/recyclers/contact`` and
+``/predict`` are served natively. Their SQLite work runs on a bounded pool of
+DB threads, image decoding on the preprocess pool, and inference is awaited
+on the micro-batcher's future, so a request that is waiting on the database
+or the model holds no thread. Uploads are validated chunk by chunk as the
+body arrives.
+
+Every other route, and any request without a logged-in session (so Flask
+can redirect and flash as usual), runs the Flask app on a bounded pool of
+WSGI threads. Responses are the same JSON / HTML the WSGI app returns, and
+both kinds of route are recorded in the app's request metrics (``/metrics``).
+"""
+import asyncio
+import io
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import numpy as np
+from flask import render_template
+
+import app as sortify
+import db
+from preprocessing import preprocess_bytes
+from upload_validation import MultipartFileReader, UploadRejected
+
+SPOOL_MAX_BYTES = 1024 * 1024  # fallback request bodies larger than this are buffered on disk
+
+
+class SortifyASGI:
+    """ASGI application wrapping the Flask app with native coroutine routes."""
+
+    def __init__(self, flask_app, db_threads=8, wsgi_threads=16):
+        self.flask_app = flask_app
+        self.db_executor = ThreadPoolExecutor(max_workers=db_threads, thread_name_prefix="asgi-db")
+        self.wsgi_executor = ThreadPoolExecutor(max_workers=wsgi_threads, thread_name_prefix="asgi-wsgi")
+        self.routes = {
+            ("GET", "/dashboard"): self.dashboard,
+            ("GET", "/api/dashboard"): self.dashboard_api,
+            ("GET", "/api/recyclers/nearby"): self.nearby_recyclers,
+            ("GET", "/api/recycling-centers/nearby"): self.nearby_recycling_centers,
+            ("POST", "/api/recyclers/contact"): self.contact_recycler,
+            ("POST", "/predict"): self.predict,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        if scope["type"] != "http":
+            return
+        sortify.ensure_started()
+        handler = self.routes.get((scope["method"], scope["path"]))
+        if handler is not None:
+            request = self.flask_app.request_class(build_environ(scope))
+            session = self.flask_app.session_interface.open_session(self.flask_app, request)
+            if session is not None and "user_id" in session:
+                return await self.call_native(handler, scope, receive, send, request, session)
+        await self.call_wsgi(scope, receive, send)
+
+    async def call_native(self, handler, scope, receive, send, request, session):
+        """Run a native route, recorded in the same request metrics as the Flask routes"""
+        started = time.perf_counter()
+        response = {}
+
+        async def send_and_record(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            await send(message)
+
+        try:
+            return await handler(scope, receive, send_and_record, request, session)
+        finally:
+            sortify.observe_request(scope["path"], scope["method"], response.get("status", 500),
+                                    (time.perf_counter() - started) * 1000.0)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await asyncio.get_running_loop().run_in_executor(self.db_executor, sortify.ensure_started)
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.db_executor.shutdown(wait=False)
+                self.wsgi_executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def run_db(self, fn, *args):
+        """Run a blocking DB function on the DB pool, releasing its connections afterwards"""
+        return await asyncio.get_running_loop().run_in_executor(self.db_executor, _release_after, fn, args)
+
+    # Native routes
+
+    async def dashboard(self, scope, receive, send, request, session):
+        try:
+            html = await self.run_db(self._render_dashboard, request.environ,
+                                     session["user_id"], session.get("user_name"))
+        except Exception as e:
+            print(f"Error rendering dashboard: {e}")
+            return await respond(send, 500, b"Internal Server Error", b"text/plain; charset=utf-8")
+        await respond(send, 200, html.encode(), b"text/html; charset=utf-8")
+
+    def _render_dashboard(self, environ, user_id, user_name):
+        with self.flask_app.request_context(environ):
+            return render_template("dashboard.html", **sortify.dashboard_context(user_id, user_name))
+
+    async def dashboard_api(self, scope, receive, send, request, session):
+        entry = await self.run_db(sortify.dashboard_cache.get, session["user_id"])
+        headers = [(b"etag", f'"{entry.etag}"'.encode()), (b"cache-control", b"private, no-cache")]
+        if request.if_none_match.contains(entry.etag):
+            return await respond(send, 304, b"", None, headers)
+        await self.respond_json(send, sortify.dashboard_json(entry.data), headers=headers)
+
+    async def nearby_recyclers(self, scope, receive, send, request, session):
+        try:
+            payload = await self.run_db(sortify.nearby_recyclers_payload, session["user_id"], request.args)
+        except Exception as e:
+            return await self.respond_json(send, {'success': False, 'error': str(e)}, 500)
+        await self.respond_json(send, payload)
+
+    async def nearby_recycling_centers(self, scope, receive, send, request, session):
+        try:
+            payload = await self.run_db(sortify.nearby_centers_payload, session["user_id"], request.args)
+        except Exception as e:
+            return await self.respond_json(send, {'success': False, 'error': str(e)}, 500)
+        await self.respond_json(send, payload)
+
+    async def contact_recycler(self, scope, receive, send, request, session):
+        try:
+            body = await read_body(receive, self.flask_app.config["MAX_CONTENT_LENGTH"])
+            data = self.flask_app.request_class(build_environ(scope, io.BytesIO(body))).get_json()
+            payload, status = await self.run_db(sortify.contact_recycler_response, session["user_id"], data)
+        except UploadRejected as e:
+            return await self.respond_json(send, {"error": str(e)}, e.status)
+        except Exception as e:
+            return await self.respond_json(send, {'success': False, 'error': str(e)}, 500)
+        await self.respond_json(send, payload, status)
+
+    async def predict(self, scope, receive, send, request, session):
+        config = self.flask_app.config
+        if sortify.model_error() is not None:
+            return await self.respond_json(send, {"error": f"Model not loaded: {sortify.model_error()}"}, 500)
+
+        # Validate the file part chunk by chunk as the body arrives
+        try:
+            if (request.content_length or 0) > config["MAX_CONTENT_LENGTH"]:
+                raise body_too_large(config["MAX_CONTENT_LENGTH"])
+            reader = MultipartFileReader(request.content_type, "file",
+                                         config["UPLOAD_MAX_BYTES"], config["UPLOAD_MAX_PIXELS"],
+                                         filename_filter=sortify.check_upload_filename)
+            with sortify.stage("upload_read"):
+                upload = await read_upload(receive, reader, config["MAX_CONTENT_LENGTH"])
+        except UploadRejected as e:
+            return await self.respond_json(send, {"error": str(e)}, e.status)
+
+        with sortify.stage("upload_save"):
+            paths = sortify.store_upload(upload.data, upload.digest, upload.extension)
+        loop = asyncio.get_running_loop()
+        try:
+            with sortify.stage("cache_lookup"):
+                preds = await self.run_db(sortify.prediction_cache.get, upload.digest)
+            cached = preds is not None
+            escalated = None
+            user_id = session["user_id"]
+            if cached:
+                # A cache hit's hash is read back from the database
+                with sortify.stage("near_duplicate"):
+                    phash, match = await self.run_db(sortify.near_duplicate_lookup, upload.digest, None, user_id)
+                source = "cache"
+            else:
+                # A fresh array per request: the batcher reads it after this coroutine yields
+                with sortify.stage("preprocess"):
+                    img_array = await loop.run_in_executor(
+                        sortify.preprocess_executor,
+                        partial(preprocess_bytes, upload.data, draft=config["JPEG_DRAFT_DECODE"]))
+                with sortify.stage("near_duplicate"):
+                    phash, match = await loop.run_in_executor(
+                        sortify.preprocess_executor,
+                        partial(sortify.near_duplicate_lookup, upload.digest, img_array, user_id))
+                    preds = sortify.reusable_prediction(match)
+                source = "near_duplicate" if preds is not None else "model"
+                if preds is None:
+                    with sortify.stage("inference"):
+                        preds = await asyncio.wait_for(asyncio.wrap_future(sortify.batcher.enqueue(img_array)),
+                                                       sortify.batcher.timeout)
+                    escalated = sortify.confidence_estimator.escalate(preds)
+                    if escalated:
+                        with sortify.stage("tta"):
+                            views = sortify.confidence_estimator.augmented_views(img_array)
+                            view_preds = await asyncio.wait_for(asyncio.gather(
+                                *(asyncio.wrap_future(future) for future in sortify.batcher.enqueue_many(views))),
+                                sortify.batcher.timeout)
+                            preds = sortify.confidence_estimator.refine(preds, np.concatenate(view_preds))
+                    # Only model output is cached; a reused label is not this upload's prediction
+                    await self.run_db(sortify.prediction_cache.put, upload.digest, preds)
+            near_duplicate = await loop.run_in_executor(
+                sortify.preprocess_executor,
+                partial(sortify.record_upload_hash, upload.digest, phash, preds, user_id, match, source))
+            payload = await self.run_db(sortify.prediction_response, user_id, upload.filename, preds, cached, paths,
+                                        request.headers.get("Idempotency-Key"), escalated, near_duplicate)
+        except Exception as e:
+            return await self.respond_json(send, {"error": f"Inference failed: {str(e)}"}, 500)
+        await self.respond_json(send, payload)
+
+    async def respond_json(self, send, payload, status=200, headers=()):
+        body = f"{self.flask_app.json.dumps(payload)}\n".encode()
+        await respond(send, status, body, b"application/json", headers)
+
+    # Everything else
+
+    async def call_wsgi(self, scope, receive, send):
+        """Run the Flask app for this request on the WSGI pool"""
+        limit = self.flask_app.config["MAX_CONTENT_LENGTH"]
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES) as body:
+            received = 0
+            while True:
+                message = await receive()
+                if message["type"] != "http.request":
+                    return  # client went away
+                chunk = message.get("body", b"")
+                received += len(chunk)
+                if limit and received > limit:
+                    return await self.respond_json(send, {"error": str(body_too_large(limit))}, 413)
+                body.write(chunk)
+                if not message.get("more_body"):
+                    break
+            body.seek(0)
+            status, headers, content = await asyncio.get_running_loop().run_in_executor(
+                self.wsgi_executor, self._run_wsgi, build_environ(scope, body))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": content})
+
+    def _run_wsgi(self, environ):
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started["status"] = int(status.split(" ", 1)[0])
+            started["headers"] = [(name.lower().encode("latin1"), value.encode("latin1"))
+                                  for name, value in headers]
+
+        result = self.flask_app(environ, start_response)
+        try:
+            content = b"".join(result)
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+        return started["status"], started["headers"], content
+
+
+def _release_after(fn, args):
+    try:
+        return fn(*args)
+    finally:
+        db.release()
+
+
+def body_too_large(limit):
+    return UploadRejected(f"Request body exceeds {limit} bytes", 413)
+
+
+async def respond(send, status, body, content_type, headers=()):
+    # Native routes read the session cookie, so caches must key on it (as Flask does)
+    headers = [(b"vary", b"Cookie"), *headers]
+    if content_type is not None:
+        headers += [(b"content-type", content_type), (b"content-length", str(len(body)).encode())]
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def read_body(receive, limit):
+    """The whole request body, refused (413) once it passes ``limit`` bytes"""
+    chunks = []
+    received = 0
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            raise UploadRejected("Client disconnected", 400)
+        chunk = message.get("body", b"")
+        received += len(chunk)
+        if limit and received > limit:
+            raise body_too_large(limit)
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def read_upload(receive, reader, limit):
+    """Feed body chunks to a MultipartFileReader until it yields the upload"""
+    received = 0
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            raise UploadRejected("Client disconnected", 400)
+        chunk = message.get("body", b"")
+        received += len(chunk)
+        if limit and received > limit:
+            raise body_too_large(limit)
+        if chunk:
+            upload = reader.feed(chunk)
+            if upload is not None:
+                return upload
+        if not message.get("more_body"):
+            return reader.feed(b"")
+
+
+def build_environ(scope, body=None):
+    """WSGI environ for an ASGI HTTP scope (``body`` is a file-like request body)"""
+    root_path = scope.get("root_path", "")
+    path = scope["path"]
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": root_path.encode("utf8").decode("latin1"),
+        "PATH_INFO": path.encode("utf8").decode("latin1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body if body is not None else io.BytesIO(),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"] = scope["client"][0]
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin1").upper().replace("-", "_")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = f"HTTP_{name}"
+        value = value.decode("latin1")
+        if name in environ:
+            value = f"{environ[name]}{'; ' if name == 'HTTP_COOKIE' else ','}{value}"
+        environ[name] = value
+    return environ
+
+
+app = SortifyASGI(sortify.app,
+                  db_threads=sortify.app.config["ASGI_DB_THREADS"],
+                  wsgi_threads=sortify.app.config["ASGI_WSGI_THREADS"])
@@ -0,0 +1,163 @@
+"""Dynamic micro-batching in front of the classification model."""
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import numpy as np
+
+from metrics import Histogram
+
+
+class MicroBatcher:
+    """Collect concurrent single-image requests into one batched forward pass.
+
+    Each caller submits one preprocessed image and blocks until the batch it
+    landed in has been run. A batch is dispatched when it is full or when its
+    oldest request has waited ``max_wait_ms``. The wait is shortened further so
+    that queue wait plus the recent average inference time stays inside
+    ``latency_budget_ms``.
+
+    With ``dispatchers`` > 1, that many batches can be in flight at once
+    (one per inference worker process).
+
+    Callers give up after ``timeout_s`` with ``TimeoutError``, so a stuck
+    dispatcher or inference worker cannot hold request threads forever.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=16, max_wait_ms=5.0, latency_budget_ms=None, dispatchers=1,
+                 timeout_s=60.0):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.latency_budget = latency_budget_ms / 1000.0 if latency_budget_ms else None
+        self.dispatchers = max(1, int(dispatchers))
+        self.timeout = timeout_s
+
+        self._pending = []  # (image, future, enqueued_at)
+        self._cond = threading.Condition()
+        self._threads = []
+        self._avg_inference = 0.0  # EWMA of batch inference time in seconds
+
+        self.batch_size_hist = Histogram((1, 2, 4, 8, 16, 32, 64, 128))
+        self.queue_wait_ms_hist = Histogram((0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000))
+        self.inference_ms_hist = Histogram((5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000))
+
+    def submit(self, img_array, timeout=None):
+        """Queue one image and block until its prediction is ready.
+
+        ``img_array`` may be ``(H, W, C)`` or ``(1, H, W, C)``; the result keeps
+        a leading batch axis of one so ``interpret_prediction`` works unchanged.
+        ``timeout`` defaults to the batcher's ``timeout_s``.
+        """
+        return self._wait([self.enqueue(img_array)], timeout)[0]
+
+    def enqueue(self, img_array):
+        """Queue one image without waiting; returns a Future for its prediction.
+
+        The array is read when its batch is stacked, so it must not be reused
+        until the future is done.
+        """
+        img_array = np.asarray(img_array)
+        if img_array.ndim == 4:
+            img_array = img_array[0]
+
+        future = Future()
+        with self._cond:
+            self._ensure_worker()
+            self._pending.append((img_array, future, time.perf_counter()))
+            self._cond.notify()
+        return future
+
+    def stats(self):
+        with self._cond:
+            depth = len(self._pending)
+        return {
+            "max_batch_size": self.max_batch_size,
+            "dispatchers": self.dispatchers,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "latency_budget_ms": self.latency_budget * 1000.0 if self.latency_budget else None,
+            "queue_depth": depth,
+            "batch_size": self.batch_size_hist.snapshot(),
+            "queue_wait_ms": self.queue_wait_ms_hist.snapshot(),
+            "inference_ms": self.inference_ms_hist.snapshot(),
+        }
+
+    def enqueue_many(self, images):
+        """Queue several images together so they share a batch (up to max_batch_size); returns their Futures"""
+        images = [np.asarray(image) for image in images]
+        futures = [Future() for _ in images]
+        now = time.perf_counter()
+        with self._cond:
+            self._ensure_worker()
+            self._pending.extend((image[0] if image.ndim == 4 else image, future, now)
+                                 for image, future in zip(images, futures))
+            self._cond.notify()
+        return futures
+
+    def submit_many(self, images, timeout=None):
+        """Queue several images together and block until all are done; returns their rows stacked"""
+        return np.concatenate(self._wait(self.enqueue_many(images), timeout))
+
+    def _wait(self, futures, timeout):
+        # One deadline for the whole group; images still queued at the deadline are dropped from it
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.perf_counter() + timeout
+        try:
+            return [future.result(max(0.0, deadline - time.perf_counter())) for future in futures]
+        except FutureTimeoutError:
+            for future in futures:
+                future.cancel()
+            raise TimeoutError(f"No prediction within {timeout}s") from None
+
+    def _ensure_worker(self):
+        # Called with self._cond held
+        self._threads = [thread for thread in self._threads if thread.is_alive()]
+        while len(self._threads) < self.dispatchers:
+            thread = threading.Thread(target=self._run, name=f"micro-batcher-{len(self._threads)}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _max_wait(self):
+        if self.latency_budget is None:
+            return self.max_wait
+        return max(0.0, min(self.max_wait, self.latency_budget - self._avg_inference))
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            deadline = self._pending[0][2] + self._max_wait()
+            while len(self._pending) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+        # Callers that timed out cancelled their futures; the rest can no longer be cancelled
+        return [item for item in batch if item[1].set_running_or_notify_cancel()]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                continue
+            started = time.perf_counter()
+            for _, _, enqueued_at in batch:
+                self.queue_wait_ms_hist.observe((started - enqueued_at) * 1000.0)
+            self.batch_size_hist.observe(len(batch))
+
+            try:
+                preds = np.asarray(self.predict_fn(np.stack([item[0] for item in batch])))
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            elapsed = time.perf_counter() - started
+            self.inference_ms_hist.observe(elapsed * 1000.0)
+            self._avg_inference = elapsed if self._avg_inference == 0.0 else 0.8 * self._avg_inference + 0.2 * elapsed
+
+            for i, (_, future, _) in enumerate(batch):
+                future.set_result(preds[i:i + 1])
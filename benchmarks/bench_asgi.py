@@ -0,0 +1,193 @@
+"""Load test: the WSGI app under gunicorn vs. the ASGI app under uvicorn.
+
+Both servers run as a single process with the same model, a scratch database
+and upload folder, and the same thread budget (gunicorn gets
+ASGI_DB_THREADS + ASGI_WSGI_THREADS request threads), so they are compared at
+roughly equal memory; the peak RSS of each server is reported to check that.
+For every concurrency level, clients loop over a weighted mix of nearby
+searches, dashboard views, contact requests and /predict uploads for a fixed
+time. Needs ``gunicorn``, ``uvicorn`` and ``httpx``.
+
+    python benchmarks/bench_asgi.py [--concurrency 16 64 256] [--seconds 15] [--images 32]
+                                    [--servers wsgi asgi]
+"""
+import argparse
+import asyncio
+import io
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# (weight, method, path, kind)
+MIX = [
+    (4, "GET", "/api/recyclers/nearby", "nearby"),
+    (2, "GET", "/api/recycling-centers/nearby", "nearby"),
+    (2, "GET", "/dashboard", "page"),
+    (1, "POST", "/api/recyclers/contact", "contact"),
+    (1, "POST", "/predict", "predict"),
+]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def server_command(kind, port, threads):
+    if kind == "wsgi":
+        return [sys.executable, "-m", "gunicorn", "app:app", "-w", "1", "-k", "gthread",
+                "--threads", str(threads), "-b", f"127.0.0.1:{port}", "--log-level", "warning"]
+    return [sys.executable, "-m", "uvicorn", "asgi:app", "--port", str(port), "--log-level", "warning"]
+
+
+def peak_rss_mib(pid):
+    """Sum of VmHWM over ``pid`` and its children"""
+    total = 0
+    pids = [pid]
+    while pids:
+        current = pids.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        total += int(line.split()[1])
+            with open(f"/proc/{current}/task/{current}/children") as f:
+                pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return total / 1024.0
+
+
+def make_images(count):
+    rng = random.Random(0)
+    images = []
+    for _ in range(count):
+        buf = io.BytesIO()
+        color = tuple(rng.randrange(256) for _ in range(3))
+        Image.new("RGB", (320, 240), color).save(buf, "JPEG")
+        images.append(buf.getvalue())
+    return images
+
+
+async def login(client):
+    email = f"bench{time.time_ns()}@example.com"
+    await client.post("/signup", data={"name": "Bench", "email": email, "password": "pw", "wallet": "0xbench"})
+    if "session" not in client.cookies:
+        raise SystemExit("Could not sign up a benchmark user")
+
+
+async def wait_ready(base_url, process, timeout=120.0):
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.perf_counter() < deadline:
+            if process.poll() is not None:
+                raise SystemExit(f"Server exited with code {process.returncode}")
+            try:
+                health = (await client.get("/health")).json()
+                if health["model_loaded"]:
+                    return
+            except (httpx.HTTPError, ValueError):
+                pass
+            await asyncio.sleep(0.2)
+    raise SystemExit("Server did not load the model in time")
+
+
+async def request(client, method, path, kind, images, rng):
+    if kind == "nearby":
+        return await client.request(method, path, params={"lat": 12.97 + rng.random(), "lon": 77.59,
+                                                          "max_distance": 500})
+    if kind == "contact":
+        return await client.post(path, json={"recycler_id": rng.randint(1, 5), "message": "bench"})
+    if kind == "predict":
+        return await client.post(path, files={"file": ("bench.jpg", rng.choice(images), "image/jpeg")})
+    return await client.get(path)
+
+
+async def run_load(base_url, concurrency, seconds, images):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120.0) as client:
+        await login(client)
+        weights = [entry[0] for entry in MIX]
+        latencies = []
+        errors = 0
+        deadline = time.perf_counter() + seconds
+
+        async def worker(seed):
+            nonlocal errors
+            rng = random.Random(seed)
+            while time.perf_counter() < deadline:
+                _, method, path, kind = rng.choices(MIX, weights)[0]
+                started = time.perf_counter()
+                try:
+                    response = await request(client, method, path, kind, images, rng)
+                    if response.status_code != 200:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append((time.perf_counter() - started) * 1000.0)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+        return time.perf_counter() - started, latencies, errors
+
+
+async def bench_server(kind, args, images):
+    port = free_port()
+    threads = int(os.environ.get("ASGI_DB_THREADS", "8")) + int(os.environ.get("ASGI_WSGI_THREADS", "16"))
+    with tempfile.TemporaryDirectory() as scratch:
+        env = dict(os.environ,
+                   DATABASE_PATH=os.path.join(scratch, "bench.db"),
+                   UPLOAD_FOLDER=os.path.join(scratch, "uploads"),
+                   MODEL_WARMUP="background")
+        process = subprocess.Popen(server_command(kind, port, threads), cwd=ROOT, env=env)
+        base_url = f"http://127.0.0.1:{port}"
+        try:
+            async with httpx.AsyncClient(base_url=base_url) as client:
+                for _ in range(600):
+                    try:
+                        await client.get("/features")
+                        break
+                    except httpx.HTTPError:
+                        await asyncio.sleep(0.1)
+            await wait_ready(base_url, process)
+            for concurrency in args.concurrency:
+                seconds, latencies, errors = await run_load(base_url, concurrency, args.seconds, images)
+                print(f"{kind:<6}{concurrency:>6}{len(latencies) / seconds:>10.1f}"
+                      f"{np.percentile(latencies, 50):>10.1f}{np.percentile(latencies, 99):>10.1f}"
+                      f"{errors:>8}{peak_rss_mib(process.pid):>10.0f}", flush=True)
+        finally:
+            process.terminate()
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[16, 64, 256])
+    parser.add_argument("--seconds", type=float, default=15.0)
+    parser.add_argument("--images", type=int, default=32, help="distinct images uploaded to /predict")
+    parser.add_argument("--servers", nargs="+", choices=("wsgi", "asgi"), default=["wsgi", "asgi"])
+    args = parser.parse_args()
+
+    images = make_images(args.images)
+    print(f"{'server':<6}{'conc':>6}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}{'RSS MiB':>10}")
+    for kind in args.servers:
+        asyncio.run(bench_server(kind, args, images))
+
+
+if __name__ == "__main__":
+    main()
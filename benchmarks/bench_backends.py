@@ -0,0 +1,136 @@
+"""Compare inference backends: latency, throughput, memory and agreement with Keras.
+
+Each model runs in its own interpreter so peak RSS covers the runtime it
+imports. Agreement is the share of evaluation images for which
+``interpret_prediction`` gives the same label as the Keras baseline; the
+max abs diff is over the raw output rows.
+
+    python benchmarks/bench_backends.py [--models model/Sortify.h5 model/Sortify.int8.tflite ...]
+                                        [--eval-dir static/uploads] [--eval-limit 200]
+                                        [--runs 50] [--batch-size 16]
+
+Without --models, the Keras model and every exported .tflite / .onnx file
+next to it are compared (create them with ``flask export-model``). Use an
+--eval-dir that differs from the int8 calibration set for an unbiased
+agreement figure.
+"""
+import argparse
+import glob
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from inference_backends import load_backend  # noqa: E402
+from model_export import calibration_images  # noqa: E402
+
+
+def backend_for(path):
+    return {".h5": "keras", ".keras": "keras", ".tflite": "tflite", ".onnx": "onnx"}[os.path.splitext(path)[1]]
+
+
+def child(model_path, eval_path, preds_path, runs, batch_size, threads):
+    images = np.load(eval_path)
+    started = time.perf_counter()
+    backend = load_backend(backend_for(model_path), model_path, threads)
+    backend.predict(images[:1])
+    load_s = time.perf_counter() - started
+
+    single = []
+    for i in range(runs):
+        t = time.perf_counter()
+        backend.predict(images[i % len(images)][None])
+        single.append((time.perf_counter() - t) * 1000.0)
+
+    batch = images[np.arange(batch_size) % len(images)]
+    backend.predict(batch)
+    t = time.perf_counter()
+    batch_runs = max(1, runs // 5)
+    for _ in range(batch_runs):
+        backend.predict(batch)
+    throughput = batch_runs * batch_size / (time.perf_counter() - t)
+
+    preds = np.concatenate([backend.predict(images[i:i + batch_size]) for i in range(0, len(images), batch_size)])
+    np.save(preds_path, preds)
+    print(json.dumps({
+        "load_s": load_s,
+        "p50_ms": float(np.percentile(single, 50)),
+        "p99_ms": float(np.percentile(single, 99)),
+        "throughput": throughput,
+        "peak_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+        "size_kib": os.path.getsize(model_path) / 1024.0,
+    }))
+
+
+def run_model(model_path, eval_path, tmp, args):
+    preds_path = os.path.join(tmp, f"{os.path.basename(model_path)}.npy")
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", model_path, eval_path, preds_path,
+           str(args.runs), str(args.batch_size), str(args.threads)]
+    proc = subprocess.run(cmd, capture_output=True, text=True, env=dict(os.environ, TF_CPP_MIN_LOG_LEVEL="3"))
+    if proc.returncode != 0:
+        print(f"{model_path}: failed\n{proc.stderr.strip().splitlines()[-1] if proc.stderr else ''}")
+        return None, None
+    return json.loads(proc.stdout.strip().splitlines()[-1]), np.load(preds_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--models", nargs="+")
+    parser.add_argument("--eval-dir", default=os.path.join(ROOT, "static", "uploads"))
+    parser.add_argument("--eval-limit", type=int, default=200)
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--threads", type=int, default=0, help="Intra-op threads for tflite/onnx (0 = runtime default)")
+    parser.add_argument("--child", nargs=6, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        model_path, eval_path, preds_path, runs, batch_size, threads = args.child
+        return child(model_path, eval_path, preds_path, int(runs), int(batch_size), int(threads))
+
+    from app import interpret_prediction
+
+    models = args.models
+    if not models:
+        keras_path = os.environ.get("MODEL_PATH", os.path.join(ROOT, "model", "Sortify.h5"))
+        stem = os.path.splitext(keras_path)[0]
+        models = [keras_path] + sorted(glob.glob(f"{stem}*.tflite") + glob.glob(f"{stem}*.onnx"))
+
+    images = calibration_images(args.eval_dir, args.eval_limit)
+    if images:
+        images = np.concatenate(images)
+        print(f"Evaluating on {len(images)} image(s) from {args.eval_dir}")
+    else:
+        images = np.random.default_rng(0).random((32, 224, 224, 3), dtype=np.float32)
+        print(f"No images in {args.eval_dir}; evaluating on 32 random inputs")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        eval_path = os.path.join(tmp, "eval.npy")
+        np.save(eval_path, images)
+        print(f"{'model':<28}{'size KiB':>9}{'load s':>8}{'p50 ms':>8}{'p99 ms':>8}"
+              f"{'img/s@' + str(args.batch_size):>10}{'peak MiB':>10}{'agree':>8}{'max diff':>10}")
+        baseline = None
+        for model_path in models:
+            result, preds = run_model(model_path, eval_path, tmp, args)
+            if result is None:
+                continue
+            labels = [bool(interpret_prediction(row[None])) for row in preds]
+            if baseline is None:
+                baseline = (labels, preds)
+            agree = np.mean([a == b for a, b in zip(labels, baseline[0])])
+            max_diff = float(np.max(np.abs(preds - baseline[1])))
+            print(f"{os.path.basename(model_path):<28}{result['size_kib']:>9.1f}{result['load_s']:>8.2f}"
+                  f"{result['p50_ms']:>8.2f}{result['p99_ms']:>8.2f}{result['throughput']:>10.1f}"
+                  f"{result['peak_rss_mib']:>10.0f}{agree:>8.1%}{max_diff:>10.4f}")
+    print("(agreement and max diff are relative to the first model, normally the Keras baseline)")
+
+
+if __name__ == "__main__":
+    main()
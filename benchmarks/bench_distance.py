@@ -0,0 +1,105 @@
+"""Benchmark the vectorized nearby kernel against the per-row geodesic loop.
+
+For each facility count, times the current approach (geodesic for every row,
+filter, full sort) and geo_distance.nearest_within() on the same synthetic
+data, checks that both return the same top-k, and checks the haversine error
+bound against geodesic on a random sample of pairs.
+
+    python benchmarks/bench_distance.py [--sizes 1000 100000 1000000] [--loop-limit 20000]
+
+The per-row loop is only run on up to --loop-limit rows; beyond that its time
+is extrapolated linearly (marked with *) and the top-k check is skipped.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+from geopy.distance import geodesic
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from geo_distance import HAVERSINE_REL_ERROR, CoordinateColumns, haversine_km, nearest_within  # noqa: E402
+
+
+def geodesic_km(lat1, lon1, lat2, lon2):
+    return geodesic((lat1, lon1), (lat2, lon2)).km
+
+
+def per_row_loop(lat, lon, lats, lons, max_km, limit):
+    """What get_nearby_* did before: one geodesic call per row, then a full sort"""
+    found = []
+    for i in range(len(lats)):
+        d = geodesic_km(lat, lon, lats[i], lons[i])
+        if d <= max_km:
+            found.append((d, i))
+    found.sort()
+    return [i for _, i in found[:limit]]
+
+
+def synthetic(n, rng):
+    # Facilities clustered over India, like the seed data, with some global spread
+    lats = np.concatenate([rng.uniform(8.0, 35.0, n - n // 10), rng.uniform(-60.0, 70.0, n // 10)])
+    lons = np.concatenate([rng.uniform(68.0, 97.0, n - n // 10), rng.uniform(-180.0, 180.0, n // 10)])
+    return lats, lons
+
+
+def check_error_bound(samples, rng):
+    lat1, lat2 = rng.uniform(-89, 89, samples), rng.uniform(-89, 89, samples)
+    lon1, lon2 = rng.uniform(-180, 180, samples), rng.uniform(-180, 180, samples)
+    worst = 0.0
+    for i in range(samples):
+        cols = CoordinateColumns([lat2[i]], [lon2[i]])
+        approx = float(haversine_km(lat1[i], lon1[i], cols)[0])
+        exact = geodesic_km(lat1[i], lon1[i], lat2[i], lon2[i])
+        if exact > 1e-6:
+            worst = max(worst, abs(approx - exact) / exact)
+    return worst
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000, 1000000])
+    parser.add_argument("--queries", type=int, default=5)
+    parser.add_argument("--max-distance", type=float, default=50.0)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--loop-limit", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    random.seed(args.seed)
+
+    worst = check_error_bound(2000, rng)
+    status = "ok" if worst <= HAVERSINE_REL_ERROR else "EXCEEDED"
+    print(f"haversine vs geodesic: worst relative error {worst:.5f} (bound {HAVERSINE_REL_ERROR}) {status}")
+
+    print(f"{'rows':>10}{'loop ms/query':>16}{'vector ms/query':>18}{'speedup':>10}{'top-k':>8}")
+    for n in args.sizes:
+        lats, lons = synthetic(n, rng)
+        cols = CoordinateColumns(lats, lons)
+        queries = [(random.uniform(10, 30), random.uniform(72, 90)) for _ in range(args.queries)]
+
+        started = time.perf_counter()
+        vector = [nearest_within(lat, lon, cols, args.max_distance, args.limit, geodesic_km) for lat, lon in queries]
+        vector_ms = (time.perf_counter() - started) * 1000.0 / len(queries)
+
+        loop_rows = min(n, args.loop_limit)
+        started = time.perf_counter()
+        loop = [per_row_loop(lat, lon, lats[:loop_rows], lons[:loop_rows], args.max_distance, args.limit)
+                for lat, lon in queries]
+        loop_ms = (time.perf_counter() - started) * 1000.0 / len(queries) * (n / loop_rows)
+
+        if loop_rows == n:
+            same = all([i for i, _ in v] == l for v, l in zip(vector, loop))
+            topk = "same" if same else "DIFF"
+        else:
+            topk = "-"
+        marker = "*" if loop_rows < n else " "
+        print(f"{n:>10}{loop_ms:>15.1f}{marker}{vector_ms:>18.2f}{loop_ms / vector_ms:>9.0f}x{topk:>8}")
+
+
+if __name__ == "__main__":
+    main()
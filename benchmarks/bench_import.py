@@ -0,0 +1,95 @@
+"""Benchmark bulk directory imports against row-at-a-time inserts.
+
+Generates a synthetic recycling-center CSV, then on a scratch database times:
+one INSERT transaction per row with the search-index and version
+triggers live (on up to --row-limit rows, extrapolated), a fresh bulk import
+(chunked upserts, indexes deferred), a re-import of the same data (every row
+an update), and the directory snapshot reload that follows.
+
+    python benchmarks/bench_import.py [--rows 300000] [--chunk-size 5000] [--row-limit 20000]
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def write_dataset(path, rows, seed=0):
+    rng = random.Random(seed)
+    materials = ["Plastic, Paper", "plastics; e-waste", "Glass | cans", "Paper/Cardboard", "batteries"]
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["facility_id", "name", "type", "category", "address", "lat", "lon", "phone",
+                         "opening_hours", "materials"])
+        for i in range(rows):
+            writer.writerow([f"F{i}", f"Facility {i}", rng.choice(["NGO", "Private", "Government"]), "Multiple",
+                             f"{i} Main Road", f"{rng.uniform(8, 35):.6f}", f"{rng.uniform(68, 97):.6f}",
+                             "+911234567890", "Mon-Fri: 9AM-5PM", rng.choice(materials)])
+
+
+def row_at_a_time(path, limit):
+    """Each row in its own transaction through the live triggers and indexes"""
+    import db
+    from directory_import import TABLE_COLUMNS, iter_csv, normalize_record
+
+    columns = TABLE_COLUMNS["recycling_centers"]
+    sql = (f"INSERT INTO recycling_centers ({', '.join(columns)}, import_key) "
+           f"VALUES ({', '.join('?' * (len(columns) + 1))})")
+    started = time.perf_counter()
+    done = 0
+    with open(path, newline="") as f:
+        for fields in iter_csv(f):
+            if done == limit:
+                break
+            key, values = normalize_record(fields, "recycling_centers", "rowwise")
+            with db.transaction() as c:
+                c.execute(sql, values + (key,))
+            done += 1
+    seconds = time.perf_counter() - started
+    with db.transaction() as c:
+        c.execute("DELETE FROM recycling_centers WHERE import_key LIKE 'rowwise:%'")
+    return done, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=300000)
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--row-limit", type=int, default=20000, help="rows inserted one at a time")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        os.environ["DATABASE_PATH"] = os.path.join(scratch, "bench.db")
+        os.environ.setdefault("UPLOAD_FOLDER", os.path.join(scratch, "uploads"))
+        import app
+        from directory_import import DirectoryImport
+
+        app.init_db()
+        dataset = os.path.join(scratch, "centers.csv")
+        write_dataset(dataset, args.rows)
+        size_mib = os.path.getsize(dataset) / 1024 / 1024
+        print(f"{args.rows} rows, {size_mib:.1f} MiB CSV, chunk size {args.chunk_size}")
+        print(f"{'mode':<24}{'rows':>10}{'seconds':>10}{'rows/s':>12}")
+
+        done, seconds = row_at_a_time(dataset, min(args.row_limit, args.rows))
+        extrapolated = "*" if done < args.rows else ""
+        print(f"{'row at a time':<24}{done:>10}{seconds * args.rows / done:>9.1f}{extrapolated:1}"
+              f"{done / seconds:>12,.0f}")
+
+        for label in ("bulk import", "bulk re-import"):
+            report = DirectoryImport(dataset, chunk_size=args.chunk_size, restart=True).run()
+            print(f"{label:<24}{report['rows_done']:>10}{report['seconds']:>10.1f}{report['rows_per_s']:>12,.0f}")
+
+        started = time.perf_counter()
+        snapshot = app.directory.refresh()
+        print(f"directory reload: {len(snapshot.centers)} centers in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
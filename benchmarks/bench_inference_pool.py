@@ -0,0 +1,101 @@
+"""Core-scaling benchmark for the multi-process inference pool.
+
+Runs the same load (concurrent clients, each sending batches of
+preprocessed images) against the in-process backend and against pools of
+1, 2, 4, ... workers, each pinned to its own slice of cores, and reports
+throughput, latency and speedup over the in-process baseline.
+
+    python benchmarks/bench_inference_pool.py [--workers 1 2 4] [--clients 8] [--batch-size 4]
+                                              [--requests 200] [--backend keras] [--model model/Sortify.h5]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from inference_backends import default_model_path, load_backend  # noqa: E402
+from inference_pool import InferencePool, _available_cores  # noqa: E402
+
+
+def drive(predict, clients, batch_size, requests):
+    """Issue ``requests`` batches from ``clients`` threads; returns (seconds, latencies_ms)"""
+    rng = np.random.default_rng(0)
+    batch = rng.random((batch_size, 224, 224, 3), dtype=np.float32)
+    latencies = []
+    lock = threading.Lock()
+    remaining = [requests]
+
+    def client():
+        while True:
+            with lock:
+                if remaining[0] == 0:
+                    return
+                remaining[0] -= 1
+            started = time.perf_counter()
+            predict(batch)
+            elapsed = (time.perf_counter() - started) * 1000.0
+            with lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, latencies
+
+
+def report(label, seconds, latencies, batch_size, baseline=None):
+    throughput = len(latencies) * batch_size / seconds
+    speedup = f"{throughput / baseline:6.2f}x" if baseline else "   1.00x"
+    print(f"{label:<14}{throughput:>10.1f}{np.percentile(latencies, 50):>10.1f}"
+          f"{np.percentile(latencies, 99):>10.1f}{speedup:>10}")
+    return throughput
+
+
+def main():
+    cores = len(_available_cores())
+    default_workers = [n for n in (1, 2, 4, 8, 16) if n <= cores] or [1]
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=default_workers)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--backend", default=os.environ.get("INFERENCE_BACKEND", "keras"))
+    parser.add_argument("--model", default=os.environ.get("MODEL_PATH"))
+    args = parser.parse_args()
+    model_path = args.model or default_model_path(args.backend)
+
+    print(f"{cores} usable core(s); {args.clients} clients x batch {args.batch_size}, "
+          f"{args.requests} requests, backend {args.backend}")
+    print(f"{'setup':<14}{'img/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'speedup':>10}")
+
+    model = load_backend(args.backend, model_path)
+    model.predict(np.zeros((1, 224, 224, 3), dtype=np.float32))
+    seconds, latencies = drive(model.predict, args.clients, args.batch_size, args.requests)
+    baseline = report("in-process", seconds, latencies, args.batch_size)
+    del model
+
+    for workers in args.workers:
+        pool = InferencePool(args.backend, model_path, workers=workers, max_batch=max(16, args.batch_size))
+        pool.start()
+        try:
+            while pool.stats()["ready"] < workers:
+                if pool.error:
+                    raise SystemExit(f"Pool failed to start: {pool.error}")
+                time.sleep(0.05)
+            pool.predict(np.zeros((1, 224, 224, 3), dtype=np.float32))
+            seconds, latencies = drive(pool.predict, args.clients, args.batch_size, args.requests)
+            report(f"{workers} worker(s)", seconds, latencies, args.batch_size, baseline)
+        finally:
+            pool.close()
+
+
+if __name__ == "__main__":
+    main()
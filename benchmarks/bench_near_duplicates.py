@@ -0,0 +1,155 @@
+"""Benchmark the near-duplicate index: lookup latency vs. index size, and pHash robustness.
+
+For each index size, fills a NearDuplicateIndex with synthetic 64-bit hashes
+(a fifth of them near-copies of earlier ones, as repeat uploads would be),
+then times within() (multi-index hashing, or a full scan while the index is
+small) against the brute-force popcount scan over every entry, on queries that are half near-duplicates and half
+misses. Both must return the same rows. Also reports the chunk table build
+time, the index's memory and the add() rate.
+
+The robustness table hashes synthetic photos through the app's own
+preprocessing and lists the Hamming distance to variants of the same photo
+(recompressed, rescaled, cropped, brightened) and to unrelated photos.
+
+    python benchmarks/bench_near_duplicates.py [--sizes 10000 100000 1000000] [--queries 500] [--radius 6]
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image, ImageEnhance
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from near_duplicates import NearDuplicateIndex, hamming, perceptual_hash  # noqa: E402
+from preprocessing import preprocess_bytes  # noqa: E402
+
+
+def flip_bits(hashes, bits, rng):
+    """Each hash with ``bits`` (an array, per hash) distinct random bits flipped"""
+    out = hashes.copy()
+    for i, count in enumerate(bits.tolist()):
+        for bit in rng.choice(64, size=count, replace=False).tolist():
+            out[i] ^= np.uint64(1 << bit)
+    return out
+
+
+def synthetic_hashes(n, radius, rng):
+    hashes = rng.integers(0, 2 ** 64, size=n, dtype=np.uint64)
+    repeats = rng.choice(np.arange(1, n), size=n // 5, replace=False) if n > 1 else np.empty(0, dtype=np.int64)
+    sources = (rng.random(len(repeats)) * repeats).astype(np.int64)
+    hashes[repeats] = flip_bits(hashes[sources], rng.integers(0, radius + 1, size=len(repeats)), rng)
+    return hashes
+
+
+def filled_index(hashes, radius):
+    index = NearDuplicateIndex(radius=radius, max_entries=len(hashes), capacity=len(hashes))
+    n = len(hashes)
+    index.add_many(hashes, np.full(n, 0.5, dtype=np.float32), np.arange(n) % 1000, np.full(n, time.time()),
+                   np.ones(n, dtype=bool))
+    while index.stats()["rebuilding"]:  # let the background rebuild that add_many started finish
+        time.sleep(0.01)
+    return index
+
+
+def lookup_table(args, rng):
+    print(f"{'entries':>10}{'build ms':>10}{'MiB':>8}{'index us':>10}{'p99 us':>9}{'brute us':>10}"
+          f"{'speedup':>9}{'add/s':>10}{'same':>6}")
+    for n in args.sizes:
+        hashes = synthetic_hashes(n, args.radius, rng)
+        index = filled_index(hashes, args.radius)
+        started = time.perf_counter()
+        index.rebuild()
+        build_ms = (time.perf_counter() - started) * 1000.0
+
+        picks = rng.integers(0, n, size=args.queries // 2)
+        near = flip_bits(hashes[picks], rng.integers(0, args.radius + 1, size=len(picks)), rng)
+        misses = rng.integers(0, 2 ** 64, size=args.queries - len(near), dtype=np.uint64)
+        queries = [int(q) for q in np.concatenate([near, misses])]
+
+        latencies = []
+        for q in queries:
+            started = time.perf_counter()
+            index.within(q)
+            latencies.append((time.perf_counter() - started) * 1e6)
+        brute_queries = queries[:max(1, min(len(queries), args.brute_limit * 1_000_000 // n))]
+        started = time.perf_counter()
+        for q in brute_queries:
+            index.within_brute_force(q)
+        brute_us = (time.perf_counter() - started) * 1e6 / len(brute_queries)
+
+        same = all(np.array_equal(np.sort(index.within(q)[0]), index.within_brute_force(q)[0])
+                   for q in queries[:args.check])
+
+        # Entries added after the last rebuild: scanned directly until the next one
+        extra = rng.integers(0, 2 ** 64, size=2000, dtype=np.uint64)
+        started = time.perf_counter()
+        for h in extra.tolist():
+            index.add(h, 0.5, 1)
+        add_rate = len(extra) / (time.perf_counter() - started)
+
+        mib = index.stats()["bytes"] / 2 ** 20
+        mih_us = float(np.mean(latencies))
+        print(f"{n:>10}{build_ms:>10.1f}{mib:>8.1f}{mih_us:>10.1f}{np.percentile(latencies, 99):>9.1f}"
+              f"{brute_us:>10.1f}{brute_us / mih_us:>8.1f}x{add_rate:>10.0f}{'yes' if same else 'NO':>6}")
+
+
+def photo(seed, size=(640, 480)):
+    # Smooth random colour fields: enough low-frequency structure for the DCT to see
+    rng = np.random.default_rng(seed)
+    return Image.fromarray((rng.random((9, 12, 3)) * 255).astype(np.uint8)).resize(size, Image.BICUBIC)
+
+
+def jpeg(image, quality=90):
+    buf = io.BytesIO()
+    image.save(buf, "JPEG", quality=quality)
+    return buf.getvalue()
+
+
+def robustness_table(photos):
+    variants = {
+        "jpeg q40": lambda im: jpeg(im, 40),
+        "half size": lambda im: jpeg(im.resize((im.width // 2, im.height // 2))),
+        "5% crop": lambda im: jpeg(im.crop((im.width // 40, im.height // 40,
+                                            im.width - im.width // 40, im.height - im.height // 40))),
+        "brighter 15%": lambda im: jpeg(ImageEnhance.Brightness(im).enhance(1.15)),
+    }
+    originals = [photo(seed) for seed in range(photos)]
+    arrays = [preprocess_bytes(jpeg(im)) for im in originals]
+    hashes = [perceptual_hash(a) for a in arrays]
+    started = time.perf_counter()
+    for a in arrays:
+        perceptual_hash(a)
+    hash_us = (time.perf_counter() - started) * 1e6 / len(arrays)
+
+    print(f"\npHash of a preprocessed image: {hash_us:.0f} us")
+    print(f"{'variant':>16}{'mean bits':>11}{'max bits':>10}")
+    for name, make in variants.items():
+        distances = [hamming(h, perceptual_hash(preprocess_bytes(make(im)))) for im, h in zip(originals, hashes)]
+        print(f"{name:>16}{np.mean(distances):>11.1f}{max(distances):>10}")
+    unrelated = [hamming(hashes[i], hashes[j]) for i in range(len(hashes)) for j in range(i + 1, len(hashes))]
+    print(f"{'unrelated':>16}{np.mean(unrelated):>11.1f}{'min ' + str(min(unrelated)):>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--radius", type=int, default=6)
+    parser.add_argument("--check", type=int, default=100, help="Queries checked against brute force")
+    parser.add_argument("--brute-limit", type=int, default=100,
+                        help="Brute-force queries at 1M entries (scaled up for smaller sizes)")
+    parser.add_argument("--photos", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    lookup_table(args, rng)
+    robustness_table(args.photos)
+
+
+if __name__ == "__main__":
+    main()
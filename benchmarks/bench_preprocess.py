@@ -0,0 +1,119 @@
+"""Compare the reference load_img preprocessing with the in-memory path.
+
+Reports per-image latency and peak RSS for each path, and checks that the
+in-memory output matches the reference (exactly without JPEG draft decoding,
+within a small mean error with it). Each path runs in its own subprocess and
+reports peak RSS, which covers PIL's decode buffers and TensorFlow's
+allocations, not only Python objects. On Linux the peak is reset after
+imports and reading the files, so it is the peak while preprocessing; the
+growth column is that peak minus the RSS just before.
+
+    python benchmarks/bench_preprocess.py [--images static/uploads] [--repeat 5]
+"""
+import argparse
+import glob
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PATHS = ("reference (load_img)", "bytes, no draft", "bytes + JPEG draft")
+
+
+def _status_kib(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return float(line.split()[1])
+    raise KeyError(field)
+
+
+def reset_peak_rss():
+    """Current RSS in KiB, with the peak reset to it where the OS allows (Linux 4.0+)"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return _status_kib("VmRSS")
+    except OSError:
+        return peak_rss_kib()
+
+
+def peak_rss_kib():
+    try:
+        return _status_kib("VmHWM")
+    except OSError:
+        # ru_maxrss is in KiB on Linux, bytes on macOS, and cannot be reset
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss / 1024.0 if sys.platform == "darwin" else float(rss)
+
+
+def image_paths(folder):
+    return sorted(p for p in glob.glob(os.path.join(folder, "*"))
+                  if p.lower().endswith((".jpg", ".jpeg", ".png", ".webp")))
+
+
+def measure(name, folder, repeat):
+    """Run one path in this process; returns ``(ms_per_image, peak_rss_kib, rss_growth_kib)``"""
+    from app import preprocess  # reference implementation
+    from preprocessing import preprocess_bytes, thread_buffer
+
+    paths = image_paths(folder)
+    blobs = [open(p, "rb").read() for p in paths]
+    fn, inputs = {
+        PATHS[0]: (preprocess, paths),
+        PATHS[1]: (lambda b: preprocess_bytes(b, thread_buffer(1), draft=False), blobs),
+        PATHS[2]: (lambda b: preprocess_bytes(b, thread_buffer(1)), blobs),
+    }[name]
+    baseline = reset_peak_rss()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for item in inputs:
+            fn(item)
+    elapsed = time.perf_counter() - started
+    peak = peak_rss_kib()
+    return elapsed / (repeat * len(inputs)) * 1000.0, peak, peak - baseline
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", default="static/uploads")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--child", choices=PATHS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child, args.images, args.repeat)))
+        return
+
+    paths = image_paths(args.images)
+    if not paths:
+        sys.exit(f"No images found in {args.images}")
+
+    from app import preprocess
+    from preprocessing import preprocess_bytes
+    blobs = [open(p, "rb").read() for p in paths]
+    exact_err = max(float(np.abs(preprocess(p) - preprocess_bytes(b, draft=False)).max())
+                    for p, b in zip(paths, blobs))
+    draft_err = max(float(np.abs(preprocess(p) - preprocess_bytes(b)).mean())
+                    for p, b in zip(paths, blobs))
+
+    print(f"{len(paths)} images x {args.repeat} repeats")
+    print(f"{'path':<22}{'ms/image':>10}{'peak RSS MiB':>14}{'growth MiB':>12}")
+    for name in PATHS:
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "--images", args.images,
+                              "--repeat", str(args.repeat), "--child", name],
+                             capture_output=True, text=True, check=True)
+        ms, peak, growth = json.loads(out.stdout.strip().splitlines()[-1])
+        print(f"{name:<22}{ms:>10.2f}{peak / 1024:>14.1f}{growth / 1024:>12.1f}")
+    print(f"max abs error without draft: {exact_err:.6f}")
+    print(f"worst mean abs error with draft: {draft_err:.6f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Benchmark process startup: import-to-first-response for each MODEL_WARMUP mode.
+
+Every run is a fresh interpreter (so imports are cold) with its own temporary
+database and upload folder. The child reports, in seconds since the process
+was spawned:
+
+- import:      ``import app`` finished
+- first page:  first response from a non-ML route (``/``)
+- model ready: ``/health`` reports the model as ready
+- first pred:  first ``/predict`` response (includes any remaining model load)
+
+    python benchmarks/bench_startup.py [--modes eager background lazy] [--runs 3]
+
+MODEL_PATH is honoured, so a stand-in model can be used when
+model/Sortify.h5 is absent.
+"""
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def child(spawned_at):
+    def since_spawn():
+        return round(time.time() - spawned_at, 3)
+
+    sys.path.insert(0, ROOT)
+    import app as appmod  # noqa: E402
+    result = {"import": since_spawn()}
+
+    from PIL import Image
+    client = appmod.app.test_client()
+    client.get("/")
+    result["first_page"] = since_spawn()
+
+    while True:
+        state = client.get("/health").get_json()["model"]["state"]
+        if state in ("ready", "failed") or appmod.app.config["MODEL_WARMUP"] == "lazy":
+            break
+        time.sleep(0.01)
+    result["model_ready"] = since_spawn() if state == "ready" else None
+
+    client.post("/signup", data={"name": "Bench", "email": "bench@example.com", "password": "pw", "wallet": "0xbench"})
+    buf = io.BytesIO()
+    Image.new("RGB", (640, 480), (40, 160, 60)).save(buf, "JPEG")
+    buf.seek(0)
+    response = client.post("/predict", data={"file": (buf, "bench.jpg")}, content_type="multipart/form-data")
+    result["first_pred"] = since_spawn() if response.status_code == 200 else None
+    if appmod.app.config["MODEL_WARMUP"] == "lazy":
+        result["model_ready"] = result["first_pred"]
+    print(json.dumps(result))
+
+
+def run_once(mode):
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ,
+                   MODEL_WARMUP=mode,
+                   DATABASE_PATH=os.path.join(tmp, "bench.db"),
+                   UPLOAD_FOLDER=os.path.join(tmp, "uploads"),
+                   TF_CPP_MIN_LOG_LEVEL="3")
+        env.setdefault("MODEL_PATH", os.path.join(ROOT, "model", "Sortify.h5"))
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", repr(time.time())],
+                             cwd=tmp, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def fmt(value):
+    return "   -  " if value is None else f"{value:6.2f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", nargs="+", default=["eager", "background", "lazy"])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--child", type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child is not None:
+        return child(args.child)
+
+    print(f"{'mode':<12}{'import s':>10}{'first page s':>14}{'model ready s':>15}{'first pred s':>14}")
+    for mode in args.modes:
+        runs = [run_once(mode) for _ in range(args.runs)]
+        best = {key: min((r[key] for r in runs if r[key] is not None), default=None)
+                for key in ("import", "first_page", "model_ready", "first_pred")}
+        print(f"{mode:<12}{fmt(best['import']):>10}{fmt(best['first_page']):>14}"
+              f"{fmt(best['model_ready']):>15}{fmt(best['first_pred']):>14}")
+    print(f"(best of {args.runs} cold starts per mode)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+"""Benchmark suite for the whole app, with JSON results to compare commits.
+
+Runs in one process against a scratch database and upload folder:
+
+- microbenchmarks of ``preprocess`` (the Keras reference path) and
+  ``preprocess_bytes``, ``interpret_prediction``, ``calculate_distance`` and
+  the nearby searches (plain and with each filter) on synthetic directories
+  of every ``--sizes`` row count;
+- a load test of ``/predict``, ``/dashboard``, ``/api/dashboard``, both
+  nearby APIs and ``/login`` through Flask test clients, one per thread, at
+  each ``--concurrency`` level, on the largest directory. Every /predict
+  upload is a distinct image, so none is served from the prediction cache,
+  and near-duplicate label reuse is kept off (NEAR_DUPLICATES=0, also the
+  default), so /predict measures the model every time.
+
+Without a model at MODEL_PATH a tiny stand-in Keras model (same input and
+output shape) is built in the scratch folder; its timings measure the app
+around the model, not the real network, and the results say which was used.
+
+    python benchmarks/bench_suite.py [--sizes 1000 100000] [--concurrency 1 8] [--seconds 5]
+                                     [--output results.json] [--baseline old.json]
+    python benchmarks/bench_suite.py --diff old.json new.json [--threshold 10]
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlparse
+
+import numpy as np
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CATEGORIES = ["Multiple", "Plastic", "E-Waste", "Paper", "Metal"]
+MATERIALS = ["Plastic, Paper", "plastics; e-waste", "Glass | cans", "Paper/Cardboard", "batteries, glass"]
+NAME_WORDS = ["Green", "Eco", "Clean", "City", "Recycling", "Hub", "Earth", "Waste", "Depot", "Collective"]
+
+# (name, method, path, expected status)
+ROUTES = [
+    ("predict", "POST", "/predict", 200),
+    ("dashboard", "GET", "/dashboard", 200),
+    ("api_dashboard", "GET", "/api/dashboard", 200),
+    ("nearby_recyclers", "GET", "/api/recyclers/nearby", 200),
+    ("nearby_centers", "GET", "/api/recycling-centers/nearby", 200),
+    ("login", "POST", "/login", 302),
+]
+
+
+def summarize(samples_s):
+    us = np.asarray(samples_s) * 1e6
+    return {"n": len(us), "mean_us": round(float(us.mean()), 2),
+            "p50_us": round(float(np.percentile(us, 50)), 2), "p99_us": round(float(np.percentile(us, 99)), 2)}
+
+
+def timed(fn, iterations, warmup=3):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        return f"{commit}-dirty" if dirty else commit
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_stand_in_model(path):
+    """A tiny model with Sortify's input and output shapes: (N, 224, 224, 3) -> (N, 2) softmax"""
+    from tensorflow import keras
+    model = keras.Sequential([
+        keras.Input(shape=(224, 224, 3)),
+        keras.layers.Conv2D(4, 3, strides=4, activation="relu"),
+        keras.layers.GlobalAveragePooling2D(),
+        keras.layers.Dense(2, activation="softmax"),
+    ])
+    model.save(path)
+
+
+def jpeg(rng, size=(320, 240)):
+    """A distinct JPEG each call (random colour plus noise), so uploads never repeat"""
+    pixels = np.empty((size[1], size[0], 3), dtype=np.uint8)
+    pixels[:] = [rng.randrange(256) for _ in range(3)]
+    pixels[:8, :8] = np.frombuffer(rng.randbytes(8 * 8 * 3), dtype=np.uint8).reshape(8, 8, 3)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, "JPEG", quality=90)
+    return buf.getvalue()
+
+
+def seed_directory(rows, rng):
+    """Replace both directory tables with ``rows`` synthetic facilities each, spread over India"""
+    import db
+
+    def place():
+        return rng.uniform(8.0, 35.0), rng.uniform(68.0, 97.0)
+
+    def name(i):
+        return f"{rng.choice(NAME_WORDS)} {rng.choice(NAME_WORDS)} {i}"
+
+    with db.transaction() as c:
+        c.execute("DELETE FROM recyclers")
+        c.execute("DELETE FROM recycling_centers")
+        c.executemany('''INSERT INTO recyclers (name, description, category, email, address, latitude, longitude,
+                                                city, accepts_recyclables)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                      [(name(i), "Collects household recyclables", rng.choice(CATEGORIES), f"r{i}@example.com",
+                        f"{i} Main Road", *place(), rng.choice(["Bangalore", "Pune", "Delhi"]),
+                        rng.random() < 0.9) for i in range(rows)])
+        c.executemany('''INSERT INTO recycling_centers (name, type, category, address, latitude, longitude,
+                                                        accepted_materials)
+                         VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                      [(name(i), rng.choice(["NGO", "Private", "Government"]), rng.choice(CATEGORIES),
+                        f"{i} Ring Road", *place(), rng.choice(MATERIALS)) for i in range(rows)])
+
+
+def run_micro(app, args, rng):
+    results = {}
+    image = jpeg(rng)
+    with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as f:
+        f.write(image)
+    try:
+        results["preprocess"] = timed(lambda: app.preprocess(f.name), args.iterations)
+    except ImportError as e:
+        print(f"skipping preprocess (reference path needs TensorFlow): {e}")
+    finally:
+        os.unlink(f.name)
+    results["preprocess_bytes"] = timed(lambda: app.preprocess_bytes(image), args.iterations)
+    binary, two_class = np.array([[0.7]]), np.array([[0.2, 0.8]])
+    results["interpret_prediction"] = timed(lambda: (app.interpret_prediction(binary),
+                                                     app.interpret_prediction(two_class)), args.iterations * 10)
+    results["calculate_distance"] = timed(lambda: app.calculate_distance(12.97, 77.59, 13.08, 80.27),
+                                          args.iterations * 10)
+
+    searches = {
+        "nearby_recyclers": lambda lat, lon: app.get_nearby_recyclers(lat, lon, 50),
+        "nearby_recyclers[q]": lambda lat, lon: app.get_nearby_recyclers(lat, lon, 50, query="green hub"),
+        "nearby_centers": lambda lat, lon: app.get_nearby_recycling_centers(lat, lon, 20),
+        "nearby_centers[category]": lambda lat, lon: app.get_nearby_recycling_centers(lat, lon, 20, "Plastic"),
+        "nearby_centers[materials]": lambda lat, lon: app.get_nearby_recycling_centers(
+            lat, lon, 20, materials="plastic,glass"),
+        "nearby_centers[q]": lambda lat, lon: app.get_nearby_recycling_centers(lat, lon, 20, query="eco depot"),
+    }
+    for rows in args.sizes:
+        started = time.perf_counter()
+        seed_directory(rows, rng)
+        app.directory.refresh()
+        print(f"seeded {rows} recyclers and {rows} centers in {time.perf_counter() - started:.1f}s")
+        points = [(rng.uniform(10.0, 30.0), rng.uniform(72.0, 90.0)) for _ in range(args.iterations)]
+        for label, search in searches.items():
+            queue = iter(points * 2)
+            results[f"{label}@{rows}"] = timed(lambda: search(*next(queue)), args.iterations)
+    return results
+
+
+def login_client(app, rng):
+    """A test client with a freshly signed-up (and so logged-in) user, plus its credentials"""
+    client = app.app.test_client()
+    email = f"bench{time.time_ns()}{rng.randrange(10 ** 6)}@example.com"
+    client.post("/signup", data={"name": "Bench", "email": email, "password": "bench-pw", "wallet": "0xbench"})
+    return client, email
+
+
+def send(app, client, route, email, rng, upload=None):
+    name, method, path, _ = route
+    if name == "predict":
+        return client.post(path, data={"file": (io.BytesIO(upload), "bench.jpg")}, content_type="multipart/form-data")
+    if name == "login":
+        # A client without a session, as a user signing in
+        return app.app.test_client().post(path, data={"email": email, "password": "bench-pw"})
+    if name.startswith("nearby"):
+        return client.get(path, query_string={"lat": rng.uniform(10.0, 30.0), "lon": rng.uniform(72.0, 90.0),
+                                              "max_distance": 50})
+    return client.get(path)
+
+
+def load_route(app, route, concurrency, seconds, seed):
+    clients = [login_client(app, random.Random(seed + i)) for i in range(concurrency)]
+    latencies = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+    start = threading.Barrier(concurrency + 1)
+    deadline = [0.0]
+
+    def worker(i):
+        rng = random.Random(seed * 1000 + i)
+        client, email = clients[i]
+        start.wait()
+        while time.perf_counter() < deadline[0]:
+            upload = jpeg(rng) if route[0] == "predict" else None  # built outside the timed call
+            started = time.perf_counter()
+            try:
+                response = send(app, client, route, email, rng, upload)
+                ok = response.status_code == route[3]
+                if route[0] == "login":
+                    # Both outcomes redirect: success to the landing page, failure back to the form
+                    ok = ok and urlparse(response.headers.get("Location", "")).path == "/"
+            except Exception:
+                ok = False
+            latencies[i].append(time.perf_counter() - started)
+            errors[i] += not ok
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    deadline[0] = time.perf_counter() + seconds
+    started = time.perf_counter()
+    start.wait()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    samples = [sample for worker_samples in latencies for sample in worker_samples]
+    result = summarize(samples) if samples else {"n": 0}
+    result.update(req_per_s=round(len(samples) / elapsed, 1), errors=sum(errors))
+    return result
+
+
+def run_load(app, args):
+    results = {}
+    for route in ROUTES:
+        for concurrency in args.concurrency:
+            result = load_route(app, route, concurrency, args.seconds, seed=len(results))
+            results[f"{route[0]}@c{concurrency}"] = result
+            print(f"{route[0]:<20}{concurrency:>6}{result['req_per_s']:>10.1f}"
+                  f"{result.get('p50_us', 0) / 1000:>10.2f}{result.get('p99_us', 0) / 1000:>10.2f}"
+                  f"{result['errors']:>8}", flush=True)
+    return results
+
+
+def compare(old, new, threshold):
+    """Print every metric in both results with its change; returns the number of regressions"""
+    regressions = 0
+    print(f"{'metric':<40}{'old':>12}{'new':>12}{'change':>10}")
+    for section, key, worse in (("micro", "p50_us", 1), ("load", "req_per_s", -1), ("load", "p99_us", 1)):
+        for name, result in new.get(section, {}).items():
+            before = old.get(section, {}).get(name, {}).get(key)
+            after = result.get(key)
+            if not before or after is None:
+                continue
+            change = (after - before) / before * 100.0
+            flag = ""
+            if change * worse > threshold:
+                flag = "  REGRESSION"
+                regressions += 1
+            print(f"{name + ' ' + key:<40}{before:>12.1f}{after:>12.1f}{change:>+9.1f}%{flag}")
+    print(f"{regressions} regression(s) beyond {threshold:g}%"
+          f" ({old['meta'].get('commit')} -> {new['meta'].get('commit')})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000], help="directory rows per table")
+    parser.add_argument("--iterations", type=int, default=200, help="timed calls per microbenchmark")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--seconds", type=float, default=5.0, help="per route and concurrency level")
+    parser.add_argument("--skip", nargs="+", choices=("micro", "load"), default=[])
+    parser.add_argument("--output", help="JSON results path (default: bench-<commit>.json)")
+    parser.add_argument("--baseline", help="compare these results with an earlier JSON file")
+    parser.add_argument("--diff", nargs=2, metavar=("OLD", "NEW"), help="only compare two JSON files")
+    parser.add_argument("--threshold", type=float, default=10.0, help="percent change reported as a regression")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.diff:
+        with open(args.diff[0]) as old, open(args.diff[1]) as new:
+            sys.exit(1 if compare(json.load(old), json.load(new), args.threshold) else 0)
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as scratch:
+        os.environ["DATABASE_PATH"] = os.path.join(scratch, "bench.db")
+        os.environ["UPLOAD_FOLDER"] = os.path.join(scratch, "uploads")
+        os.environ["MODEL_WARMUP"] = "lazy"
+        os.environ["NEAR_DUPLICATES"] = "0"
+        model = os.environ.get("MODEL_PATH", os.path.join(ROOT, "model", "Sortify.h5"))
+        if not os.path.exists(model):
+            model = os.path.join(scratch, "stand_in.h5")
+            build_stand_in_model(model)
+            os.environ["MODEL_PATH"] = model
+            model_kind = "stand-in"
+        else:
+            os.environ["MODEL_PATH"] = model
+            model_kind = "model"
+        import app
+        app.ensure_started()
+        app.model_loader.get()
+
+        results = {"meta": {
+            "commit": git_commit(),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "model": model_kind,
+            "model_path": model if model_kind == "model" else None,
+            "sizes": args.sizes,
+            "load_rows": max(args.sizes),
+        }}
+        print(f"commit {results['meta']['commit']}, {model_kind} model, Python {results['meta']['python']}, "
+              f"SQLite {results['meta']['sqlite']}")
+        if "micro" not in args.skip:
+            results["micro"] = run_micro(app, args, rng)
+            print(f"{'microbenchmark':<36}{'p50 us':>12}{'p99 us':>12}")
+            for name, result in results["micro"].items():
+                print(f"{name:<36}{result['p50_us']:>12.1f}{result['p99_us']:>12.1f}")
+        else:
+            seed_directory(max(args.sizes), rng)
+            app.directory.refresh()
+        if "load" not in args.skip:
+            print(f"{'route':<20}{'conc':>6}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+            results["load"] = run_load(app, args)
+        app.activity_log.close()
+
+    output = args.output or f"bench-{results['meta']['commit'] or 'results'}.json"
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print(f"wrote {output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(json.load(f), results, args.threshold)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""Confidence-aware classification: calibrated probabilities and test-time augmentation.
+
+The model's raw output row is read as P(recyclable) the same way
+``interpret_prediction`` reads it (the sigmoid output, or class 1's share of
+a softmax) and calibrated with temperature scaling. An image whose calibrated
+confidence is below ``threshold`` is classified again on a few augmented
+views (flips, a centre crop) submitted together, so they share one forward
+pass; the outputs of all views are averaged. Confident images stay single-pass.
+"""
+import threading
+
+import numpy as np
+
+from metrics import Histogram
+
+VIEWS = ("hflip", "vflip", "crop", "hflip_crop")
+DEFAULT_VIEWS = ("hflip", "crop", "hflip_crop")
+CROP_FRACTION = 0.875
+EPSILON = 1e-7
+
+
+def recyclable_probability(preds):
+    """Uncalibrated P(recyclable) from one raw output row (``(k,)`` or ``(1, k)``)"""
+    row = np.asarray(preds, dtype=np.float64)
+    row = row[0] if row.ndim == 2 else row.reshape(-1)
+    if row.shape[0] == 1:
+        return float(row[0])
+    total = row.sum()
+    return float(row[1] / total) if total > 0 else 0.0
+
+
+def calibrate(probability, temperature):
+    """Temperature scaling: divide the logit by ``temperature`` (>1 softens, <1 sharpens)"""
+    if temperature == 1.0:
+        return probability
+    p = np.clip(probability, EPSILON, 1.0 - EPSILON)
+    return 1.0 / (1.0 + np.exp(-np.log(p / (1.0 - p)) / temperature))
+
+
+def negative_log_likelihood(probabilities, labels, temperature=1.0):
+    p = np.clip(calibrate(np.asarray(probabilities, dtype=np.float64), temperature), EPSILON, 1.0 - EPSILON)
+    labels = np.asarray(labels, dtype=np.float64)
+    return float(-np.mean(labels * np.log(p) + (1.0 - labels) * np.log(1.0 - p)))
+
+
+def fit_temperature(probabilities, labels):
+    """Temperature minimizing the negative log-likelihood of ``labels`` (1 = recyclable), on a log grid"""
+    grid = np.logspace(-1.0, 1.0, 201)
+    losses = [negative_log_likelihood(probabilities, labels, t) for t in grid]
+    return float(grid[int(np.argmin(losses))])
+
+
+def expected_calibration_error(probabilities, labels, bins=10):
+    """Mean |accuracy - confidence| over confidence bins, weighted by bin size"""
+    probabilities = np.asarray(probabilities, dtype=np.float64)
+    labels = np.asarray(labels)
+    predicted = probabilities > 0.5
+    confidence = np.where(predicted, probabilities, 1.0 - probabilities)
+    correct = predicted == (labels == 1)
+    edges = np.linspace(0.5, 1.0, bins + 1)
+    which = np.clip(np.digitize(confidence, edges[1:-1]), 0, bins - 1)
+    error = 0.0
+    for b in range(bins):
+        in_bin = which == b
+        if in_bin.any():
+            error += in_bin.mean() * abs(correct[in_bin].mean() - confidence[in_bin].mean())
+    return float(error)
+
+
+def _crop_indices(size, fraction):
+    # Nearest-neighbour resize of the centred crop back to ``size`` pixels
+    crop = size * fraction
+    offset = (size - crop) / 2.0
+    return np.minimum((offset + (np.arange(size) + 0.5) * crop / size).astype(np.intp), size - 1)
+
+
+def augmented_views(image, views=DEFAULT_VIEWS):
+    """``(len(views), H, W, C)`` float32 views of one preprocessed ``(H, W, C)`` or ``(1, H, W, C)`` image"""
+    image = np.asarray(image, dtype=np.float32)
+    if image.ndim == 4:
+        image = image[0]
+    out = np.empty((len(views),) + image.shape, dtype=np.float32)
+    rows = _crop_indices(image.shape[0], CROP_FRACTION)
+    cols = _crop_indices(image.shape[1], CROP_FRACTION)
+    for i, view in enumerate(views):
+        if view == "hflip":
+            out[i] = image[:, ::-1]
+        elif view == "vflip":
+            out[i] = image[::-1]
+        elif view == "crop":
+            out[i] = image[np.ix_(rows, cols)]
+        elif view == "hflip_crop":
+            out[i] = image[np.ix_(rows, cols)][:, ::-1]
+        else:
+            raise ValueError(f"Unknown view {view!r}; choose from {', '.join(VIEWS)}")
+    return out
+
+
+class ConfidenceEstimator:
+    """Calibrated probabilities plus the escalation decision and its counters."""
+
+    def __init__(self, temperature=1.0, threshold=0.0, views=DEFAULT_VIEWS):
+        self.temperature = float(temperature) if temperature and temperature > 0 else 1.0
+        self.threshold = float(threshold)
+        self.views = tuple(views)
+        for view in self.views:
+            if view not in VIEWS:
+                raise ValueError(f"Unknown view {view!r}; choose from {', '.join(VIEWS)}")
+        self._lock = threading.Lock()
+        self.predictions = 0
+        self.escalated = 0
+        self.flipped = 0
+        self.confidence_hist = Histogram((0.55, 0.6, 0.65, 0.7, 0.75, 0.8, 0.85, 0.9, 0.95, 0.99, 1.0))
+
+    @property
+    def enabled(self):
+        return self.threshold > 0 and bool(self.views)
+
+    @property
+    def identity(self):
+        """Part of the prediction cache key: cached outputs depend on the augmentation settings"""
+        return f"tta<{self.threshold:g}:{','.join(self.views)}" if self.enabled else ""
+
+    def probability(self, preds):
+        """Calibrated P(recyclable)"""
+        return float(calibrate(recyclable_probability(preds), self.temperature))
+
+    def confidence(self, preds):
+        p = self.probability(preds)
+        return max(p, 1.0 - p)
+
+    def escalate(self, preds):
+        """Count one single-pass prediction; True if it is below the confidence threshold"""
+        confidence = self.confidence(preds)
+        self.confidence_hist.observe(confidence)
+        escalate = self.enabled and confidence < self.threshold
+        with self._lock:
+            self.predictions += 1
+            self.escalated += escalate
+        return escalate
+
+    def augmented_views(self, image):
+        return augmented_views(image, self.views)
+
+    def refine(self, preds, view_preds):
+        """The mean output over the original and its views, as a ``(1, k)`` row"""
+        preds = np.asarray(preds, dtype=np.float64).reshape(1, -1)
+        refined = np.concatenate([preds, np.asarray(view_preds, dtype=np.float64).reshape(len(view_preds), -1)])
+        refined = refined.mean(axis=0, keepdims=True)
+        if (recyclable_probability(preds) > 0.5) != (recyclable_probability(refined) > 0.5):
+            with self._lock:
+                self.flipped += 1
+        return refined
+
+    def stats(self):
+        with self._lock:
+            return {
+                "temperature": self.temperature,
+                "threshold": self.threshold,
+                "views": list(self.views),
+                "predictions": self.predictions,
+                "escalated": self.escalated,
+                "escalation_rate": round(self.escalated / self.predictions, 4) if self.predictions else None,
+                "flipped": self.flipped,
+                "confidence": self.confidence_hist.snapshot(),
+            }
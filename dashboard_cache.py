@@ -0,0 +1,203 @@
+"""Per-user dashboard payloads, cached until the user's activity changes.
+
+An entry holds the data the dashboard shows (recent activity, points,
+wallet) and an ETag derived from it. The activity writer calls
+``invalidate`` once a user's rows are committed, so the next view reloads.
+Every invalidation bumps a per-user version, and an entry loaded before
+the bump is never stored, so a read racing a write cannot cache stale data.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class DashboardEntry:
+    __slots__ = ("data", "etag")
+
+    def __init__(self, data, etag=None):
+        self.data = data
+        self.etag = etag or hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()[:20]
+
+
+class MemoryBackend:
+    """In-process LRU with TTL, for a single web process only.
+
+    Invalidations only reach this process: with several workers, the others
+    would serve stale points until the TTL expires, so the app refuses to
+    start that way (use RedisBackend). ``max_entries=0`` caches nothing.
+
+    Versions come from one counter and only the ``max_entries`` most
+    recently invalidated users keep their own; the others share the highest
+    version dropped so far. That can only make a version look newer, which
+    skips storing an entry, never stores a stale one.
+    """
+
+    name = "memory"
+
+    def __init__(self, max_entries=10000, ttl_seconds=300):
+        self.max_entries = max(0, int(max_entries))
+        self.ttl = float(ttl_seconds) if ttl_seconds else None
+        self._entries = OrderedDict()  # user_id -> (entry, stored_at)
+        self._versions = OrderedDict()  # user_id -> version, least recently invalidated first
+        self._clock = 0
+        self._floor = 0  # version of every user without an entry in _versions
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            item = self._entries.get(user_id)
+            if item is None:
+                return None
+            entry, stored_at = item
+            if self.ttl is not None and time.time() - stored_at > self.ttl:
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return entry
+
+    def version(self, user_id):
+        with self._lock:
+            return self._versions.get(user_id, self._floor)
+
+    def set(self, user_id, entry, version):
+        with self._lock:
+            if not self.max_entries or self._versions.get(user_id, self._floor) != version:
+                return  # caching disabled, or invalidated while the entry was loading
+            self._entries[user_id] = (entry, time.time())
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._clock += 1
+                self._versions[user_id] = self._clock
+                self._versions.move_to_end(user_id)
+                self._entries.pop(user_id, None)
+            while len(self._versions) > self.max_entries:
+                _, dropped = self._versions.popitem(last=False)
+                self._floor = max(self._floor, dropped)
+
+    def size(self):
+        return len(self._entries)
+
+
+class RedisBackend:
+    """Entries shared through Redis (or a compatible server), so every web process sees invalidations.
+
+    Each entry is stored with the version it was loaded at, and a read only
+    accepts it while that is still the user's current version.
+    """
+
+    name = "redis"
+
+    def __init__(self, url, ttl_seconds=300, prefix="sortify:dashboard:"):
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("DASHBOARD_CACHE_REDIS_URL needs the redis package (pip install redis)") from None
+        self.client = redis.Redis.from_url(url)
+        self.ttl = int(ttl_seconds) if ttl_seconds else None
+        self.prefix = prefix
+
+    def get(self, user_id):
+        raw, version = self.client.mget(self._key(user_id), self._version_key(user_id))
+        if raw is None:
+            return None
+        stored = json.loads(raw)
+        if stored["version"] != int(version or 0):
+            return None
+        return DashboardEntry(stored["data"], stored["etag"])
+
+    def version(self, user_id):
+        return int(self.client.get(self._version_key(user_id)) or 0)
+
+    def set(self, user_id, entry, version):
+        raw = json.dumps({"version": version, "etag": entry.etag, "data": entry.data}, default=str)
+        self.client.set(self._key(user_id), raw, ex=self.ttl)
+
+    def invalidate(self, user_ids):
+        pipe = self.client.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.incr(self._version_key(user_id))
+            pipe.delete(self._key(user_id))
+        pipe.execute()
+
+    def size(self):
+        return None
+
+    def _key(self, user_id):
+        return f"{self.prefix}{user_id}"
+
+    def _version_key(self, user_id):
+        return f"{self.prefix}{user_id}:version"
+
+
+class DashboardCache:
+    """Load-through cache of ``loader(user_id)`` results.
+
+    Backend errors (e.g. Redis unreachable) are counted and the data is
+    loaded straight from the database instead.
+    """
+
+    def __init__(self, loader, backend):
+        self.loader = loader
+        self.backend = backend
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    def get(self, user_id):
+        """The user's DashboardEntry, loaded on a miss"""
+        try:
+            entry = self.backend.get(user_id)
+            version = self.backend.version(user_id) if entry is None else None
+        except Exception as e:
+            self._error("reading", e)
+            return DashboardEntry(self.loader(user_id))
+        if entry is not None:
+            with self._lock:
+                self.hits += 1
+            return entry
+
+        with self._lock:
+            self.misses += 1
+        entry = DashboardEntry(self.loader(user_id))
+        try:
+            self.backend.set(user_id, entry, version)
+        except Exception as e:
+            self._error("storing", e)
+        return entry
+
+    def invalidate(self, user_ids):
+        """Drop the entries of users whose activity changed"""
+        user_ids = set(user_ids)
+        if not user_ids:
+            return
+        try:
+            self.backend.invalidate(user_ids)
+        except Exception as e:
+            self._error("invalidating", e)
+        with self._lock:
+            self.invalidations += len(user_ids)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": self.backend.name,
+                "entries": self.backend.size(),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "errors": self.errors,
+            }
+
+    def _error(self, action, error):
+        with self._lock:
+            self.errors += 1
+        print(f"Error {action} dashboard cache: {error}")
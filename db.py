@@ -0,0 +1,155 @@
+"""Shared SQLite access layer: pooled, tuned connections in WAL mode.
+
+Request handlers call get_db() and the connection is leased to the current
+thread until release() (wired to Flask's teardown), then returned to the
+pool. Background threads simply keep their lease.
+"""
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+DATABASE = os.environ.get("DATABASE_PATH", "users.db")
+BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+CACHE_SIZE_KIB = int(os.environ.get("SQLITE_CACHE_SIZE_KIB", "16384"))
+MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+POOL_MAX_IDLE = int(os.environ.get("SQLITE_POOL_MAX_IDLE", "16"))
+STATEMENT_CACHE_SIZE = 256
+LOCK_RETRIES = 5
+
+_local = threading.local()
+_pools = {}
+_pools_lock = threading.Lock()
+_generation = 0  # bumped by close_all() so threads drop leases on closed connections
+stats = {"connections_opened": 0, "connections_reused": 0, "lock_retries": 0}
+
+
+def connect(path=None):
+    """Open a tuned connection in autocommit mode; use transaction() for writes"""
+    conn = sqlite3.connect(path or DATABASE,
+                           timeout=BUSY_TIMEOUT_MS / 1000.0,
+                           isolation_level=None,
+                           check_same_thread=False,
+                           cached_statements=STATEMENT_CACHE_SIZE)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB}")
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    stats["connections_opened"] += 1
+    return conn
+
+
+class ConnectionPool:
+    """Idle connections to one database file, handed out one thread at a time."""
+
+    def __init__(self, path, max_idle=POOL_MAX_IDLE):
+        self.path = path
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self._idle:
+                stats["connections_reused"] += 1
+                return self._idle.pop()
+        return connect(self.path)
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+def _pool(path):
+    with _pools_lock:
+        pool = _pools.get(path)
+        if pool is None:
+            pool = _pools[path] = ConnectionPool(path)
+        return pool
+
+
+def _leases():
+    leases = getattr(_local, "leases", None)
+    if leases is None or _local.generation != _generation:
+        leases = _local.leases = {}
+        _local.generation = _generation
+    return leases
+
+
+def get_db(path=None):
+    """The connection leased to this thread for ``path`` (default: the app database).
+
+    Statements run on a reused connection hit its prepared-statement cache.
+    """
+    path = path or DATABASE
+    leases = _leases()
+    conn = leases.get(path)
+    if conn is None:
+        conn = leases[path] = _pool(path).acquire()
+    return conn
+
+
+def release():
+    """Return this thread's connections to their pools (end of request)"""
+    leases = _leases()
+    for path, conn in leases.items():
+        _pool(path).release(conn)
+    leases.clear()
+
+
+@contextmanager
+def transaction(path=None):
+    """Run a block as one write transaction, taking the write lock up front.
+
+    ``BEGIN IMMEDIATE`` avoids the read-to-write lock upgrade that makes
+    concurrent writers fail with "database is locked"; acquiring it waits up
+    to the busy timeout and is retried with backoff after that.
+    """
+    conn = get_db(path)
+    for attempt in range(LOCK_RETRIES):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            break
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e) or attempt == LOCK_RETRIES - 1:
+                raise
+            stats["lock_retries"] += 1
+            time.sleep(0.05 * (2 ** attempt))
+    try:
+        yield conn.cursor()
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def query_one(sql, params=(), path=None):
+    return get_db(path).execute(sql, params).fetchone()
+
+
+def query_all(sql, params=(), path=None):
+    return get_db(path).execute(sql, params).fetchall()
+
+
+def close_all():
+    """Close pooled connections (process shutdown / tests)"""
+    global _generation
+    with _pools_lock:
+        _generation += 1
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close()
@@ -0,0 +1,449 @@
+"""Bulk import of recycler / recycling-center datasets (CSV, GeoJSON, GeoJSON Lines).
+
+Input is streamed record by record, validated and normalized, and upserted
+in chunks of ``chunk_size`` rows per transaction, keyed on ``import_key``
+(``<source>:<external id>``) so re-importing a dataset updates its rows in
+place. While an import runs, the table's search-index and directory-version
+triggers are dropped; they are recreated, the search indexes rebuilt and the
+directory version bumped once at the end, so the in-memory directory
+reloads a single time.
+
+Each chunk's transaction also records how many input records are done in
+``directory_imports``, so an interrupted import of the same file resumes
+after the last committed chunk. Runs record the pid of the process doing
+them; a run left "running" is only treated as crashed once that process is
+gone.
+"""
+import csv
+import hashlib
+import json
+import math
+import os
+import re
+import time
+
+import db
+from directory_search import ensure_search_indexes, normalize_materials, rebuild_search_indexes, search_triggers
+from recycler_directory import DIRECTORY_TABLES, Recycler, RecyclingCenter, ensure_directory_version
+
+RUNNING = "running"
+INTERRUPTED = "interrupted"
+COMPLETED = "completed"
+FAILED = "failed"
+
+FORMATS = ("csv", "geojson", "geojsonl")
+FORMAT_EXTENSIONS = {".csv": "csv", ".geojson": "geojson", ".json": "geojson",
+                     ".geojsonl": "geojsonl", ".geojsons": "geojsonl", ".ndjson": "geojsonl", ".jsonl": "geojsonl"}
+
+# Imported columns per table (everything but id)
+TABLE_COLUMNS = {
+    "recyclers": Recycler._fields[1:],
+    "recycling_centers": RecyclingCenter._fields[1:],
+}
+
+# Accepted spellings of each column in the input, compared lower-cased
+FIELD_ALIASES = {
+    "latitude": ("latitude", "lat", "y"),
+    "longitude": ("longitude", "lon", "lng", "long", "x"),
+    "accepted_materials": ("accepted_materials", "materials", "accepts", "waste_types"),
+    "contact_email": ("contact_email", "email"),
+    "contact_phone": ("contact_phone", "phone", "telephone"),
+    "email": ("email", "contact_email"),
+    "phone": ("phone", "contact_phone", "telephone"),
+    "operating_hours": ("operating_hours", "opening_hours", "hours"),
+    "website": ("website", "url"),
+    "type": ("type", "operator_type", "operator"),
+    "city": ("city", "town", "municipality"),
+}
+EXTERNAL_ID_FIELDS = ("external_id", "source_id", "id", "facility_id")
+
+_TRUE = ("1", "true", "yes", "y", "t")
+_FALSE = ("0", "false", "no", "n", "f")
+MAX_REJECT_SAMPLES = 10
+
+
+class RowRejected(ValueError):
+    """An input record that cannot be imported; the message is the reason."""
+
+
+def ensure_import_tables(c):
+    """Upsert keys on both directory tables, the run log, and recovery after a crashed import"""
+    for table in DIRECTORY_TABLES:
+        c.execute(f"PRAGMA table_info({table})")
+        if "import_key" not in {row[1] for row in c.fetchall()}:
+            c.execute(f"ALTER TABLE {table} ADD COLUMN import_key TEXT")
+        c.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_import_key ON {table} (import_key)")
+    c.execute('''CREATE TABLE IF NOT EXISTS directory_imports
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  fingerprint TEXT NOT NULL,
+                  source TEXT NOT NULL,
+                  target_table TEXT NOT NULL,
+                  format TEXT NOT NULL,
+                  status TEXT NOT NULL,
+                  rows_done INTEGER NOT NULL DEFAULT 0,
+                  inserted INTEGER NOT NULL DEFAULT 0,
+                  updated INTEGER NOT NULL DEFAULT 0,
+                  rejected INTEGER NOT NULL DEFAULT 0,
+                  error TEXT,
+                  owner_pid INTEGER,
+                  started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                  finished_at TIMESTAMP)''')
+    c.execute("PRAGMA table_info(directory_imports)")
+    if "owner_pid" not in {row[1] for row in c.fetchall()}:
+        c.execute("ALTER TABLE directory_imports ADD COLUMN owner_pid INTEGER")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_directory_imports_fingerprint ON directory_imports (fingerprint, status)")
+
+    # A process killed mid-import leaves its chunks committed but the search indexes
+    # and directory version untouched (the caller has just recreated the triggers).
+    # Runs whose process is still alive, e.g. a CLI import, are left alone.
+    c.execute("SELECT id, target_table, owner_pid FROM directory_imports WHERE status = ?", (RUNNING,))
+    stale = [(run_id, table) for run_id, table, pid in c.fetchall() if not owner_alive(pid)]
+    for table in sorted({table for _, table in stale}):
+        rebuild_search_indexes(c, table)
+    if stale:
+        c.execute("UPDATE directory_version SET version = version + 1 WHERE id = 1")
+        c.executemany("UPDATE directory_imports SET status = ? WHERE id = ?",
+                      [(INTERRUPTED, run_id) for run_id, _ in stale])
+
+
+def tables_being_imported(c):
+    """Directory tables a live process is importing into; their triggers stay dropped until it is done"""
+    c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'directory_imports'")
+    if c.fetchone() is None:
+        return set()
+    c.execute("PRAGMA table_info(directory_imports)")
+    if "owner_pid" not in {row[1] for row in c.fetchall()}:
+        return set()  # no run of this version has started yet
+    c.execute("SELECT target_table, owner_pid FROM directory_imports WHERE status = ?", (RUNNING,))
+    return {table for table, pid in c.fetchall() if owner_alive(pid)}
+
+
+def owner_alive(pid):
+    """Whether another process with this pid is running (runs from before owner_pid count as dead).
+
+    Our own pid counts as dead: this process has no import running when it
+    checks, so a match is a crashed run of an earlier process that had the
+    same pid, as happens when a container restarts.
+    """
+    if not pid or pid == os.getpid():
+        return False
+    if os.name == "nt":
+        return False  # os.kill(pid, 0) would terminate the process on Windows
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # alive, owned by another user
+    return True
+
+
+def detect_format(path):
+    fmt = FORMAT_EXTENSIONS.get(os.path.splitext(path)[1].lower())
+    if fmt is None:
+        raise ValueError(f"Cannot tell the format of {path!r}; pass one of {', '.join(FORMATS)}")
+    return fmt
+
+
+def file_fingerprint(path, table, fmt, source):
+    """sha256 of the file contents plus the import options that shape its rows"""
+    digest = hashlib.sha256(f"{table}\0{fmt}\0{source}\0".encode())
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Readers: each yields one dict of raw fields per input record
+
+def iter_csv(f):
+    for row in csv.DictReader(f):
+        yield {(key or "").strip().lower(): value for key, value in row.items()}
+
+
+def iter_geojson(f, read_size=1 << 16):
+    """Features of a GeoJSON FeatureCollection, decoded one at a time without loading the file"""
+    decoder = json.JSONDecoder()
+    buf = ""
+    start = re.compile(r'"features"\s*:\s*\[')
+    while True:
+        match = start.search(buf)
+        if match:
+            break
+        chunk = f.read(read_size)
+        if not chunk:
+            raise ValueError('GeoJSON input has no "features" array')
+        buf += chunk
+    separators = re.compile(r"[\s,]*")
+    pos = match.end()
+    while True:
+        pos = separators.match(buf, pos).end()
+        if pos < len(buf) and buf[pos] == "]":
+            return
+        try:
+            feature, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            chunk = f.read(read_size)
+            if not chunk:
+                raise ValueError("GeoJSON features array is malformed or truncated") from None
+            buf = buf[pos:] + chunk
+            pos = 0
+            continue
+        yield _feature_fields(feature)
+        pos = end
+
+
+def iter_geojsonl(f):
+    for line in f:
+        line = line.strip()
+        if line:
+            yield _feature_fields(json.loads(line))
+
+
+def _feature_fields(feature):
+    if not isinstance(feature, dict):
+        return {"_error": "feature is not an object"}
+    fields = {str(key).strip().lower(): value for key, value in (feature.get("properties") or {}).items()}
+    if feature.get("id") is not None:
+        fields.setdefault("id", feature["id"])
+    geometry = feature.get("geometry") or {}
+    if geometry.get("type") == "Point" and len(geometry.get("coordinates") or ()) >= 2:
+        fields["longitude"], fields["latitude"] = geometry["coordinates"][:2]
+    elif geometry:
+        fields["_error"] = f"geometry is a {geometry.get('type')}, not a Point"
+    return fields
+
+
+READERS = {"csv": iter_csv, "geojson": iter_geojson, "geojsonl": iter_geojsonl}
+
+
+# Normalization
+
+def parse_coordinate(value, limit, name):
+    if isinstance(value, str):
+        value = value.strip()
+        if "," in value and "." not in value:
+            value = value.replace(",", ".")  # decimal comma
+    if value is None or value == "":
+        raise RowRejected(f"missing {name}")
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise RowRejected(f"{name} is not a number") from None
+    if not math.isfinite(number) or abs(number) > limit:
+        raise RowRejected(f"{name} out of range")
+    return round(number, 6)
+
+
+def _text(value):
+    if value is None:
+        return None
+    value = " ".join(str(value).split())
+    return value or None
+
+
+def _field(fields, column):
+    for alias in FIELD_ALIASES.get(column, (column,)):
+        value = fields.get(alias)
+        if value is not None and value != "":
+            return value
+    return None
+
+
+def normalize_record(fields, table, source):
+    """``(import_key, values)`` in TABLE_COLUMNS order, or RowRejected"""
+    if "_error" in fields:
+        raise RowRejected(fields["_error"])
+    name = _text(_field(fields, "name"))
+    if not name:
+        raise RowRejected("missing name")
+    lat = parse_coordinate(_field(fields, "latitude"), 90.0, "latitude")
+    lon = parse_coordinate(_field(fields, "longitude"), 180.0, "longitude")
+    if lat == 0.0 and lon == 0.0:
+        raise RowRejected("coordinates are 0,0")
+
+    row = {"name": name, "latitude": lat, "longitude": lon}
+    for column in TABLE_COLUMNS[table]:
+        if column not in row:
+            row[column] = _text(_field(fields, column))
+    if table == "recycling_centers":
+        row["accepted_materials"] = normalize_materials(_field(fields, "accepted_materials"))
+        row["type"] = row["type"] or "Unknown"
+    else:
+        accepts = _field(fields, "accepts_recyclables")
+        accepts = "1" if accepts is None else str(accepts).strip().lower()
+        if accepts not in _TRUE + _FALSE:
+            raise RowRejected("accepts_recyclables is not a boolean")
+        row["accepts_recyclables"] = accepts in _TRUE
+
+    external_id = next((_text(fields[key]) for key in EXTERNAL_ID_FIELDS if _text(fields.get(key))), None)
+    if external_id is None:
+        # No id in the dataset: the same facility at the same spot is the same row
+        external_id = hashlib.sha1(f"{name.lower()}|{lat:.5f}|{lon:.5f}".encode()).hexdigest()[:16]
+    return f"{source}:{external_id}", tuple(row[column] for column in TABLE_COLUMNS[table])
+
+
+# Deferred indexing
+
+def _drop_write_indexes(c, table):
+    for event in ("insert", "update", "delete"):
+        c.execute(f"DROP TRIGGER IF EXISTS {table}_version_{event}")
+    for trigger in search_triggers(table):
+        c.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+
+
+def _restore_write_indexes(c, table):
+    # Rebuild first (updated rows changed without the triggers), so the ensure_* check finds them complete
+    rebuild_search_indexes(c, table)
+    ensure_search_indexes(c, table)
+    ensure_directory_version(c)
+    c.execute("UPDATE directory_version SET version = version + 1 WHERE id = 1")
+
+
+class DirectoryImport:
+    """One import of one file into ``recyclers`` or ``recycling_centers``.
+
+    Creating it registers (or, unless ``restart``, resumes) a run in
+    ``directory_imports``; ``run()`` does the work and returns the report.
+    """
+
+    def __init__(self, path, table="recycling_centers", fmt=None, source=None, chunk_size=5000,
+                 restart=False, db_path=None):
+        if table not in TABLE_COLUMNS:
+            raise ValueError(f"Unknown table {table!r} (choose from {', '.join(TABLE_COLUMNS)})")
+        self.path = path
+        self.table = table
+        self.fmt = fmt or detect_format(path)
+        if self.fmt not in READERS:
+            raise ValueError(f"Unknown format {self.fmt!r} (choose from {', '.join(FORMATS)})")
+        self.source = source or os.path.splitext(os.path.basename(path))[0]
+        self.chunk_size = max(1, int(chunk_size))
+        self.db_path = db_path
+
+        columns = TABLE_COLUMNS[table]
+        self._upsert_sql = (f"INSERT INTO {table} ({', '.join(columns)}, import_key) "
+                            f"VALUES ({', '.join('?' * (len(columns) + 1))}) "
+                            f"ON CONFLICT(import_key) DO UPDATE SET "
+                            + ", ".join(f"{column} = excluded.{column}" for column in columns))
+
+        self.fingerprint = file_fingerprint(path, table, self.fmt, self.source)
+        self.resumed_from = 0
+        with db.transaction(db_path) as c:
+            c.execute('''SELECT id, rows_done, inserted, updated, rejected, status, owner_pid FROM directory_imports
+                         WHERE fingerprint = ? AND status IN (?, ?, ?) ORDER BY id DESC LIMIT 1''',
+                      (self.fingerprint, RUNNING, INTERRUPTED, FAILED))
+            previous = c.fetchone()
+            if previous and previous[5] == RUNNING and owner_alive(previous[6]):
+                raise ValueError(f"{path} is already being imported by process {previous[6]} (run {previous[0]})")
+            if previous and not restart:
+                self.run_id, self.resumed_from, self.inserted, self.updated, self.rejected = previous[:5]
+                c.execute("UPDATE directory_imports SET status = ?, error = NULL, owner_pid = ? WHERE id = ?",
+                          (RUNNING, os.getpid(), self.run_id))
+            else:
+                c.execute('''INSERT INTO directory_imports
+                                 (fingerprint, source, target_table, format, status, owner_pid)
+                             VALUES (?, ?, ?, ?, ?, ?)''',
+                          (self.fingerprint, self.source, table, self.fmt, RUNNING, os.getpid()))
+                self.run_id = c.lastrowid
+                self.inserted = self.updated = self.rejected = 0
+        self.rows_done = self.resumed_from
+        self.reject_reasons = {}
+        self.reject_samples = []
+        self.status = RUNNING
+        self.seconds = 0.0
+
+    def run(self, progress=None):
+        """Import the remaining records; ``progress(report)`` is called after every chunk"""
+        started = time.perf_counter()
+        with db.transaction(self.db_path) as c:
+            _drop_write_indexes(c, self.table)
+        try:
+            chunk = []
+            seen = 0
+            with open(self.path, newline="", encoding="utf-8-sig") as f:
+                for seen, fields in enumerate(READERS[self.fmt](f), 1):
+                    if seen <= self.resumed_from:
+                        continue
+                    try:
+                        chunk.append(normalize_record(fields, self.table, self.source))
+                    except RowRejected as e:
+                        self._reject(seen, str(e))
+                    if seen - self.rows_done >= self.chunk_size:
+                        self._commit(chunk, seen)
+                        chunk = []
+                        self.seconds = time.perf_counter() - started
+                        if progress:
+                            progress(self.report())
+            if seen > self.rows_done:
+                self._commit(chunk, seen)
+        except BaseException as e:
+            self.seconds = time.perf_counter() - started
+            interrupted = isinstance(e, (KeyboardInterrupt, SystemExit))
+            try:
+                self._finish(INTERRUPTED if interrupted else FAILED, None if interrupted else str(e))
+            except Exception as finish_error:
+                print(f"Error restoring directory indexes after import {self.run_id}: {finish_error}")
+            raise
+        self.seconds = time.perf_counter() - started
+        self._finish(COMPLETED)
+        return self.report()
+
+    def report(self):
+        imported = self.rows_done - self.resumed_from
+        return {
+            "run_id": self.run_id,
+            "table": self.table,
+            "source": self.source,
+            "status": self.status,
+            "rows_done": self.rows_done,
+            "resumed_from": self.resumed_from,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "rejected": self.rejected,
+            "reject_reasons": dict(self.reject_reasons),
+            "reject_samples": list(self.reject_samples),
+            "seconds": round(self.seconds, 3),
+            "rows_per_s": round(imported / self.seconds, 1) if self.seconds else None,
+        }
+
+    def _reject(self, record, reason):
+        self.rejected += 1
+        self.reject_reasons[reason] = self.reject_reasons.get(reason, 0) + 1
+        if len(self.reject_samples) < MAX_REJECT_SAMPLES:
+            self.reject_samples.append(f"record {record}: {reason}")
+
+    def _commit(self, chunk, rows_done):
+        """Upsert one chunk and checkpoint ``rows_done`` in the same transaction"""
+        inserted = updated = 0
+        with db.transaction(self.db_path) as c:
+            if chunk:
+                keys = [key for key, _ in chunk]
+                existing = set()
+                for i in range(0, len(keys), 500):
+                    part = keys[i:i + 500]
+                    c.execute(f"SELECT import_key FROM {self.table} WHERE import_key IN ({', '.join('?' * len(part))})",
+                              part)
+                    existing.update(row[0] for row in c.fetchall())
+                c.executemany(self._upsert_sql, [values + (key,) for key, values in chunk])
+                inserted = len(set(keys) - existing)
+                updated = len(chunk) - inserted
+            c.execute('''UPDATE directory_imports SET rows_done = ?, inserted = inserted + ?,
+                                updated = updated + ?, rejected = ? WHERE id = ?''',
+                      (rows_done, inserted, updated, self.rejected, self.run_id))
+        self.rows_done = rows_done
+        self.inserted += inserted
+        self.updated += updated
+
+    def _finish(self, status, error=None):
+        with db.transaction(self.db_path) as c:
+            _restore_write_indexes(c, self.table)
+            c.execute('''UPDATE directory_imports SET status = ?, error = ?, finished_at = CURRENT_TIMESTAMP
+                         WHERE id = ?''', (status, error, self.run_id))
+        self.status = status
+
+
+def import_status(run_id, db_path=None):
+    """The ``directory_imports`` row of one run as a dict, or None"""
+    cursor = db.get_db(db_path).execute("SELECT * FROM directory_imports WHERE id = ?", (run_id,))
+    row = cursor.fetchone()
+    return dict(zip((column[0] for column in cursor.description), row)) if row else None
@@ -0,0 +1,204 @@
+"""Search indexes over the recycler directory: accepted materials and full text.
+
+``recycling_center_materials`` maps each center to the canonical materials in
+its ``accepted_materials`` text, keyed (material, center) so it doubles as an
+inverted index. ``material_aliases`` holds the spellings normalized on the
+way in (``plastics`` -> ``plastic``). FTS5 tables index the searchable text of
+both directory tables. Triggers keep all of them in sync; SQLite builds
+without FTS5 fall back to an in-memory substring match.
+"""
+import re
+
+import numpy as np
+
+import db
+
+MATERIAL_NAMES = {
+    "plastic": "Plastic", "plastics": "Plastic", "pet": "Plastic", "hdpe": "Plastic",
+    "paper": "Paper", "newspaper": "Paper",
+    "cardboard": "Cardboard", "carton": "Cardboard", "cartons": "Cardboard",
+    "glass": "Glass", "bottles": "Glass",
+    "metal": "Metal", "metals": "Metal", "aluminium": "Metal", "aluminum": "Metal", "steel": "Metal",
+    "cans": "Metal",
+    "electronics": "Electronics", "electronic": "Electronics", "e-waste": "Electronics",
+    "ewaste": "Electronics", "weee": "Electronics",
+    "battery": "Batteries", "batteries": "Batteries",
+    "organic": "Organic", "organics": "Organic", "compost": "Organic", "food waste": "Organic",
+    "textile": "Textiles", "textiles": "Textiles", "clothing": "Textiles", "clothes": "Textiles",
+}
+_MATERIAL_SEPARATORS = re.compile(r"[,;|/\n]")
+
+# Columns indexed for text search, per table
+TEXT_COLUMNS = {
+    "recyclers": ("name", "description", "category", "address", "city"),
+    "recycling_centers": ("name", "type", "category", "address"),
+}
+MAX_QUERY_TERMS = 8
+
+_fts5_support = None
+
+
+def normalize_materials(value):
+    """``"plastics; PET / e-waste"`` -> ``"Plastic, Electronics"`` (canonical names, deduplicated)"""
+    if value is None:
+        return None
+    parts = value if isinstance(value, (list, tuple)) else _MATERIAL_SEPARATORS.split(str(value))
+    names = []
+    for part in parts:
+        key = " ".join(str(part).split()).lower()
+        if not key:
+            continue
+        name = MATERIAL_NAMES.get(key) or key[:1].upper() + key[1:]
+        if name not in names:
+            names.append(name)
+    return ", ".join(names) or None
+
+
+def material_keys(value):
+    """Index keys (lower-cased canonical names) for a material list or query"""
+    normalized = normalize_materials(value)
+    return [name.lower() for name in normalized.split(", ")] if normalized else []
+
+
+def text_words(text):
+    return re.findall(r"\w+", (text or "").lower())
+
+
+def query_terms(query):
+    """Words of a free-text query, lower-cased, at most MAX_QUERY_TERMS"""
+    return text_words(query)[:MAX_QUERY_TERMS]
+
+
+def has_fts5(c):
+    """Whether the linked SQLite library was built with FTS5 (checked once)"""
+    global _fts5_support
+    if _fts5_support is None:
+        c.execute("PRAGMA compile_options")
+        _fts5_support = any(row[0] == "ENABLE_FTS5" for row in c.fetchall())
+    return _fts5_support
+
+
+def _material_rows_sql(materials, center_id, source=""):
+    """SELECT of ``(material, center_id)`` for one accepted_materials expression.
+
+    The text is split on the same separators as normalize_materials (as a
+    JSON array, for json_each) and aliases map to canonical names. ``source``
+    prefixes the FROM clause, e.g. with the table the expressions refer to.
+    """
+    text = f"""replace(replace({materials}, '\\', '\\\\'), '"', '\\"')"""
+    for separator in ("';'", "'|'", "'/'", "char(10)"):
+        text = f"replace({text}, {separator}, ',')"
+    array = f"""'["' || replace({text}, ',', '","') || '"]'"""
+    key = "lower(trim(j.value))"
+    return f"""SELECT DISTINCT coalesce(a.material, {key}), {center_id}
+               FROM {source}json_each(CASE WHEN json_valid({array}) THEN {array} ELSE '[]' END) j
+               LEFT JOIN material_aliases a ON a.alias = {key}
+               WHERE {key} != ''"""
+
+
+def ensure_search_indexes(c, table):
+    """Create the materials mapping (centers only) and text index for ``table``, with their triggers"""
+    if table == "recycling_centers":
+        c.execute('''CREATE TABLE IF NOT EXISTS material_aliases
+                     (alias TEXT PRIMARY KEY, material TEXT NOT NULL) WITHOUT ROWID''')
+        c.executemany("INSERT OR REPLACE INTO material_aliases (alias, material) VALUES (?, ?)",
+                      [(alias, name.lower()) for alias, name in MATERIAL_NAMES.items()])
+        c.execute('''CREATE TABLE IF NOT EXISTS recycling_center_materials
+                     (material TEXT NOT NULL,
+                      center_id INTEGER NOT NULL,
+                      PRIMARY KEY (material, center_id)) WITHOUT ROWID''')
+        c.execute("CREATE INDEX IF NOT EXISTS idx_recycling_center_materials_center "
+                  "ON recycling_center_materials (center_id)")
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_materials_insert AFTER INSERT ON {table}
+                      BEGIN
+                          INSERT OR IGNORE INTO recycling_center_materials (material, center_id)
+                              {_material_rows_sql("NEW.accepted_materials", "NEW.id")};
+                      END''')
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_materials_update AFTER UPDATE OF accepted_materials ON {table}
+                      BEGIN
+                          DELETE FROM recycling_center_materials WHERE center_id = OLD.id;
+                          INSERT OR IGNORE INTO recycling_center_materials (material, center_id)
+                              {_material_rows_sql("NEW.accepted_materials", "NEW.id")};
+                      END''')
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_materials_delete AFTER DELETE ON {table}
+                      BEGIN
+                          DELETE FROM recycling_center_materials WHERE center_id = OLD.id;
+                      END''')
+        c.execute("SELECT COUNT(DISTINCT center_id) FROM recycling_center_materials")
+        mapped = c.fetchone()[0]
+        c.execute(f"SELECT COUNT(*) FROM {table} WHERE trim(coalesce(accepted_materials, '')) != ''")
+        if c.fetchone()[0] != mapped:
+            rebuild_material_index(c)
+
+    if not has_fts5(c):
+        return
+    fts = f"{table}_fts"
+    columns = TEXT_COLUMNS[table]
+    new = ", ".join(f"NEW.{column}" for column in columns)
+    old = ", ".join(f"OLD.{column}" for column in columns)
+    c.execute(f'''CREATE VIRTUAL TABLE IF NOT EXISTS {fts}
+                  USING fts5({", ".join(columns)}, content='{table}', content_rowid='id',
+                             tokenize='unicode61 remove_diacritics 2')''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table}
+                  BEGIN
+                      INSERT INTO {fts} (rowid, {", ".join(columns)}) VALUES (NEW.id, {new});
+                  END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {", ".join(columns)} ON {table}
+                  BEGIN
+                      INSERT INTO {fts} ({fts}, rowid, {", ".join(columns)}) VALUES ('delete', OLD.id, {old});
+                      INSERT INTO {fts} (rowid, {", ".join(columns)}) VALUES (NEW.id, {new});
+                  END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table}
+                  BEGIN
+                      INSERT INTO {fts} ({fts}, rowid, {", ".join(columns)}) VALUES ('delete', OLD.id, {old});
+                  END''')
+    c.execute(f"SELECT COUNT(*) FROM {fts}_docsize")
+    indexed = c.fetchone()[0]
+    c.execute(f"SELECT COUNT(*) FROM {table}")
+    if c.fetchone()[0] != indexed:
+        c.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+
+def search_triggers(table):
+    """Names of the triggers ensure_search_indexes() creates on ``table``"""
+    names = [f"{table}_fts_{event}" for event in ("insert", "update", "delete")]
+    if table == "recycling_centers":
+        names += [f"{table}_materials_{event}" for event in ("insert", "update", "delete")]
+    return names
+
+
+def rebuild_material_index(c):
+    c.execute("DELETE FROM recycling_center_materials")
+    c.execute(f'''INSERT OR IGNORE INTO recycling_center_materials (material, center_id)
+                  {_material_rows_sql("t.accepted_materials", "t.id", "recycling_centers t, ")}''')
+
+
+def rebuild_search_indexes(c, table):
+    """Rebuild ``table``'s indexes from scratch, e.g. after writes with the triggers dropped"""
+    if table == "recycling_centers":
+        rebuild_material_index(c)
+    if has_fts5(c):
+        c.execute(f"INSERT INTO {table}_fts ({table}_fts) VALUES ('rebuild')")
+
+
+def load_material_postings(path=None):
+    """``{material: sorted center ids}`` from the mapping table"""
+    rows = db.query_all("SELECT material, center_id FROM recycling_center_materials ORDER BY material, center_id",
+                        path=path)
+    postings = {}
+    for material, center_id in rows:
+        postings.setdefault(material, []).append(center_id)
+    return {material: np.array(ids, dtype=np.int64) for material, ids in postings.items()}
+
+
+def text_match_ids(table, query, path=None):
+    """Sorted ids of ``table`` rows matching every query term (as a word prefix), or None without FTS5"""
+    conn = db.get_db(path)
+    if not has_fts5(conn.cursor()):
+        return None
+    terms = query_terms(query)
+    if not terms:
+        return np.empty(0, dtype=np.int64)
+    match = " ".join(f'"{term}"*' for term in terms)
+    rows = conn.execute(f"SELECT rowid FROM {table}_fts WHERE {table}_fts MATCH ? ORDER BY rowid", (match,))
+    return np.fromiter((row[0] for row in rows), dtype=np.int64)
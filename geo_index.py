@@ -0,0 +1,56 @@
+"""Search-circle geometry for the nearby searches: bounding boxes and top-k."""
+import heapq
+import math
+
+# Shortest length of one degree on the WGS-84 ellipsoid: a degree of latitude
+# is never shorter than at the equator, and a degree of longitude at latitude
+# phi is never shorter than KM_PER_DEG_LON_EQUATOR * cos(phi).
+KM_PER_DEG_LAT_MIN = 110.574
+KM_PER_DEG_LON_EQUATOR = 111.320
+BOX_MARGIN = 1.01  # pad boxes so rounding never drops an edge row
+
+SPATIAL_TABLES = ("recyclers", "recycling_centers")
+
+
+def bounding_boxes(lat, lon, radius_km):
+    """Lat/lon boxes that contain every point within ``radius_km`` of (lat, lon).
+
+    Returns a list of ``(min_lat, max_lat, min_lon, max_lon)``; the box is split
+    in two when it crosses the antimeridian.
+    """
+    radius_km = max(0.0, float(radius_km)) * BOX_MARGIN
+    dlat = radius_km / KM_PER_DEG_LAT_MIN
+    min_lat, max_lat = lat - dlat, lat + dlat
+    if min_lat <= -90.0 or max_lat >= 90.0:
+        # Circle reaches a pole: every longitude is in range
+        return [(max(min_lat, -90.0), min(max_lat, 90.0), -180.0, 180.0)]
+
+    # The poleward edge of the band has the shortest degree of longitude
+    cos_edge = math.cos(math.radians(max(abs(min_lat), abs(max_lat))))
+    dlon = radius_km / (KM_PER_DEG_LON_EQUATOR * cos_edge)
+    if dlon >= 180.0:
+        return [(min_lat, max_lat, -180.0, 180.0)]
+
+    min_lon, max_lon = lon - dlon, lon + dlon
+    if min_lon < -180.0:
+        return [(min_lat, max_lat, min_lon + 360.0, 180.0), (min_lat, max_lat, -180.0, max_lon)]
+    if max_lon > 180.0:
+        return [(min_lat, max_lat, min_lon, 180.0), (min_lat, max_lat, -180.0, max_lon - 360.0)]
+    return [(min_lat, max_lat, min_lon, max_lon)]
+
+
+def drop_spatial_index(c, table):
+    """Remove the R*Tree, its sync triggers and the lat/lon index from earlier versions.
+
+    The nearby searches run on the in-memory directory (recycler_directory.py),
+    so keeping them up to date only slowed down every write to ``table``.
+    """
+    c.execute(f"DROP INDEX IF EXISTS idx_{table}_lat_lon")
+    for event in ("insert", "update", "delete"):
+        c.execute(f"DROP TRIGGER IF EXISTS {table}_rtree_{event}")
+    c.execute(f"DROP TABLE IF EXISTS {table}_rtree")
+
+
+def nearest(items, limit, key):
+    """Heap-based top-k; same order as ``sorted(items, key=key)[:limit]``"""
+    return heapq.nsmallest(limit, items, key=key)
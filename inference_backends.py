@@ -0,0 +1,143 @@
+"""Interchangeable inference engines for the classification model.
+
+Every backend takes a float32 ``(N, 224, 224, 3)`` batch scaled to [0, 1]
+and returns the model's raw output rows as a numpy array, so
+``interpret_prediction`` works the same whichever engine produced them.
+Runtimes are imported only when a backend is loaded.
+"""
+import os
+import threading
+
+import numpy as np
+
+DEFAULT_MODEL_PATHS = {
+    "keras": "model/Sortify.h5",
+    "tflite": "model/Sortify.tflite",
+    "onnx": "model/Sortify.onnx",
+}
+
+
+class KerasBackend:
+    """The original engine: the full Keras model through ``model.predict``"""
+
+    name = "keras"
+
+    @staticmethod
+    def import_runtime():
+        from tensorflow.keras.models import load_model
+        return load_model
+
+    def __init__(self, model_path, runtime, num_threads=0):
+        if num_threads:
+            import tensorflow as tf
+            try:
+                tf.config.threading.set_intra_op_parallelism_threads(num_threads)
+            except RuntimeError:
+                pass  # TF already initialized in this process; keep its thread pool
+        self.model = runtime(model_path, compile=False)
+
+    def predict(self, batch):
+        return np.asarray(self.model.predict(batch, verbose=0))
+
+
+class TFLiteBackend:
+    """TensorFlow Lite interpreter, optionally running an int8-quantized model.
+
+    Prefers the standalone LiteRT / tflite-runtime packages and falls back to
+    ``tf.lite``. The interpreter is not thread-safe, so calls are serialized;
+    the input tensor is resized when the batch size changes.
+    """
+
+    name = "tflite"
+
+    @staticmethod
+    def import_runtime():
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            try:
+                from tflite_runtime.interpreter import Interpreter
+            except ImportError:
+                import tensorflow as tf
+                Interpreter = tf.lite.Interpreter
+        return Interpreter
+
+    def __init__(self, model_path, runtime, num_threads=0):
+        self.interpreter = runtime(model_path=model_path, num_threads=num_threads or None)
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self._batch_size = None
+        self._lock = threading.Lock()
+
+    def predict(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        with self._lock:
+            if batch.shape[0] != self._batch_size:
+                self.interpreter.resize_tensor_input(self.input["index"], batch.shape)
+                self.interpreter.allocate_tensors()
+                self.input = self.interpreter.get_input_details()[0]
+                self.output = self.interpreter.get_output_details()[0]
+                self._batch_size = batch.shape[0]
+            self.interpreter.set_tensor(self.input["index"], _quantize(batch, self.input))
+            self.interpreter.invoke()
+            return _dequantize(self.interpreter.get_tensor(self.output["index"]), self.output)
+
+
+class OnnxBackend:
+    """ONNX Runtime session on the CPU execution provider"""
+
+    name = "onnx"
+
+    @staticmethod
+    def import_runtime():
+        import onnxruntime
+        return onnxruntime
+
+    def __init__(self, model_path, runtime, num_threads=0):
+        options = runtime.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = runtime.InferenceSession(model_path, sess_options=options,
+                                                providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict(self, batch):
+        return self.session.run(None, {self.input_name: np.asarray(batch, dtype=np.float32)})[0]
+
+
+BACKENDS = {backend.name: backend for backend in (KerasBackend, TFLiteBackend, OnnxBackend)}
+
+
+def get_backend(name):
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown inference backend {name!r} (choose from {', '.join(BACKENDS)})") from None
+
+
+def default_model_path(name):
+    return DEFAULT_MODEL_PATHS[get_backend(name).name]
+
+
+def load_backend(name, model_path=None, num_threads=0):
+    """Import the runtime and load a model in one step (tools and benchmarks)"""
+    backend = get_backend(name)
+    model_path = model_path or default_model_path(name)
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"No {name} model at {model_path}")
+    return backend(model_path, backend.import_runtime(), num_threads)
+
+
+def _quantize(batch, details):
+    if details["dtype"] == np.float32:
+        return batch
+    scale, zero_point = details["quantization"]
+    info = np.iinfo(details["dtype"])
+    return np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(details["dtype"])
+
+
+def _dequantize(output, details):
+    if details["dtype"] == np.float32:
+        return output
+    scale, zero_point = details["quantization"]
+    return (output.astype(np.float32) - zero_point) * scale
@@ -0,0 +1,309 @@
+"""Multi-process inference workers fed through shared memory.
+
+Each worker process loads its own inference backend, pinned to a slice of
+the CPU cores, and owns two shared-memory slabs: an input tensor of
+``max_batch`` images and an output array of ``max_batch`` prediction rows.
+The web process copies a batch into the input slab and sends only
+``("predict", n)`` over a pipe; the worker writes the rows back into the
+output slab and replies with their shape. Tensors are never pickled.
+"""
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from metrics import Histogram
+
+IMAGE_SHAPE = (224, 224, 3)
+MAX_OUTPUTS = 64  # widest prediction row the output slab can hold
+
+STARTING = "starting"
+READY = "ready"
+BUSY = "busy"
+DEAD = "dead"
+FAILED = "failed"
+
+
+def core_slices(workers, cores_per_worker=0, cores=None):
+    """Split the usable cores into one contiguous slice per worker.
+
+    With more workers than cores, slices wrap around and share cores.
+    """
+    cores = sorted(cores if cores is not None else _available_cores())
+    per_worker = cores_per_worker or max(1, len(cores) // workers)
+    return [[cores[(i * per_worker + j) % len(cores)] for j in range(per_worker)] for i in range(workers)]
+
+
+def _available_cores():
+    try:
+        return os.sched_getaffinity(0)
+    except AttributeError:  # not available on macOS / Windows
+        return range(os.cpu_count() or 1)
+
+
+def _worker_main(conn, backend, model_path, cores, input_name, output_name, max_batch):
+    """Entry point of a worker process"""
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    threads = len(cores) if cores else 0
+    if threads:
+        for var in ("OMP_NUM_THREADS", "TF_NUM_INTRAOP_THREADS"):
+            os.environ[var] = str(threads)
+
+    input_shm = shared_memory.SharedMemory(name=input_name)
+    output_shm = shared_memory.SharedMemory(name=output_name)
+    inputs = np.ndarray((max_batch,) + IMAGE_SHAPE, dtype=np.float32, buffer=input_shm.buf)
+    outputs = np.ndarray((max_batch, MAX_OUTPUTS), dtype=np.float32, buffer=output_shm.buf)
+    try:
+        from inference_backends import load_backend
+        started = time.perf_counter()
+        model = load_backend(backend, model_path, threads)
+        model.predict(np.zeros((1,) + IMAGE_SHAPE, dtype=np.float32))
+        conn.send(("ready", {"pid": os.getpid(), "load_s": round(time.perf_counter() - started, 3)}))
+    except Exception as e:
+        conn.send(("failed", str(e)))
+        return
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        _, n = message
+        try:
+            preds = np.asarray(model.predict(inputs[:n]), dtype=np.float32).reshape(n, -1)
+            if preds.shape[1] > MAX_OUTPUTS:
+                raise ValueError(f"Model has {preds.shape[1]} outputs; the pool supports up to {MAX_OUTPUTS}")
+            outputs[:n, :preds.shape[1]] = preds
+            conn.send(("ok", preds.shape))
+        except Exception as e:
+            conn.send(("error", str(e)))
+    input_shm.close()
+    output_shm.close()
+
+
+class _Worker:
+    def __init__(self, index, cores, max_batch):
+        self.index = index
+        self.cores = cores
+        self.input_shm = shared_memory.SharedMemory(create=True, size=max_batch * int(np.prod(IMAGE_SHAPE)) * 4)
+        self.output_shm = shared_memory.SharedMemory(create=True, size=max_batch * MAX_OUTPUTS * 4)
+        self.inputs = np.ndarray((max_batch,) + IMAGE_SHAPE, dtype=np.float32, buffer=self.input_shm.buf)
+        self.outputs = np.ndarray((max_batch, MAX_OUTPUTS), dtype=np.float32, buffer=self.output_shm.buf)
+        self.process = None
+        self.conn = None
+        self.state = DEAD
+        self.info = {}
+        self.error = None
+        self.started_at = None
+        self.restarts = 0
+        self.batches = 0
+
+    def status(self):
+        return {
+            "state": self.state,
+            "pid": self.process.pid if self.process else None,
+            "cores": self.cores,
+            "uptime_s": round(time.time() - self.started_at, 1) if self.started_at else None,
+            "restarts": self.restarts,
+            "batches": self.batches,
+            "load_s": self.info.get("load_s"),
+            "error": self.error,
+        }
+
+
+class InferencePool:
+    """Fixed set of inference worker processes with health monitoring.
+
+    ``predict`` leases an idle worker, so up to ``workers`` batches run in
+    parallel. A monitor thread restarts workers whose process died; a worker
+    that does not answer within ``timeout_s`` is killed and restarted, and the
+    batch it held fails. If a worker cannot load the model at all, the pool is
+    marked failed instead of restarting it forever.
+    """
+
+    def __init__(self, backend, model_path, workers=2, max_batch=16, cores_per_worker=0,
+                 timeout_s=30.0, monitor_interval_s=1.0):
+        self.backend = backend
+        self.model_path = model_path
+        self.max_batch = max(1, int(max_batch))
+        self.timeout = timeout_s
+        self.monitor_interval = monitor_interval_s
+        self.error = None
+
+        self._ctx = multiprocessing.get_context("spawn")
+        self._workers = [_Worker(i, cores, self.max_batch)
+                         for i, cores in enumerate(core_slices(workers, cores_per_worker))]
+        self._idle = queue.Queue()
+        self._queued = set()  # indices in _idle, so a restarted worker is never queued twice
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._monitor = None
+
+        self.inference_ms_hist = Histogram((1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 5000))
+        self.lease_wait_ms_hist = Histogram((0.1, 0.5, 1, 2, 5, 10, 25, 50, 100, 250, 1000))
+
+    @property
+    def size(self):
+        return len(self._workers)
+
+    def start(self):
+        """Spawn every worker; they load the model in the background"""
+        with self._lock:
+            if self._monitor is not None:
+                return
+            for worker in self._workers:
+                self._spawn(worker)
+            self._monitor = threading.Thread(target=self._run_monitor, name="inference-pool-monitor", daemon=True)
+            self._monitor.start()
+
+    def predict(self, batch):
+        """Run a float32 ``(N, 224, 224, 3)`` batch, split across leases of ``max_batch``"""
+        batch = np.asarray(batch, dtype=np.float32)
+        if batch.ndim == 3:
+            batch = batch[None]
+        self.start()
+        return np.concatenate([self._predict_chunk(batch[i:i + self.max_batch])
+                               for i in range(0, len(batch), self.max_batch)])
+
+    def stats(self):
+        return {
+            "workers": [worker.status() for worker in self._workers],
+            "ready": sum(worker.state in (READY, BUSY) for worker in self._workers),
+            "error": self.error,
+            "max_batch": self.max_batch,
+            "inference_ms": self.inference_ms_hist.snapshot(),
+            "lease_wait_ms": self.lease_wait_ms_hist.snapshot(),
+        }
+
+    def close(self):
+        self._stop.set()
+        for worker in self._workers:
+            if worker.process is not None and worker.process.is_alive():
+                try:
+                    worker.conn.send(None)
+                except (OSError, ValueError):
+                    pass
+                worker.process.join(2.0)
+                if worker.process.is_alive():
+                    worker.process.kill()
+            for shm in (worker.input_shm, worker.output_shm):
+                shm.close()
+                try:
+                    shm.unlink()
+                except FileNotFoundError:
+                    pass
+
+    def _predict_chunk(self, chunk):
+        worker = self._lease()
+        process = worker.process
+        n = len(chunk)
+        started = time.perf_counter()
+        try:
+            worker.inputs[:n] = chunk
+            worker.conn.send(("predict", n))
+            if not worker.conn.poll(self.timeout):
+                raise TimeoutError(f"Inference worker {worker.index} did not answer within {self.timeout}s")
+            status, payload = worker.conn.recv()
+        except (EOFError, OSError, TimeoutError) as e:
+            self._restart(worker, f"{type(e).__name__}: {e}", process)
+            raise RuntimeError(f"Inference worker {worker.index} failed: {e}") from e
+        if status != "ok":
+            self._release(worker)
+            raise RuntimeError(f"Inference failed: {payload}")
+        rows = worker.outputs[:n, :payload[1]].copy()
+        worker.batches += 1
+        self._release(worker)
+        self.inference_ms_hist.observe((time.perf_counter() - started) * 1000.0)
+        return rows
+
+    def _lease(self):
+        started = time.perf_counter()
+        deadline = started + self.timeout
+        while True:
+            if self.error is not None:
+                raise RuntimeError(f"Model not loaded: {self.error}")
+            try:
+                index = self._idle.get(timeout=min(0.1, max(0.0, deadline - time.perf_counter())))
+            except queue.Empty:
+                if time.perf_counter() >= deadline:
+                    raise RuntimeError(f"No inference worker became available within {self.timeout}s")
+                continue
+            worker = self._workers[index]
+            with self._lock:
+                self._queued.discard(index)
+                if worker.state != READY:
+                    continue  # died or restarting since it was queued; it is queued again once ready
+                worker.state = BUSY
+            self.lease_wait_ms_hist.observe((time.perf_counter() - started) * 1000.0)
+            return worker
+
+    def _release(self, worker):
+        with self._lock:
+            worker.state = READY
+            if worker.index not in self._queued:
+                self._queued.add(worker.index)
+                self._idle.put(worker.index)
+
+    def _spawn(self, worker):
+        parent_conn, child_conn = self._ctx.Pipe()
+        worker.process = self._ctx.Process(
+            target=_worker_main, name=f"inference-worker-{worker.index}", daemon=True,
+            args=(child_conn, self.backend, self.model_path, worker.cores,
+                  worker.input_shm.name, worker.output_shm.name, self.max_batch))
+        worker.conn = parent_conn
+        worker.state = STARTING
+        worker.started_at = time.time()
+        worker.process.start()
+        child_conn.close()
+
+    def _restart(self, worker, reason, process):
+        """Replace ``process`` (the worker's process when the failure was seen)"""
+        with self._lock:
+            if worker.process is not process or worker.state == FAILED or self._stop.is_set():
+                return  # already restarted by another thread, or shutting down
+            print(f"Restarting inference worker {worker.index}: {reason}")
+            worker.error = reason
+            worker.state = DEAD
+            if process.is_alive():
+                process.kill()
+            process.join(1.0)
+            worker.restarts += 1
+            self._spawn(worker)
+
+    def _run_monitor(self):
+        while True:
+            starting = any(worker.state == STARTING for worker in self._workers)
+            if self._stop.wait(0.05 if starting else self.monitor_interval):
+                break
+            for worker in self._workers:
+                process = worker.process
+                if worker.state == STARTING:
+                    self._check_started(worker, process)
+                elif worker.state in (READY, BUSY) and not process.is_alive():
+                    self._restart(worker, f"process exited with code {process.exitcode}", process)
+
+    def _check_started(self, worker, process):
+        try:
+            if not worker.conn.poll():
+                if not process.is_alive():
+                    self._restart(worker, f"process exited with code {process.exitcode} while loading", process)
+                return
+            status, payload = worker.conn.recv()
+        except (EOFError, OSError) as e:
+            self._restart(worker, f"{type(e).__name__}: {e}", process)
+            return
+        if status == "ready":
+            worker.info = payload
+            self._release(worker)
+        else:
+            worker.state = FAILED
+            worker.error = payload
+            self.error = payload
+            print(f"❌ Inference worker {worker.index} could not load the model: {payload}")
@@ -0,0 +1,228 @@
+"""Lightweight in-process metrics used by the Sortify hot paths."""
+import bisect
+import threading
+import time
+
+
+class Histogram:
+    """Thread-safe fixed-bucket histogram with cumulative (Prometheus-style) buckets."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[idx] += 1
+            self._sum += value
+            self._count += 1
+
+    def quantile(self, q):
+        """Estimate a quantile as the upper bound of the bucket that contains it."""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._count
+        if total == 0:
+            return 0.0
+        rank = q * total
+        running = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            running += count
+            if running >= rank:
+                return bound
+        return float("inf")
+
+    def snapshot(self):
+        with self._lock:
+            counts = list(self._counts)
+            total = self._count
+            value_sum = self._sum
+        cumulative = {}
+        running = 0
+        for bound, count in zip(self.buckets, counts):
+            running += count
+            cumulative[str(bound)] = running
+        cumulative["+Inf"] = total
+        return {
+            "buckets": cumulative,
+            "count": total,
+            "sum": round(value_sum, 3),
+            "p50": _finite(self.quantile(0.5)),
+            "p99": _finite(self.quantile(0.99)),
+        }
+
+
+def _finite(value):
+    # JSON has no Infinity; report overflow-bucket quantiles as unknown
+    return None if value == float("inf") else value
+
+
+class Counter:
+    """Thread-safe monotonically increasing count."""
+
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self):
+        return self._value
+
+
+class _Timer:
+    __slots__ = ("histogram", "started")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe((time.perf_counter() - self.started) * 1000.0)
+
+
+class MetricFamily:
+    """One named metric and its children, one per combination of label values."""
+
+    def __init__(self, name, help_text, kind, labelnames, factory, scale=1.0):
+        self.name = name
+        self.help = help_text
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.scale = scale
+        self._factory = factory
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._factory())
+        return child
+
+    def time(self, *values):
+        """Context manager observing its elapsed milliseconds (histograms only)"""
+        return _Timer(self.labels(*values))
+
+    def children(self):
+        with self._lock:
+            return list(self._children.items())
+
+
+class MetricsRegistry:
+    """Metrics rendered together in the Prometheus text format (``/metrics``).
+
+    Histograms observe milliseconds, like every Histogram in this code base;
+    ``scale`` converts on output (0.001 for the conventional ``_seconds``).
+    """
+
+    def __init__(self):
+        self._families = []
+        self._lock = threading.Lock()
+
+    def histogram(self, name, help_text, buckets, labels=(), scale=0.001):
+        return self._add(MetricFamily(name, help_text, "histogram", labels, lambda: Histogram(buckets), scale))
+
+    def counter(self, name, help_text, labels=()):
+        return self._add(MetricFamily(name, help_text, "counter", labels, Counter))
+
+    def register_histogram(self, name, help_text, histogram, scale=0.001, **labels):
+        """Expose an existing Histogram (e.g. a component's own) under ``name``"""
+        family = self._family(name) or self._add(MetricFamily(name, help_text, "histogram", tuple(labels),
+                                                              None, scale))
+        family._children[tuple(labels.values())] = histogram
+        return family
+
+    def gauge(self, name, help_text, fn, labels=()):
+        """A value read when rendering: ``fn()`` returns a number, or ``{label values: number}``"""
+        return self._add(MetricFamily(name, help_text, "gauge", labels, fn))
+
+    def counter_fn(self, name, help_text, fn, labels=()):
+        """Like gauge(), for a count kept elsewhere (e.g. a component's stats)"""
+        return self._add(MetricFamily(name, help_text, "counter", labels, fn))
+
+    def render(self):
+        lines = []
+        with self._lock:
+            families = list(self._families)
+        for family in families:
+            samples = self._samples(family)
+            if samples is None:
+                continue
+            lines.append(f"# HELP {family.name} {family.help}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+    def _add(self, family):
+        with self._lock:
+            if any(existing.name == family.name for existing in self._families):
+                raise ValueError(f"Metric {family.name} is already registered")
+            self._families.append(family)
+        return family
+
+    def _family(self, name):
+        with self._lock:
+            return next((family for family in self._families if family.name == name), None)
+
+    def _samples(self, family):
+        if family.kind == "histogram":
+            samples = []
+            for values, histogram in family.children():
+                samples.extend(_histogram_samples(family, values, histogram))
+            return samples
+        if family._factory is Counter:
+            return [f"{family.name}{_labels(family.labelnames, values)} {_number(child.value)}"
+                    for values, child in family.children()]
+        try:
+            value = family._factory()
+        except Exception as e:
+            print(f"Error reading metric {family.name}: {e}")
+            return None
+        if value is None:
+            return None
+        if not isinstance(value, dict):
+            value = {(): value}
+        return [f"{family.name}{_labels(family.labelnames, values)} {_number(number)}"
+                for values, number in value.items() if number is not None]
+
+
+def _histogram_samples(family, values, histogram):
+    with histogram._lock:
+        counts = list(histogram._counts)
+        total = histogram._count
+        value_sum = histogram._sum
+    running = 0
+    for bound, count in zip(histogram.buckets, counts):
+        running += count
+        le = _number(bound * family.scale)
+        yield f"{family.name}_bucket{_labels(family.labelnames + ('le',), values + (le,))} {running}"
+    yield f"{family.name}_bucket{_labels(family.labelnames + ('le',), values + ('+Inf',))} {total}"
+    yield f"{family.name}_sum{_labels(family.labelnames, values)} {_number(value_sum * family.scale)}"
+    yield f"{family.name}_count{_labels(family.labelnames, values)} {total}"
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    return repr(round(value, 9)) if isinstance(value, float) else str(value)
@@ -0,0 +1,112 @@
+"""Convert the Keras model to TFLite / ONNX, optionally quantized.
+
+Quantization modes:
+
+- ``dynamic``: int8 weights, float activations; needs no data.
+- ``int8``: int8 weights and activations, with activation ranges calibrated
+  on real uploads. Model inputs and outputs stay float32, so backends and
+  callers are unchanged.
+"""
+import os
+
+import numpy as np
+
+from preprocessing import preprocess_bytes
+
+QUANTIZATION_MODES = ("none", "dynamic", "int8")
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+
+
+def calibration_images(folder, limit=100):
+    """Preprocessed ``(1, 224, 224, 3)`` arrays for up to ``limit`` images under ``folder``"""
+    paths = []
+    for root, _, files in os.walk(folder):
+        paths.extend(os.path.join(root, name) for name in files if name.lower().endswith(IMAGE_EXTENSIONS))
+    arrays = []
+    for path in sorted(paths):
+        if len(arrays) >= limit:
+            break
+        try:
+            with open(path, "rb") as f:
+                arrays.append(preprocess_bytes(f.read(), draft=False))
+        except Exception as e:
+            print(f"Skipping calibration image {path}: {e}")
+    return arrays
+
+
+def export_tflite(keras_path, out_path, quantize="none", calibration=()):
+    import tensorflow as tf
+    model = tf.keras.models.load_model(keras_path, compile=False)
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if quantize in ("dynamic", "int8"):
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantize == "int8":
+        converter.representative_dataset = lambda: ([array] for array in calibration)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    with open(out_path, "wb") as f:
+        f.write(converter.convert())
+    return out_path
+
+
+def export_onnx(keras_path, out_path, quantize="none", calibration=(), opset=17):
+    import tensorflow as tf
+    import tf2onnx
+    model = tf.keras.models.load_model(keras_path, compile=False)
+    spec = (tf.TensorSpec((None,) + tuple(model.input_shape[1:]), tf.float32, name="input"),)
+
+    @tf.function(input_signature=spec)
+    def serve(x):
+        return model(x, training=False)
+
+    float_path = out_path if quantize == "none" else f"{out_path}.float.tmp"
+    tf2onnx.convert.from_function(serve, input_signature=spec, opset=opset, output_path=float_path)
+    if quantize == "none":
+        return out_path
+
+    from onnxruntime import quantization as ortq
+    try:
+        if quantize == "dynamic":
+            ortq.quantize_dynamic(float_path, out_path, weight_type=ortq.QuantType.QInt8)
+        else:
+            ortq.quantize_static(float_path, out_path, _CalibrationReader(calibration),
+                                 quant_format=ortq.QuantFormat.QDQ,
+                                 activation_type=ortq.QuantType.QInt8,
+                                 weight_type=ortq.QuantType.QInt8)
+    finally:
+        os.remove(float_path)
+    return out_path
+
+
+def export_model(keras_path, fmt, out_path=None, quantize="none", calibration_dir="static/uploads",
+                 calibration_limit=100):
+    """Export ``keras_path`` to ``fmt`` ("tflite" or "onnx"); returns the written path"""
+    if quantize not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown quantization {quantize!r} (choose from {', '.join(QUANTIZATION_MODES)})")
+    if fmt not in ("tflite", "onnx"):
+        raise ValueError(f"Unknown export format {fmt!r} (choose from tflite, onnx)")
+    if out_path is None:
+        stem = os.path.splitext(keras_path)[0]
+        out_path = f"{stem}.{fmt}" if quantize == "none" else f"{stem}.{quantize}.{fmt}"
+
+    calibration = ()
+    if quantize == "int8":
+        calibration = calibration_images(calibration_dir, calibration_limit)
+        if not calibration:
+            raise ValueError(f"int8 quantization needs calibration images; none found in {calibration_dir}")
+
+    if fmt == "tflite":
+        return export_tflite(keras_path, out_path, quantize, calibration)
+    return export_onnx(keras_path, out_path, quantize, calibration)
+
+
+class _CalibrationReader:
+    """onnxruntime CalibrationDataReader over preprocessed arrays"""
+
+    def __init__(self, arrays, input_name="input"):
+        self._feeds = iter([{input_name: np.asarray(array, dtype=np.float32)} for array in arrays])
+
+    def get_next(self):
+        return next(self._feeds, None)
+
+    def rewind(self):
+        pass
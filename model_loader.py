@@ -0,0 +1,100 @@
+"""Lazy / background loading of the classification model."""
+import threading
+import time
+
+import numpy as np
+
+import inference_backends
+
+IDLE = "idle"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+
+class ModelLoader:
+    """Load the inference backend off the import path and report its state.
+
+    The runtime (TensorFlow, TFLite, ONNX Runtime) is only imported when
+    loading starts, either from a background warm-up thread
+    (``start_background``) or on first use (``get``). Loading ends with one
+    warm-up inference so the first real request does not pay for graph
+    tracing.
+    """
+
+    def __init__(self, model_path, backend="keras", num_threads=0, input_shape=(224, 224, 3)):
+        self.model_path = model_path
+        self.backend = inference_backends.get_backend(backend)
+        self.num_threads = num_threads
+        self.input_shape = input_shape
+        self.state = IDLE
+        self.error = None
+        self.timings = {}
+        self._model = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._created = time.perf_counter()
+
+    @property
+    def ready(self):
+        return self.state == READY
+
+    def start_background(self):
+        """Begin loading on a daemon thread; no-op if loading already started"""
+        with self._lock:
+            if self.state != IDLE:
+                return
+            self.state = LOADING
+        threading.Thread(target=self._load, name="model-warmup", daemon=True).start()
+
+    def get(self, timeout=None):
+        """The loaded backend, loading it on this thread if nobody has started yet.
+
+        Raises RuntimeError if loading failed or did not finish in ``timeout``.
+        """
+        with self._lock:
+            start_here = self.state == IDLE
+            if start_here:
+                self.state = LOADING
+        if start_here:
+            self._load()
+        if not self._done.wait(timeout):
+            raise RuntimeError("Model is still loading")
+        if self.state != READY:
+            raise RuntimeError(f"Model not loaded: {self.error}")
+        return self._model
+
+    def status(self):
+        return {
+            "state": self.state,
+            "backend": self.backend.name,
+            "model_path": self.model_path,
+            "error": self.error,
+            "timings_s": dict(self.timings),
+        }
+
+    def _load(self):
+        started = time.perf_counter()
+        self.timings["wait_before_load_s"] = round(started - self._created, 3)
+        try:
+            runtime = self.backend.import_runtime()
+            imported = time.perf_counter()
+            self.timings["import_runtime_s"] = round(imported - started, 3)
+
+            model = self.backend(self.model_path, runtime, self.num_threads)
+            loaded = time.perf_counter()
+            self.timings["load_model_s"] = round(loaded - imported, 3)
+
+            model.predict(np.zeros((1,) + tuple(self.input_shape), dtype=np.float32))
+            self.timings["warmup_inference_s"] = round(time.perf_counter() - loaded, 3)
+
+            self._model = model
+            self.state = READY
+            print(f"✅ Model loaded successfully ({self.backend.name})")
+        except Exception as e:
+            self.error = str(e)
+            self.state = FAILED
+            print(f"❌ Failed to load model: {self.error}")
+        finally:
+            self.timings["total_s"] = round(time.perf_counter() - started, 3)
+            self._done.set()
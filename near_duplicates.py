@@ -0,0 +1,376 @@
+"""Perceptual-hash index of classified uploads: near-duplicate label reuse and a repeat signal.
+
+``perceptual_hash`` is a 64-bit DCT hash (pHash) of the preprocessed image:
+photos of the same item that differ in compression, scale or a small crop
+land a few bits apart, unrelated images around 32. Flat or nearly flat
+images are not hashed: their bits would come from noise around the median,
+and every such image would collide with every other.
+
+``NearDuplicateIndex`` keeps the hashes in a uint64 NumPy array, with the
+label probability, user and time of each upload alongside. "Every entry
+within ``radius`` bits" is answered with multi-index hashing: the 64 bits are
+four 16-bit chunks, and a hash within ``radius`` bits of the query matches it
+to within ``radius // 4`` bits on at least one chunk, so only those chunk
+values' buckets (one sorted, CSR-style table per chunk) are compared in
+full. Entries added since the tables were last rebuilt are scanned directly,
+and so is the whole index while it is small enough for that to be faster.
+Once enough entries are pending, the tables are rebuilt on a background
+thread and swapped in, so lookups and adds never wait for a rebuild.
+
+The ``upload_hashes`` table keeps the hashes across restarts.
+"""
+import itertools
+import threading
+import time
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+import db
+
+CHUNKS = 4
+CHUNK_BITS = 16
+CHUNK_VALUES = 1 << CHUNK_BITS
+REBUILD_MIN_PENDING = 4096  # unindexed entries scanned directly before the chunk tables are rebuilt
+BRUTE_FORCE_MAX = 32768  # up to this many entries a full popcount scan beats the table lookups
+# Floor on the L2 norm of the 63 hashed AC coefficients, for pixels in [0, 1]: photos
+# score 3 to 9, a low-contrast photo about 0.4, a single colour with a bit of noise under 0.15
+MIN_AC_ENERGY = 0.25
+
+
+def _dct_matrix(n):
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    m = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    m[0] /= np.sqrt(2.0)
+    return m.astype(np.float32)
+
+
+_DCT32 = _dct_matrix(32)
+_LUMA = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+if hasattr(np, "bitwise_count"):
+    popcount = np.bitwise_count
+else:
+    _BYTE_BITS = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def popcount(values):
+        values = np.ascontiguousarray(values, dtype=np.uint64)
+        return _BYTE_BITS[values.view(np.uint8)].reshape(len(values), 8).sum(axis=1, dtype=np.uint8)
+
+
+def perceptual_hash(image):
+    """64-bit pHash of a preprocessed ``(H, W, 3)`` or ``(1, H, W, 3)`` image in [0, 1].
+
+    None for images with too little low-frequency texture to hash reliably.
+    """
+    image = np.asarray(image, dtype=np.float32)
+    if image.ndim == 4:
+        image = image[0]
+    gray = image @ _LUMA
+    h, w = gray.shape[0] // 32 * 32, gray.shape[1] // 32 * 32
+    gray = gray[:h, :w].reshape(32, h // 32, 32, w // 32).mean(axis=(1, 3))
+    coeffs = (_DCT32 @ gray @ _DCT32.T)[:8, :8].reshape(-1)
+    if np.sqrt(np.square(coeffs[1:]).sum()) < MIN_AC_ENERGY:
+        return None
+    bits = coeffs > np.median(coeffs[1:])  # DC term left out of the median
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def _to_sqlite(phash):
+    # SQLite integers are signed 64-bit
+    return phash - (1 << 64) if phash >= 1 << 63 else phash
+
+
+def _from_sqlite(value):
+    return value & 0xFFFFFFFFFFFFFFFF
+
+
+class Match(NamedTuple):
+    probability: Optional[float]  # of the closest model-labelled entry, None if there is none
+    distance: Optional[int]  # bits to the closest entry of any kind
+    own_repeats: int  # the user's own uploads within the radius and the repeat window
+
+
+class NearDuplicateIndex:
+    """In-memory hashes of classified uploads, searchable by Hamming radius."""
+
+    def __init__(self, radius=6, max_entries=1_000_000, capacity=1024):
+        if not 0 <= radius < 32:
+            raise ValueError("radius must be between 0 and 31 bits")
+        self.radius = radius
+        self.max_entries = max(1, int(max_entries))
+        self._hashes = np.empty(capacity, dtype=np.uint64)
+        self._probability = np.empty(capacity, dtype=np.float32)
+        self._users = np.empty(capacity, dtype=np.int64)
+        self._times = np.empty(capacity, dtype=np.float64)
+        self._labelled = np.empty(capacity, dtype=bool)  # label came from the model, not from a match
+        self._size = 0
+        self._indexed = 0
+        # The chunk tables, CSR-style: rows ordered by each chunk's value, all four
+        # orders concatenated; _starts[j * (CHUNK_VALUES + 1) + v] is where value v's bucket begins
+        self._orders = np.empty(0, dtype=np.int32)
+        self._starts = np.zeros(CHUNKS * (CHUNK_VALUES + 1), dtype=np.int64)
+        self._table_offsets = np.arange(CHUNKS) * (CHUNK_VALUES + 1)
+        self._probes = self._flip_masks(radius // CHUNKS)
+        self._lock = threading.Lock()
+        self._generation = 0  # bumped whenever rows move, which invalidates tables being built
+        self._rebuilding = False
+        self.lookups = 0
+        self.matches = 0
+        self.reused = 0
+        self.flagged = 0
+        self.rebuilds = 0
+        self.last_rebuild_ms = None
+
+    @staticmethod
+    def _flip_masks(bits):
+        """Every 16-bit mask with at most ``bits`` bits set"""
+        masks = [0]
+        for count in range(1, bits + 1):
+            masks += [sum(1 << i for i in combo) for combo in itertools.combinations(range(CHUNK_BITS), count)]
+        return np.array(masks, dtype=np.int64)
+
+    def __len__(self):
+        return self._size
+
+    def add(self, phash, probability, user_id, created_at=None, labelled=True):
+        self.add_many([phash], [probability], [user_id or 0], [created_at or time.time()], [labelled])
+
+    def add_many(self, hashes, probabilities, user_ids, created_at, labelled):
+        # More than max_entries at once: only the newest fit
+        hashes = np.asarray(hashes, dtype=np.uint64)[-self.max_entries:]
+        probabilities, user_ids, created_at, labelled = (np.asarray(values)[-self.max_entries:]
+                                                         for values in (probabilities, user_ids, created_at, labelled))
+        n = len(hashes)
+        with self._lock:
+            if self._size + n > self.max_entries:
+                self._drop_oldest(self._size + n - self.max_entries)
+            self._reserve(self._size + n)
+            end = self._size + n
+            self._hashes[self._size:end] = hashes
+            self._probability[self._size:end] = probabilities
+            self._users[self._size:end] = user_ids
+            self._times[self._size:end] = created_at
+            self._labelled[self._size:end] = labelled
+            self._size = end
+            if self._rebuild_due():
+                self._start_rebuild()
+
+    def within(self, phash, radius=None):
+        """``(rows, distances)`` of every entry within ``radius`` bits (default: the index radius)"""
+        radius = self.radius if radius is None else radius
+        with self._lock:
+            return self._within(phash, radius)
+
+    def within_brute_force(self, phash, radius=None):
+        """Same result as within() by comparing every entry (reference for tests and benchmarks)"""
+        radius = self.radius if radius is None else radius
+        with self._lock:
+            return self._scan(phash, radius)
+
+    def match(self, phash, user_id, repeat_window_s):
+        """The closest entry, the closest model-labelled one and ``user_id``'s recent repeats"""
+        with self._lock:
+            rows, distances = self._within(phash, self.radius)
+            self.lookups += 1
+            if not len(rows):
+                return Match(None, None, 0)
+            self.matches += 1
+            labelled = self._labelled[rows]
+            probability = None
+            if labelled.any():
+                probability = float(self._probability[rows[labelled][np.argmin(distances[labelled])]])
+            own = (self._users[rows] == (user_id or 0)) & (self._times[rows] >= time.time() - repeat_window_s)
+            return Match(probability, int(distances.min()), int(own.sum()))
+
+    def count(self, reused=0, flagged=0):
+        """Add to the reused-label and flagged-upload counters, which request threads share"""
+        with self._lock:
+            self.reused += reused
+            self.flagged += flagged
+
+    def rebuild(self):
+        """Index every entry now, on the calling thread (e.g. after loading at startup)"""
+        with self._lock:
+            started = time.perf_counter()
+            self._swap(self._build_tables(self._hashes[:self._size]), self._size, started)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": self._size,
+                "indexed": self._indexed,
+                "rebuilding": self._rebuilding,
+                "radius": self.radius,
+                "bytes": sum(a.nbytes for a in (self._hashes, self._probability, self._users, self._times,
+                                                self._labelled, self._orders, self._starts)),
+                "lookups": self.lookups,
+                "matches": self.matches,
+                "reused": self.reused,
+                "flagged": self.flagged,
+                "rebuilds": self.rebuilds,
+                "last_rebuild_ms": self.last_rebuild_ms,
+            }
+
+    def _within(self, phash, radius):
+        # Called with self._lock held
+        if self._size <= BRUTE_FORCE_MAX or not self._indexed:
+            return self._scan(phash, radius)
+        query = np.uint64(phash)
+        probes = self._probes if radius // CHUNKS == self.radius // CHUNKS else self._flip_masks(radius // CHUNKS)
+        chunks = np.array([(phash >> (CHUNK_BITS * j)) & (CHUNK_VALUES - 1) for j in range(CHUNKS)])
+        keys = (chunks[:, None] ^ probes[None, :]) + self._table_offsets[:, None]
+        lo, hi = self._starts[keys].ravel(), self._starts[keys + 1].ravel()
+        # Every bucket's slice of the concatenated chunk orders, as one index array
+        lengths = hi - lo
+        positions = np.repeat(lo - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        candidates = np.concatenate([self._orders[positions], np.arange(self._indexed, self._size)])
+        distances = popcount(self._hashes[candidates] ^ query).astype(np.int64)
+        keep = distances <= radius
+        # A row can sit in several probed buckets; only the few within range are deduplicated
+        rows, first = np.unique(candidates[keep], return_index=True)
+        return rows, distances[keep][first]
+
+    def _scan(self, phash, radius):
+        # Called with self._lock held
+        distances = popcount(self._hashes[:self._size] ^ np.uint64(phash))
+        rows = np.flatnonzero(distances <= radius)
+        return rows, distances[rows].astype(np.int64)
+
+    @staticmethod
+    def _build_tables(hashes):
+        """``(orders, starts)`` chunk tables over ``hashes``; needs no lock"""
+        size = len(hashes)
+        orders = np.empty(CHUNKS * size, dtype=np.int32)
+        starts = np.zeros(CHUNKS * (CHUNK_VALUES + 1), dtype=np.int64)
+        for j in range(CHUNKS):
+            chunk = ((hashes >> np.uint64(CHUNK_BITS * j)) & np.uint64(CHUNK_VALUES - 1)).astype(np.uint16)
+            orders[j * size:(j + 1) * size] = np.argsort(chunk, kind="stable")
+            table = starts[j * (CHUNK_VALUES + 1):(j + 1) * (CHUNK_VALUES + 1)]
+            np.cumsum(np.bincount(chunk, minlength=CHUNK_VALUES), out=table[1:])
+            table += j * size  # offsets into the concatenated orders
+        return orders, starts
+
+    def _swap(self, tables, size, started):
+        # Called with self._lock held; ``tables`` cover rows [0, size)
+        self._orders, self._starts = tables
+        self._indexed = size
+        self.rebuilds += 1
+        self.last_rebuild_ms = round((time.perf_counter() - started) * 1000.0, 2)
+
+    def _rebuild_due(self):
+        # Called with self._lock held
+        return self._size - self._indexed > max(REBUILD_MIN_PENDING, self._indexed // 8)
+
+    def _start_rebuild(self):
+        # Called with self._lock held
+        if not self._rebuilding:
+            self._rebuilding = True
+            threading.Thread(target=self._run_rebuild, name="near-duplicate-rebuild", daemon=True).start()
+
+    def _run_rebuild(self):
+        try:
+            while True:
+                with self._lock:
+                    # Rows below size are only rewritten by _drop_oldest, which bumps the generation;
+                    # growing replaces the array, leaving this view of the old one intact
+                    generation, size, hashes = self._generation, self._size, self._hashes[:self._size]
+                started = time.perf_counter()
+                tables = self._build_tables(hashes)
+                with self._lock:
+                    if generation == self._generation:
+                        self._swap(tables, size, started)
+                    if generation == self._generation and not self._rebuild_due():
+                        self._rebuilding = False
+                        return
+        except Exception as e:
+            print(f"Error rebuilding the near-duplicate index: {e}")
+            with self._lock:
+                self._rebuilding = False
+
+    def _reserve(self, size):
+        capacity = len(self._hashes)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        for name in ("_hashes", "_probability", "_users", "_times", "_labelled"):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    def _drop_oldest(self, count):
+        # Entries are in insertion order; drop a quarter extra so this runs rarely
+        count = min(self._size, max(count, self.max_entries // 4))
+        for name in ("_hashes", "_probability", "_users", "_times", "_labelled"):
+            array = getattr(self, name)
+            array[:self._size - count] = array[count:self._size].copy()
+        self._size -= count
+        # Rows moved: scan everything until the tables are rebuilt in the background
+        self._generation += 1
+        self._indexed = 0
+        self._orders = np.empty(0, dtype=np.int32)
+        self._start_rebuild()
+
+
+def ensure_upload_hashes(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS upload_hashes
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  digest TEXT NOT NULL,
+                  phash INTEGER NOT NULL,
+                  probability REAL NOT NULL,
+                  user_id INTEGER,
+                  labelled INTEGER NOT NULL,
+                  own_repeats INTEGER NOT NULL DEFAULT 0,
+                  created_at REAL NOT NULL)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_upload_hashes_digest ON upload_hashes (digest)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_upload_hashes_created ON upload_hashes (created_at)")
+
+
+def record_hash(digest, phash, probability, user_id, labelled, own_repeats, created_at, path=None):
+    with db.transaction(path) as c:
+        c.execute('''INSERT INTO upload_hashes (digest, phash, probability, user_id, labelled, own_repeats, created_at)
+                     VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                  (digest, _to_sqlite(phash), float(probability), user_id, int(labelled), own_repeats, created_at))
+
+
+def hash_for_digest(digest, path=None):
+    """The stored pHash of an upload seen before (e.g. a prediction cache hit), or None"""
+    row = db.query_one("SELECT phash FROM upload_hashes WHERE digest = ? LIMIT 1", (digest,), path=path)
+    return _from_sqlite(row[0]) if row else None
+
+
+def load_index(index, path=None):
+    """Fill ``index`` with the newest stored hashes (up to its max_entries); returns how many"""
+    rows = db.query_all('''SELECT phash, probability, user_id, created_at, labelled FROM
+                               (SELECT * FROM upload_hashes ORDER BY id DESC LIMIT ?)
+                           ORDER BY id''', (index.max_entries,), path=path)
+    if rows:
+        phashes, probabilities, user_ids, created_at, labelled = zip(*rows)
+        index.add_many(np.array(phashes, dtype=np.int64).view(np.uint64), probabilities,
+                       [user_id or 0 for user_id in user_ids], created_at, [bool(flag) for flag in labelled])
+        index.rebuild()
+    return len(rows)
+
+
+def repeat_report(since, min_repeats, path=None):
+    """Per user since ``since`` (epoch seconds): ``(user_id, name, email, uploads, repeats, flagged, max_repeats)``.
+
+    ``repeats`` counts uploads that had at least one earlier near-duplicate of
+    the user's own in the repeat window; ``flagged`` those with ``min_repeats``
+    or more. Users with nothing flagged are left out; most flagged first.
+    """
+    return db.query_all('''SELECT h.user_id, u.name, u.email, COUNT(*),
+                                  SUM(h.own_repeats > 0), SUM(h.own_repeats >= ?), MAX(h.own_repeats)
+                           FROM upload_hashes h LEFT JOIN users u ON u.id = h.user_id
+                           WHERE h.created_at >= ?
+                           GROUP BY h.user_id
+                           HAVING SUM(h.own_repeats >= ?) > 0
+                           ORDER BY SUM(h.own_repeats >= ?) DESC, COUNT(*) DESC''',
+                        (min_repeats, since, min_repeats, min_repeats), path=path)
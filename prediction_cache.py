@@ -0,0 +1,132 @@
+"""Content-addressed cache of model predictions."""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+import db
+
+
+def content_hash(data: bytes) -> str:
+    """SHA-256 hex digest of an upload's raw bytes"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def model_identity(model_path: str) -> str:
+    """Short fingerprint of the model file so a new model never reuses old predictions"""
+    try:
+        st = os.stat(model_path)
+        raw = f"{os.path.abspath(model_path)}:{st.st_size}:{st.st_mtime_ns}"
+    except OSError:
+        raw = os.path.abspath(model_path)
+    return hashlib.sha256(raw.encode()).hexdigest()[:16]
+
+
+class PredictionCache:
+    """Two-tier prediction cache: in-memory LRU with TTL, plus an optional SQLite tier.
+
+    Values are the raw prediction rows returned by the model, so callers still
+    run ``interpret_prediction`` on a hit exactly as on a miss.
+    """
+
+    def __init__(self, model_id, max_entries=10000, ttl_seconds=7 * 24 * 3600, db_path=None):
+        self.model_id = model_id
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = float(ttl_seconds) if ttl_seconds else None
+        self.db_path = db_path or None
+
+        self._entries = OrderedDict()  # key -> (preds, stored_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+
+        if self.db_path:
+            with db.transaction(self.db_path) as c:
+                c.execute('''CREATE TABLE IF NOT EXISTS prediction_cache
+                             (cache_key TEXT PRIMARY KEY,
+                              preds TEXT NOT NULL,
+                              stored_at REAL NOT NULL)''')
+
+    def key(self, digest):
+        return f"{self.model_id}:{digest}"
+
+    def get(self, digest):
+        """Return the cached prediction array for an upload hash, or None"""
+        key = self.key(digest)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                preds, stored_at = entry
+                if self.ttl is None or now - stored_at <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return preds
+                del self._entries[key]
+
+        preds = self._get_persistent(key, now)
+        with self._lock:
+            if preds is None:
+                self.misses += 1
+                return None
+            self.persistent_hits += 1
+            self._store(key, preds, now)
+        return preds
+
+    def put(self, digest, preds):
+        key = self.key(digest)
+        preds = np.asarray(preds)
+        now = time.time()
+        with self._lock:
+            self._store(key, preds, now)
+        self._put_persistent(key, preds, now)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "persistent": bool(self.db_path),
+                "hits": self.hits,
+                "persistent_hits": self.persistent_hits,
+                "misses": self.misses,
+            }
+
+    def _store(self, key, preds, stored_at):
+        # Called with self._lock held
+        self._entries[key] = (preds, stored_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _get_persistent(self, key, now):
+        if not self.db_path:
+            return None
+        try:
+            row = db.query_one("SELECT preds, stored_at FROM prediction_cache WHERE cache_key = ?",
+                               (key,), path=self.db_path)
+            if row and self.ttl is not None and now - row[1] > self.ttl:
+                with db.transaction(self.db_path) as c:
+                    c.execute("DELETE FROM prediction_cache WHERE cache_key = ?", (key,))
+                row = None
+        except sqlite3.Error as e:
+            print(f"Error reading prediction cache: {e}")
+            return None
+        return np.asarray(json.loads(row[0]), dtype=np.float32) if row else None
+
+    def _put_persistent(self, key, preds, stored_at):
+        if not self.db_path:
+            return
+        try:
+            with db.transaction(self.db_path) as c:
+                c.execute("INSERT OR REPLACE INTO prediction_cache (cache_key, preds, stored_at) VALUES (?, ?, ?)",
+                          (key, json.dumps(preds.tolist()), stored_at))
+        except sqlite3.Error as e:
+            print(f"Error writing prediction cache: {e}")
@@ -0,0 +1,77 @@
+"""In-memory image preprocessing for the classifier."""
+import io
+import threading
+
+import numpy as np
+from PIL import Image
+
+IMAGE_SIZE = (224, 224)  # (height, width) expected by the model
+
+
+def decode_image(data: bytes, size=IMAGE_SIZE, draft=True):
+    """Decode upload bytes into an RGB PIL image of the model's input size.
+
+    With ``draft`` enabled, JPEGs are downscaled by the decoder itself (DCT
+    scaling), which skips most of the full-resolution decode work. The draft
+    size never goes below the target, but the pixels the final
+    nearest-neighbour step picks come from the scaled decode, so the output
+    differs slightly from the reference pipeline: a mean absolute error
+    around 0.01 on photos, more on fine noise-like texture. Without ``draft``
+    the output matches it exactly.
+    """
+    height, width = size
+    img = Image.open(io.BytesIO(data))
+    if draft and img.format == "JPEG":
+        img.draft("RGB", (width, height))
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    if img.size != (width, height):
+        img = img.resize((width, height), Image.NEAREST)
+    return img
+
+
+def preprocess_bytes(data: bytes, out=None, draft=True):
+    """Decode and scale an image to a ``(1, H, W, 3)`` float32 array in [0, 1].
+
+    When ``out`` is given (a ``(1, H, W, 3)`` float32 view, e.g. a slot of a
+    :class:`BatchBuffer`) the pixels are written into it and it is returned,
+    so no intermediate float arrays are allocated.
+    """
+    img = decode_image(data, draft=draft)
+    if out is None:
+        out = np.empty((1,) + IMAGE_SIZE + (3,), dtype=np.float32)
+    np.divide(np.asarray(img), 255.0, out=out[0], dtype=np.float32)
+    return out
+
+
+class BatchBuffer:
+    """Preallocated float32 batch tensor that grows on demand and is reused."""
+
+    def __init__(self, capacity=1, size=IMAGE_SIZE):
+        self.size = size
+        self.array = np.empty((max(1, capacity),) + size + (3,), dtype=np.float32)
+
+    def reserve(self, n):
+        """Return a ``(n, H, W, 3)`` view, reallocating only if capacity is short"""
+        if n > self.array.shape[0]:
+            self.array = np.empty((n,) + self.size + (3,), dtype=np.float32)
+        return self.array[:n]
+
+    def slot(self, i):
+        return self.array[i:i + 1]
+
+
+_local = threading.local()
+
+
+def thread_buffer(n=1):
+    """Per-thread reusable batch buffer with room for at least ``n`` images.
+
+    The returned view is only valid until the same thread asks for a buffer
+    again, so consumers that outlive the request must copy it (``np.stack``
+    and ``model.predict`` both do).
+    """
+    buf = getattr(_local, "buffer", None)
+    if buf is None:
+        buf = _local.buffer = BatchBuffer(n)
+    return buf.reserve(n)
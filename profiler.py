@@ -0,0 +1,107 @@
+"""Low-overhead sampling profiler that can be switched on and off while serving.
+
+A daemon thread wakes every ``interval_ms``, reads every other thread's
+current stack with ``sys._current_frames()`` and counts it in collapsed form
+(``file:function;file:function ...``, root first), which flamegraph.pl and
+speedscope read directly. Nothing is traced between samples, so the cost is
+one stack walk per thread per interval; ``stats()`` reports the measured
+share of wall time spent sampling.
+"""
+import os
+import sys
+import threading
+import time
+
+MAX_DEPTH = 64
+TRUNCATED = "[other stacks]"
+
+
+class StackSampler:
+    """Aggregated stack samples of all threads in this process."""
+
+    def __init__(self, interval_ms=20.0, max_stacks=10000):
+        self.interval = interval_ms / 1000.0
+        self.max_stacks = max_stacks
+        self._counts = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.samples = 0
+        self.sampling_s = 0.0
+        self.started_at = None
+        self.enabled_s = 0.0  # wall time spent enabled, excluding the current run
+
+    @property
+    def enabled(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval_ms=None):
+        if interval_ms:
+            self.interval = max(1.0, float(interval_ms)) / 1000.0
+        if not self.enabled:
+            self._stop.clear()
+            self.started_at = time.time()
+            self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        if self.enabled:
+            self._stop.set()
+            self._thread.join(timeout)
+            self.enabled_s += time.time() - self.started_at
+        self.started_at = None
+
+    def reset(self):
+        with self._lock:
+            self._counts = {}
+            self.samples = 0
+            self.sampling_s = 0.0
+            self.enabled_s = 0.0
+            if self.started_at is not None:
+                self.started_at = time.time()
+
+    def collapsed(self, limit=None):
+        """``stack count`` lines, most frequent first"""
+        with self._lock:
+            items = sorted(self._counts.items(), key=lambda item: -item[1])
+        return "".join(f"{stack} {count}\n" for stack, count in items[:limit])
+
+    def stats(self):
+        with self._lock:
+            wall = self.enabled_s + (time.time() - self.started_at if self.started_at is not None else 0.0)
+            return {
+                "enabled": self.enabled,
+                "interval_ms": round(self.interval * 1000.0, 3),
+                "samples": self.samples,
+                "stacks": len(self._counts),
+                "overhead": round(self.sampling_s / wall, 5) if wall else None,
+            }
+
+    def sample(self):
+        """Take one sample of every thread except the sampler"""
+        started = time.perf_counter()
+        own = threading.get_ident()
+        stacks = []
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            names = []
+            while frame is not None and len(names) < MAX_DEPTH:
+                code = frame.f_code
+                names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            stacks.append(";".join(reversed(names)))
+        with self._lock:
+            for stack in stacks:
+                if stack not in self._counts and len(self._counts) >= self.max_stacks:
+                    stack = TRUNCATED
+                self._counts[stack] = self._counts.get(stack, 0) + 1
+            self.samples += 1
+            self.sampling_s += time.perf_counter() - started
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"Error sampling stacks: {e}")
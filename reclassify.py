@@ -0,0 +1,293 @@
+"""Offline re-classification of stored uploads, e.g. after shipping a new model.
+
+The stored originals (``originals/ab/cd/<sha256>.<ext>``, see upload_store.py)
+are listed in path order and streamed through a prefetching pipeline: while
+the model runs one batch, a thread pool reads and decodes the next
+``prefetch`` batches straight into their slots of reusable batch buffers.
+
+Each batch's results are upserted into ``predictions`` (one row per upload
+digest and model) in the same transaction that records the last path done in
+``reclassify_runs``, so an interrupted run of the same model resumes after the
+last committed batch. Runs record the pid of the process doing them, and one
+left "running" is only treated as interrupted once that process is gone.
+
+``label_diff`` compares the labels of two models over the uploads both have
+classified. Live labels recorded in ``upload_hashes`` (near_duplicates.py)
+are the baseline when no other model has been run. Files are decoded as the
+live path decodes uploads (same JPEG draft setting), but unless the store
+keeps originals as uploaded, the files read here are lossy transcodes
+(WebP/JPEG) of the bytes the live labels came from: a diff against LIVE mixes
+that recompression in with the model change. The report's
+``lossy_originals`` says when that is the case; a diff between two models
+re-classified here is not affected.
+"""
+import bisect
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import db
+from confidence import recyclable_probability
+from directory_import import owner_alive
+from preprocessing import BatchBuffer, preprocess_bytes
+
+RUNNING = "running"
+INTERRUPTED = "interrupted"
+COMPLETED = "completed"
+FAILED = "failed"
+
+LIVE = "live"  # label_diff baseline: labels given at upload time
+MAX_ERROR_SAMPLES = 10
+
+
+def ensure_prediction_tables(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS predictions
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  digest TEXT NOT NULL,
+                  file_path TEXT NOT NULL,
+                  model_id TEXT NOT NULL,
+                  probability REAL NOT NULL,
+                  recyclable INTEGER NOT NULL,
+                  run_id INTEGER,
+                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                  UNIQUE (digest, model_id))''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_predictions_model ON predictions (model_id, digest)")
+    c.execute('''CREATE TABLE IF NOT EXISTS reclassify_runs
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  model_id TEXT NOT NULL,
+                  model_path TEXT NOT NULL,
+                  upload_root TEXT NOT NULL,
+                  status TEXT NOT NULL,
+                  files_done INTEGER NOT NULL DEFAULT 0,
+                  last_path TEXT,
+                  errors INTEGER NOT NULL DEFAULT 0,
+                  error TEXT,
+                  owner_pid INTEGER,
+                  started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                  finished_at TIMESTAMP)''')
+    c.execute("PRAGMA table_info(reclassify_runs)")
+    if "owner_pid" not in {row[1] for row in c.fetchall()}:
+        c.execute("ALTER TABLE reclassify_runs ADD COLUMN owner_pid INTEGER")
+    _recover_runs(c)
+
+
+def _recover_runs(c, model_id=None, upload_root=None):
+    """Mark runs of killed processes interrupted (their batches are committed, so they resume);
+    returns the live runs, as ``(id, owner_pid)``, that match ``model_id`` and ``upload_root``"""
+    c.execute("SELECT id, model_id, upload_root, owner_pid FROM reclassify_runs WHERE status = ?", (RUNNING,))
+    live = []
+    for run_id, run_model, run_root, pid in c.fetchall():
+        if not owner_alive(pid):
+            c.execute("UPDATE reclassify_runs SET status = ? WHERE id = ?", (INTERRUPTED, run_id))
+        elif model_id is None or (run_model, run_root) == (model_id, upload_root):
+            live.append((run_id, pid))
+    return live
+
+
+def _digest(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def _decode(path, out, draft):
+    with open(path, "rb") as f:
+        preprocess_bytes(f.read(), out=out, draft=draft)
+
+
+class Reclassification:
+    """One pass of one model over the originals of an UploadStore.
+
+    ``predict`` takes a ``(n, H, W, 3)`` batch and returns the model's output
+    rows; ``interpret`` turns one ``(1, k)`` row into recyclable or not.
+    ``draft`` should match the live path's JPEG_DRAFT_DECODE.
+    Creating the job registers (or, unless ``restart``, resumes) a run in
+    ``reclassify_runs``; ``run()`` does the work and returns the report.
+    """
+
+    def __init__(self, store, predict, interpret, model_id, model_path, batch_size=128, workers=4, prefetch=2,
+                 restart=False, draft=True, db_path=None):
+        self.store = store
+        self.predict = predict
+        self.interpret = interpret
+        self.model_id = model_id
+        self.batch_size = max(1, int(batch_size))
+        self.workers = max(1, int(workers))
+        self.prefetch = max(1, int(prefetch))
+        self.draft = draft
+        self.db_path = db_path
+
+        with db.transaction(db_path) as c:
+            live = _recover_runs(c, model_id, store.root)
+            if live:
+                raise ValueError(f"Model {model_id} is already re-classifying {store.root} "
+                                 f"in process {live[0][1]} (run {live[0][0]})")
+            c.execute('''SELECT id, files_done, last_path, errors FROM reclassify_runs
+                         WHERE model_id = ? AND upload_root = ? AND status IN (?, ?) ORDER BY id DESC LIMIT 1''',
+                      (model_id, store.root, INTERRUPTED, FAILED))
+            previous = None if restart else c.fetchone()
+            if previous:
+                self.run_id, self.resumed_from, self.last_path, self.errors = previous
+                c.execute("UPDATE reclassify_runs SET status = ?, error = NULL, owner_pid = ? WHERE id = ?",
+                          (RUNNING, os.getpid(), self.run_id))
+            else:
+                c.execute('''INSERT INTO reclassify_runs (model_id, model_path, upload_root, status, owner_pid)
+                             VALUES (?, ?, ?, ?, ?)''', (model_id, model_path, store.root, RUNNING, os.getpid()))
+                self.run_id = c.lastrowid
+                self.resumed_from, self.last_path, self.errors = 0, None, 0
+        self.files_done = self.resumed_from
+        self.error_samples = []
+        self.status = RUNNING
+        self.seconds = 0.0
+        self.decode_wait_s = 0.0
+        self.inference_s = 0.0
+
+    def run(self, progress=None):
+        """Classify the remaining uploads; ``progress(report)`` is called after every batch"""
+        started = time.perf_counter()
+        paths = self.store.originals()
+        if self.last_path is not None:
+            paths = paths[bisect.bisect_right(paths, self.last_path):]
+        batches = [paths[i:i + self.batch_size] for i in range(0, len(paths), self.batch_size)]
+        # One buffer per batch in flight: the one being classified plus the prefetched ones
+        buffers = [BatchBuffer(self.batch_size) for _ in range(self.prefetch + 1)]
+        pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="reclassify-decode")
+        pending = deque()
+
+        def submit(n):
+            batch = buffers[n % len(buffers)].reserve(len(batches[n]))
+            pending.append((batches[n], batch, [pool.submit(_decode, path, batch[i:i + 1], self.draft)
+                                                for i, path in enumerate(batches[n])]))
+
+        try:
+            for n in range(min(self.prefetch, len(batches))):
+                submit(n)
+            for n in range(len(batches)):
+                batch_paths, batch, futures = pending.popleft()
+                if n + self.prefetch < len(batches):
+                    submit(n + self.prefetch)
+                waiting = time.perf_counter()
+                decoded = []
+                for i, (path, future) in enumerate(zip(batch_paths, futures)):
+                    try:
+                        future.result()
+                        decoded.append(i)
+                    except Exception as e:
+                        self._error(path, e)
+                self.decode_wait_s += time.perf_counter() - waiting
+                inferring = time.perf_counter()
+                preds = np.asarray(self.predict(batch[decoded] if len(decoded) < len(batch) else batch)) \
+                    if decoded else []
+                self.inference_s += time.perf_counter() - inferring
+                self._commit([(batch_paths[i], preds[row:row + 1]) for row, i in enumerate(decoded)],
+                             batch_paths[-1], len(batch_paths))
+                self.seconds = time.perf_counter() - started
+                if progress:
+                    progress(self.report())
+        except BaseException as e:
+            pool.shutdown(wait=True, cancel_futures=True)
+            self.seconds = time.perf_counter() - started
+            interrupted = isinstance(e, (KeyboardInterrupt, SystemExit))
+            self._finish(INTERRUPTED if interrupted else FAILED, None if interrupted else str(e))
+            raise
+        pool.shutdown(wait=True)
+        self.seconds = time.perf_counter() - started
+        self._finish(COMPLETED)
+        return self.report()
+
+    def report(self):
+        classified = self.files_done - self.resumed_from
+        return {
+            "run_id": self.run_id,
+            "model_id": self.model_id,
+            "status": self.status,
+            "files_done": self.files_done,
+            "resumed_from": self.resumed_from,
+            "errors": self.errors,
+            "error_samples": list(self.error_samples),
+            "seconds": round(self.seconds, 3),
+            "images_per_s": round(classified / self.seconds, 1) if self.seconds else None,
+            # Time the model sat idle waiting for decodes; near zero when the prefetch keeps up
+            "decode_wait_s": round(self.decode_wait_s, 3),
+            "inference_s": round(self.inference_s, 3),
+            # Originals are recompressed copies of the uploads: a diff against LIVE includes that loss
+            "lossy_originals": self.store.original_format != "original",
+        }
+
+    def _error(self, path, error):
+        self.errors += 1
+        if len(self.error_samples) < MAX_ERROR_SAMPLES:
+            self.error_samples.append(f"{path}: {error}")
+
+    def _commit(self, results, last_path, files):
+        """Upsert one batch's predictions and checkpoint its last path in the same transaction"""
+        rows = []
+        for path, preds in results:
+            rows.append((_digest(path), path, self.model_id, recyclable_probability(preds),
+                         int(bool(self.interpret(preds))), self.run_id))
+        with db.transaction(self.db_path) as c:
+            c.executemany('''INSERT INTO predictions (digest, file_path, model_id, probability, recyclable, run_id)
+                             VALUES (?, ?, ?, ?, ?, ?)
+                             ON CONFLICT(digest, model_id) DO UPDATE SET
+                                 file_path = excluded.file_path, probability = excluded.probability,
+                                 recyclable = excluded.recyclable, run_id = excluded.run_id,
+                                 created_at = CURRENT_TIMESTAMP''', rows)
+            c.execute("UPDATE reclassify_runs SET files_done = ?, last_path = ?, errors = ? WHERE id = ?",
+                      (self.files_done + files, last_path, self.errors, self.run_id))
+        self.files_done += files
+        self.last_path = last_path
+
+    def _finish(self, status, error=None):
+        with db.transaction(self.db_path) as c:
+            c.execute('''UPDATE reclassify_runs SET status = ?, error = ?, errors = ?, finished_at = CURRENT_TIMESTAMP
+                         WHERE id = ?''', (status, error, self.errors, self.run_id))
+        self.status = status
+
+
+def previous_model(model_id, db_path=None):
+    """The model classified most recently before ``model_id``, or LIVE if there is none"""
+    row = db.query_one('''SELECT model_id FROM reclassify_runs WHERE model_id != ?
+                          ORDER BY id DESC LIMIT 1''', (model_id,), path=db_path)
+    return row[0] if row else LIVE
+
+
+LOSSY_LIVE_CAVEAT = ("live labels came from the uploaded bytes, this model's from recompressed originals: "
+                     "part of the difference is compression, not the model")
+
+
+def label_diff(model_id, baseline=LIVE, db_path=None, samples=10, lossy_originals=False):
+    """How ``model_id``'s labels differ from ``baseline``'s (a model id, or LIVE) on the uploads both labelled.
+
+    Pass ``lossy_originals`` (from the run's report) to get the LIVE caveat in the result.
+    """
+    if baseline == LIVE:
+        # The first model-labelled hash per digest: near-duplicate reuses and cache hits only repeat it
+        old = '''SELECT digest, probability, probability > 0.5 AS recyclable FROM upload_hashes
+                 WHERE id IN (SELECT MIN(id) FROM upload_hashes WHERE labelled = 1 GROUP BY digest)'''
+        params = (model_id,)
+    else:
+        old = "SELECT digest, probability, recyclable FROM predictions WHERE model_id = ?"
+        params = (baseline, model_id)
+    rows = db.query_all(f'''SELECT new.digest, new.file_path, old.recyclable, new.recyclable,
+                                   old.probability, new.probability
+                            FROM ({old}) old JOIN predictions new ON new.digest = old.digest
+                            WHERE new.model_id = ?''', params, path=db_path)
+    old_labels = np.array([bool(row[2]) for row in rows], dtype=bool)
+    new_labels = np.array([bool(row[3]) for row in rows], dtype=bool)
+    shift = np.array([row[5] - row[4] for row in rows], dtype=np.float64)
+    changed = np.flatnonzero(old_labels != new_labels)
+    changed = changed[np.argsort(-np.abs(shift[changed]), kind="stable")]
+    return {
+        "model_id": model_id,
+        "baseline": baseline,
+        "compared": len(rows),
+        "agreement": round(float(np.mean(old_labels == new_labels)), 4) if rows else None,
+        "to_recyclable": int(np.sum(~old_labels & new_labels)),
+        "to_non_recyclable": int(np.sum(old_labels & ~new_labels)),
+        "mean_probability_shift": round(float(shift.mean()), 4) if rows else None,
+        "mean_abs_probability_shift": round(float(np.abs(shift).mean()), 4) if rows else None,
+        "changed_samples": [{"file_path": rows[i][1], "old_probability": round(rows[i][4], 4),
+                             "new_probability": round(rows[i][5], 4)} for i in changed[:samples].tolist()],
+        "caveat": LOSSY_LIVE_CAVEAT if baseline == LIVE and lossy_originals else None,
+    }
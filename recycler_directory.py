@@ -0,0 +1,308 @@
+"""In-memory snapshot of the recycler directory (recyclers and recycling centers).
+
+Both tables are small, read-mostly reference data, so they are loaded once
+into columns and searched in memory. Triggers bump a version counter on
+every write to either table; a background thread polls it and, when it
+changes, loads a new snapshot and swaps it in with a single reference
+assignment. A request reads ``directory.snapshot`` once and sees one
+consistent version throughout, without querying the database. Material
+filters use the snapshot's copy of the materials mapping (directory_search.py);
+free-text filters ask the FTS5 index for matching ids.
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+import db
+from directory_search import (TEXT_COLUMNS, load_material_postings, material_keys, query_terms, text_match_ids,
+                              text_words)
+from geo_distance import CoordinateColumns, refine_candidates
+from geo_index import bounding_boxes
+
+DIRECTORY_TABLES = ("recyclers", "recycling_centers")
+TEXT_MASK_CACHE_SIZE = 256
+
+
+class Recycler(NamedTuple):
+    id: int
+    name: str
+    description: Optional[str]
+    category: Optional[str]
+    email: Optional[str]
+    phone: Optional[str]
+    website: Optional[str]
+    address: Optional[str]
+    latitude: Optional[float]
+    longitude: Optional[float]
+    city: Optional[str]
+    accepts_recyclables: bool
+
+
+class RecyclingCenter(NamedTuple):
+    id: int
+    name: str
+    type: str
+    category: Optional[str]
+    address: Optional[str]
+    latitude: Optional[float]
+    longitude: Optional[float]
+    contact_email: Optional[str]
+    contact_phone: Optional[str]
+    website: Optional[str]
+    operating_hours: Optional[str]
+    accepted_materials: Optional[str]
+
+
+def ensure_directory_version(c, skip=()):
+    """Create the version counter and the triggers that bump it on every directory write.
+
+    Tables in ``skip`` (being bulk-imported, see directory_import.py) keep their triggers dropped.
+    """
+    c.execute('''CREATE TABLE IF NOT EXISTS directory_version
+                 (id INTEGER PRIMARY KEY CHECK (id = 1),
+                  version INTEGER NOT NULL)''')
+    c.execute("INSERT OR IGNORE INTO directory_version (id, version) VALUES (1, 0)")
+    for table in DIRECTORY_TABLES:
+        if table in skip:
+            continue
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            c.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_version_{event.lower()} AFTER {event} ON {table}
+                          BEGIN
+                              UPDATE directory_version SET version = version + 1 WHERE id = 1;
+                          END''')
+
+
+def like_pattern(needle):
+    """Compiled equivalent of SQL ``LIKE '%needle%'`` (case-insensitive, ``%`` / ``_`` wildcards)"""
+    parts = (".*" if ch == "%" else "." if ch == "_" else re.escape(ch) for ch in needle)
+    return re.compile("".join(parts), re.IGNORECASE | re.DOTALL)
+
+
+class DirectoryTable:
+    """One table as columns; index ``i`` of every column is the same row.
+
+    Rows are in id order. Located rows are also kept sorted by latitude so a
+    search-circle bounding box becomes two binary searches and a longitude mask.
+    """
+
+    def __init__(self, record_type, rows):
+        self.record_type = record_type
+        self.columns = {name: tuple(values) for name, values in zip(record_type._fields, zip(*rows))} \
+            if rows else {name: () for name in record_type._fields}
+        self._index = {row_id: i for i, row_id in enumerate(self.columns["id"])}
+        self.ids = np.fromiter(self.columns["id"], dtype=np.int64, count=len(self._index))
+        self._factors = {}
+        self._text = None
+        self.text_masks = OrderedDict()  # memoized free-text filters for this snapshot
+
+        # Rows with a falsy coordinate have never been searchable
+        lats = self.columns["latitude"]
+        lons = self.columns["longitude"]
+        located = np.array([i for i in range(len(lats)) if lats[i] and lons[i]], dtype=np.int64)
+        self.coords = CoordinateColumns([float(lats[i]) if lats[i] else np.nan for i in range(len(lats))],
+                                        [float(lons[i]) if lons[i] else np.nan for i in range(len(lons))])
+        self._lat_order = located[np.argsort(self.coords.lat[located], kind="stable")]
+        self._lat_sorted = self.coords.lat[self._lat_order]
+
+    def __len__(self):
+        return len(self._index)
+
+    def record(self, i):
+        return self.record_type(*(self.columns[name][i] for name in self.record_type._fields))
+
+    def get(self, row_id):
+        """The record with this id (ints or numeric strings, as SQLite would coerce), or None"""
+        try:
+            i = self._index.get(int(row_id))
+        except (TypeError, ValueError):
+            return None
+        return self.record(i) if i is not None else None
+
+    def mask(self, name, predicate):
+        """Boolean array over rows: ``predicate(value)`` for column ``name``, called once per distinct value"""
+        codes, values = self._factorized(name)
+        return np.fromiter((bool(predicate(value)) for value in values), dtype=bool, count=len(values))[codes]
+
+    def positions(self, ids):
+        """Row indices of the sorted array ``ids`` (ids not in this snapshot are dropped)"""
+        if not len(ids) or not len(self):
+            return np.empty(0, dtype=np.int64)
+        positions = np.searchsorted(self.ids, ids)
+        positions = positions[positions < len(self)]
+        return positions[self.ids[positions] == ids[:len(positions)]]
+
+    def row_mask(self, positions):
+        found = np.zeros(len(self), dtype=bool)
+        found[positions] = True
+        return found
+
+    def text_mask(self, columns, terms):
+        """Rows where every term starts a word of ``columns`` (like the FTS5 prefix query); the no-FTS5 fallback"""
+        if self._text is None:
+            self._text = [text_words(" ".join(str(self.columns[name][i] or "") for name in columns))
+                          for i in range(len(self))]
+        return np.fromiter((all(any(word.startswith(term) for word in words) for term in terms)
+                            for words in self._text), dtype=bool, count=len(self))
+
+    def _factorized(self, name):
+        factors = self._factors.get(name)
+        if factors is None:
+            lookup = {}
+            codes = np.fromiter((lookup.setdefault(value, len(lookup)) for value in self.columns[name]),
+                                dtype=np.int64, count=len(self))
+            factors = self._factors[name] = (codes, list(lookup))
+        return factors
+
+    def nearby(self, lat, lon, max_distance_km, limit, exact, where=None, slack_km=0.0):
+        """``(record, exact_km)`` for the rows that can rank among the closest ``limit``.
+
+        Same contract as ``refine_candidates``; ``where`` is an optional
+        boolean row mask applied before any distance is computed.
+        """
+        idx = self._in_boxes(bounding_boxes(lat, lon, max_distance_km))
+        if where is not None:
+            idx = idx[where[idx]]
+        indices, distances = refine_candidates(lat, lon, self.coords.take(idx), max_distance_km, limit,
+                                               exact, slack_km=slack_km)
+        return [(self.record(i), d) for i, d in zip(idx[indices].tolist(), distances.tolist())]
+
+    def _in_boxes(self, boxes):
+        parts = []
+        for min_lat, max_lat, min_lon, max_lon in boxes:
+            lo = np.searchsorted(self._lat_sorted, min_lat, side="left")
+            hi = np.searchsorted(self._lat_sorted, max_lat, side="right")
+            candidates = self._lat_order[lo:hi]
+            lons = self.coords.lon[candidates]
+            parts.append(candidates[(lons >= min_lon) & (lons <= max_lon)])
+        return np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+
+
+class DirectorySnapshot:
+    """Immutable view of both directory tables at one version."""
+
+    def __init__(self, version, recycler_rows, center_rows, material_postings=None):
+        self.version = version
+        self.recyclers = DirectoryTable(Recycler, recycler_rows)
+        self.centers = DirectoryTable(RecyclingCenter, center_rows)
+        # material -> center row indices, resolved once per snapshot
+        self.material_rows = {material: self.centers.positions(ids)
+                              for material, ids in (material_postings or {}).items()}
+        # accepts_recyclables is a SQLite BOOLEAN: the old queries matched it with "= 1" / "= TRUE"
+        self.accepting = self.recyclers.mask("accepts_recyclables", lambda value: value == 1)
+        self.loaded_at = time.time()
+
+    def accepting_recyclers(self, limit):
+        """The first ``limit`` recyclers (by id) that accept recyclables"""
+        return [self.recyclers.record(i) for i in np.flatnonzero(self.accepting)[:limit].tolist()]
+
+    def material_mask(self, materials):
+        """Centers that accept every one of ``materials`` (any spelling normalize_materials knows)"""
+        found = np.ones(len(self.centers), dtype=bool)
+        for key in material_keys(materials):
+            found &= self.centers.row_mask(self.material_rows.get(key, np.empty(0, dtype=np.int64)))
+        return found
+
+
+class RecyclerDirectory:
+    """Holds the current DirectorySnapshot and replaces it when the tables change.
+
+    ``refresh()`` reloads if the version moved (call it after writing the
+    tables in this process to see the change at once); the background thread
+    started by ``start()`` does the same every ``refresh_interval_s``.
+    """
+
+    def __init__(self, db_path=None, refresh_interval_s=2.0):
+        self.db_path = db_path
+        self.refresh_interval = refresh_interval_s
+        self._snapshot = None
+        self._refresh_lock = threading.Lock()
+        self._text_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.loads = 0
+        self.last_load_ms = None
+        self.errors = 0
+
+    @property
+    def snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            snapshot = self.refresh()
+        return snapshot
+
+    def refresh(self, force=False):
+        """Load a new snapshot if the directory version changed; returns the current one"""
+        with self._refresh_lock:
+            # Read the version before the rows: a write in between only triggers one more reload
+            version = db.query_one("SELECT version FROM directory_version WHERE id = 1", path=self.db_path)[0]
+            current = self._snapshot
+            if current is not None and current.version == version and not force:
+                return current
+            started = time.perf_counter()
+            recyclers = db.query_all(f"SELECT {', '.join(Recycler._fields)} FROM recyclers ORDER BY id",
+                                     path=self.db_path)
+            centers = db.query_all(f"SELECT {', '.join(RecyclingCenter._fields)} FROM recycling_centers ORDER BY id",
+                                   path=self.db_path)
+            snapshot = DirectorySnapshot(version, recyclers, centers, load_material_postings(self.db_path))
+            self._snapshot = snapshot
+            self.loads += 1
+            self.last_load_ms = round((time.perf_counter() - started) * 1000.0, 2)
+            return snapshot
+
+    def text_mask(self, snapshot, table, query):
+        """Rows of ``snapshot``'s ``table`` matching a free-text query: FTS5, else a substring scan.
+
+        Results are memoized on the snapshot (read-only arrays), so they are dropped with it.
+        """
+        rows = snapshot.recyclers if table == "recyclers" else snapshot.centers
+        key = tuple(query_terms(query))
+        found = rows.text_masks.get(key)
+        if found is None:
+            ids = text_match_ids(table, query, path=self.db_path)
+            if ids is None:
+                found = rows.text_mask(TEXT_COLUMNS[table], key)
+            else:
+                found = rows.row_mask(rows.positions(ids))
+            found.flags.writeable = False
+            with self._text_lock:
+                rows.text_masks[key] = found
+                while len(rows.text_masks) > TEXT_MASK_CACHE_SIZE:
+                    rows.text_masks.popitem(last=False)
+        return found
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="directory-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            "version": snapshot.version if snapshot else None,
+            "recyclers": len(snapshot.recyclers) if snapshot else None,
+            "recycling_centers": len(snapshot.centers) if snapshot else None,
+            "loaded_at": snapshot.loaded_at if snapshot else None,
+            "loads": self.loads,
+            "last_load_ms": self.last_load_ms,
+            "errors": self.errors,
+        }
+
+    def _run(self):
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                self.errors += 1
+                print(f"Error refreshing recycler directory: {e}")
+            finally:
+                db.release()
@@ -0,0 +1,222 @@
+"""Reward settlement: pending reward records, batched payouts, retries."""
+import hashlib
+import random
+import threading
+import time
+import uuid
+
+import db
+from activity_log import INSERT_ACTIVITY
+from metrics import Histogram
+
+PENDING = "pending"      # recorded, not yet assigned to a payout
+BATCHED = "batched"      # part of a payout that has not settled yet
+SETTLED = "settled"
+FAILED = "failed"
+
+
+def ensure_reward_tables(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS pending_rewards
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  idempotency_key TEXT UNIQUE NOT NULL,
+                  user_id INTEGER NOT NULL,
+                  wallet_address TEXT NOT NULL,
+                  points INTEGER NOT NULL,
+                  status TEXT NOT NULL DEFAULT 'pending',
+                  payout_id INTEGER,
+                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                  FOREIGN KEY (user_id) REFERENCES users (id),
+                  FOREIGN KEY (payout_id) REFERENCES reward_payouts (id))''')
+    c.execute('''CREATE TABLE IF NOT EXISTS reward_payouts
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  idempotency_key TEXT UNIQUE NOT NULL,
+                  wallet_address TEXT NOT NULL,
+                  points INTEGER NOT NULL,
+                  reward_count INTEGER NOT NULL,
+                  status TEXT NOT NULL DEFAULT 'pending',
+                  attempts INTEGER NOT NULL DEFAULT 0,
+                  next_attempt_at REAL NOT NULL DEFAULT 0,
+                  tx_hash TEXT,
+                  last_error TEXT,
+                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                  settled_at TIMESTAMP)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_pending_rewards_status ON pending_rewards (status, wallet_address)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_pending_rewards_user ON pending_rewards (user_id, created_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_reward_payouts_due ON reward_payouts (status, next_attempt_at)")
+
+
+class SimulatedRewardBackend:
+    """Stand-in for a chain / payment API: returns dummy tx hashes.
+
+    ``latency_ms`` and ``failure_rate`` let tests and benchmarks inject a slow
+    or flaky backend. Repeating an idempotency key returns the original tx
+    hash instead of paying again, like a real payment API would.
+    """
+
+    def __init__(self, latency_ms=0.0, failure_rate=0.0):
+        self.latency = latency_ms / 1000.0
+        self.failure_rate = failure_rate
+        self._sent = {}
+        self._lock = threading.Lock()
+
+    def send_payout(self, wallet_address, points, idempotency_key):
+        if not wallet_address:
+            raise ValueError("Invalid wallet")
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            if idempotency_key in self._sent:
+                return self._sent[idempotency_key]
+            if random.random() < self.failure_rate:
+                raise ConnectionError("Simulated reward backend failure")
+            tx_hash = f"SIMULATED_TX_HASH_{uuid.uuid4().hex[:8]}"
+            self._sent[idempotency_key] = tx_hash
+            return tx_hash
+
+
+def record_reward(user_id, wallet_address, points, idempotency_key=None, activity=()):
+    """Record a reward to be paid out later; repeating a key is a no-op.
+
+    ``activity`` holds the (user_id, type, details, points) rows that earned
+    it; they are inserted in the same transaction as a new reward, so the
+    points are either recorded with it or not at all and a retry cannot skip them.
+
+    Returns ``(idempotency_key, created)``: the key doubles as the reward's
+    public id, and ``created`` is False when the key had already been recorded.
+    """
+    idempotency_key = idempotency_key or uuid.uuid4().hex
+    with db.transaction() as c:
+        c.execute('''INSERT OR IGNORE INTO pending_rewards (idempotency_key, user_id, wallet_address, points)
+                     VALUES (?, ?, ?, ?)''', (idempotency_key, user_id, wallet_address, points))
+        created = c.rowcount > 0
+        if created and activity:
+            c.executemany(INSERT_ACTIVITY, activity)
+    return idempotency_key, created
+
+
+def reward_status(user_id, idempotency_key=None, limit=50):
+    """Rewards of one user (optionally one reward) with their payout state"""
+    sql = '''SELECT r.idempotency_key, r.points, r.status, r.wallet_address, r.created_at,
+                    p.tx_hash, p.attempts, p.last_error, p.settled_at
+             FROM pending_rewards r LEFT JOIN reward_payouts p ON p.id = r.payout_id
+             WHERE r.user_id = ?'''
+    params = [user_id]
+    if idempotency_key:
+        sql += " AND r.idempotency_key = ?"
+        params.append(idempotency_key)
+    sql += " ORDER BY r.created_at DESC, r.id DESC LIMIT ?"
+    params.append(limit)
+    return [{
+        "id": row[0],
+        "points": row[1],
+        "status": row[2],
+        "wallet_address": row[3],
+        "created_at": row[4],
+        "tx_hash": row[5],
+        "attempts": row[6] or 0,
+        "last_error": row[7],
+        "settled_at": row[8],
+    } for row in db.query_all(sql, params)]
+
+
+class RewardSettler:
+    """Background settler that pays out pending rewards in per-wallet batches.
+
+    Each pass groups unassigned rewards by wallet into one payout row whose
+    idempotency key is derived from the reward ids, then sends every due
+    payout. Failures are retried with exponential backoff until
+    ``max_attempts``; because the key is stored before the first send, a
+    crash between a successful send and the DB update is retried safely.
+    """
+
+    def __init__(self, backend, interval_s=5.0, max_attempts=6, base_backoff_s=2.0, max_backoff_s=300.0):
+        self.backend = backend
+        self.interval = interval_s
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff_s
+        self.max_backoff = max_backoff_s
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.payout_ms_hist = Histogram((1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000))
+        self.payouts_settled = 0
+        self.payouts_failed = 0
+        self.send_errors = 0
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="reward-settler", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self):
+        counts = dict(db.query_all("SELECT status, COUNT(*) FROM pending_rewards GROUP BY status"))
+        return {
+            "rewards": counts,
+            "payouts_settled": self.payouts_settled,
+            "payouts_failed": self.payouts_failed,
+            "send_errors": self.send_errors,
+            "payout_ms": self.payout_ms_hist.snapshot(),
+        }
+
+    def settle_once(self):
+        """Batch pending rewards and send every due payout; returns payouts settled"""
+        self._create_payouts()
+        settled = 0
+        due = db.query_all('''SELECT id, idempotency_key, wallet_address, points, attempts FROM reward_payouts
+                              WHERE status = ? AND next_attempt_at <= ? ORDER BY id''', (PENDING, time.time()))
+        for payout in due:
+            settled += self._send(*payout)
+        return settled
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.settle_once()
+            except Exception as e:
+                print(f"Error settling rewards: {e}")
+            self._stop.wait(self.interval)
+
+    def _create_payouts(self):
+        with db.transaction() as c:
+            c.execute('''SELECT wallet_address, GROUP_CONCAT(id), SUM(points), COUNT(*) FROM pending_rewards
+                         WHERE status = ? GROUP BY wallet_address''', (PENDING,))
+            for wallet_address, ids, points, count in c.fetchall():
+                reward_ids = sorted(int(i) for i in ids.split(","))
+                key = hashlib.sha256(f"{wallet_address}:{reward_ids}".encode()).hexdigest()[:32]
+                c.execute('''INSERT INTO reward_payouts (idempotency_key, wallet_address, points, reward_count)
+                             VALUES (?, ?, ?, ?)''', (key, wallet_address, points, count))
+                payout_id = c.lastrowid
+                c.executemany("UPDATE pending_rewards SET status = ?, payout_id = ? WHERE id = ?",
+                              [(BATCHED, payout_id, reward_id) for reward_id in reward_ids])
+
+    def _send(self, payout_id, key, wallet_address, points, attempts):
+        started = time.perf_counter()
+        try:
+            tx_hash = self.backend.send_payout(wallet_address, points, key)
+        except Exception as e:
+            self.send_errors += 1
+            attempts += 1
+            status = FAILED if attempts >= self.max_attempts else PENDING
+            backoff = min(self.max_backoff, self.base_backoff * (2 ** (attempts - 1)))
+            with db.transaction() as c:
+                c.execute('''UPDATE reward_payouts SET attempts = ?, status = ?, next_attempt_at = ?, last_error = ?
+                             WHERE id = ?''', (attempts, status, time.time() + backoff, str(e), payout_id))
+                if status == FAILED:
+                    c.execute("UPDATE pending_rewards SET status = ? WHERE payout_id = ?", (FAILED, payout_id))
+                    self.payouts_failed += 1
+            return 0
+
+        self.payout_ms_hist.observe((time.perf_counter() - started) * 1000.0)
+        with db.transaction() as c:
+            c.execute('''UPDATE reward_payouts SET status = ?, tx_hash = ?, attempts = ?, last_error = NULL,
+                                                   settled_at = CURRENT_TIMESTAMP
+                         WHERE id = ?''', (SETTLED, tx_hash, attempts + 1, payout_id))
+            c.execute("UPDATE pending_rewards SET status = ? WHERE payout_id = ?", (SETTLED, payout_id))
+        self.payouts_settled += 1
+        return 1
@@ -0,0 +1,82 @@
+"""Shared fixtures: a scratch database with the tables under test, and live / dead process ids."""
+import subprocess
+import sys
+
+import pytest
+
+import db
+from directory_import import ensure_import_tables
+from directory_search import ensure_search_indexes
+from near_duplicates import ensure_upload_hashes
+from reclassify import ensure_prediction_tables
+from recycler_directory import DIRECTORY_TABLES, ensure_directory_version
+from rewards import ensure_reward_tables
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """A fresh database, also made the default one, with the schema init_db() creates for these modules"""
+    path = str(tmp_path / "sortify.db")
+    monkeypatch.setattr(db, "DATABASE", path)
+    with db.transaction(path) as c:
+        c.execute('''CREATE TABLE user_activity
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      user_id INTEGER NOT NULL,
+                      activity_type TEXT NOT NULL,
+                      activity_details TEXT,
+                      points_earned INTEGER DEFAULT 0,
+                      created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+        c.execute('''CREATE TABLE recyclers
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      name TEXT NOT NULL,
+                      description TEXT,
+                      category TEXT,
+                      email TEXT,
+                      phone TEXT,
+                      website TEXT,
+                      address TEXT,
+                      latitude REAL,
+                      longitude REAL,
+                      city TEXT,
+                      accepts_recyclables BOOLEAN DEFAULT TRUE,
+                      created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+        c.execute('''CREATE TABLE recycling_centers
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      name TEXT NOT NULL,
+                      type TEXT NOT NULL,
+                      category TEXT,
+                      address TEXT,
+                      latitude REAL,
+                      longitude REAL,
+                      contact_email TEXT,
+                      contact_phone TEXT,
+                      website TEXT,
+                      operating_hours TEXT,
+                      accepted_materials TEXT,
+                      created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+        ensure_directory_version(c)
+        for table in DIRECTORY_TABLES:
+            ensure_search_indexes(c, table)
+        ensure_import_tables(c)
+        ensure_prediction_tables(c)
+        ensure_upload_hashes(c)
+        ensure_reward_tables(c)
+    yield path
+    db.close_all()
+
+
+@pytest.fixture
+def live_pid():
+    """Pid of another process that stays up for the test"""
+    process = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"])
+    yield process.pid
+    process.kill()
+    process.wait()
+
+
+@pytest.fixture
+def dead_pid():
+    """Pid of a process that has already exited"""
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
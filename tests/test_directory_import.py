@@ -0,0 +1,115 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+import db
+import directory_import
+from directory_import import DirectoryImport, ensure_import_tables, import_status, tables_being_imported
+from directory_search import search_triggers
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    path = tmp_path / "centers.csv"
+    rows = [f"{i},Center {i},NGO,{12.0 + i / 100:.4f},{77.0 + i / 100:.4f},Plastic; Glass" for i in range(1, 11)]
+    path.write_text("id,name,type,latitude,longitude,accepted_materials\n" + "\n".join(rows) + "\n")
+    return str(path)
+
+
+def crash_import(path, db_path, chunk_size):
+    """Run an import in another process that is killed (no cleanup) after its first chunk"""
+    script = textwrap.dedent(f"""
+        import os
+        from directory_import import DirectoryImport
+        job = DirectoryImport({path!r}, "recycling_centers", chunk_size={chunk_size}, db_path={db_path!r})
+        job.run(progress=lambda report: os._exit(9))
+    """)
+    result = subprocess.run([sys.executable, "-c", script], cwd=ROOT, env={**os.environ, "PYTHONPATH": ROOT})
+    assert result.returncode == 9
+
+
+def triggers(db_path):
+    return {row[0] for row in db.query_all("SELECT name FROM sqlite_master WHERE type = 'trigger'", path=db_path)}
+
+
+def directory_version(db_path):
+    return db.query_one("SELECT version FROM directory_version WHERE id = 1", path=db_path)[0]
+
+
+def latest_run(db_path):
+    return import_status(db.query_one("SELECT MAX(id) FROM directory_imports", path=db_path)[0], db_path)
+
+
+def add_run(db_path, pid, table="recycling_centers"):
+    with db.transaction(db_path) as c:
+        c.execute('''INSERT INTO directory_imports (fingerprint, source, target_table, format, status, owner_pid)
+                     VALUES ('f', 'test', ?, 'csv', ?, ?)''', (table, directory_import.RUNNING, pid))
+        return c.lastrowid
+
+
+def test_import_upserts_and_restores_indexes(dataset, db_path):
+    report = DirectoryImport(dataset, "recycling_centers", chunk_size=4, db_path=db_path).run()
+    assert (report["status"], report["inserted"], report["rejected"]) == (directory_import.COMPLETED, 10, 0)
+    assert set(search_triggers("recycling_centers")) <= triggers(db_path)
+
+    again = DirectoryImport(dataset, "recycling_centers", chunk_size=4, source="centers", db_path=db_path,
+                            restart=True).run()
+    assert (again["inserted"], again["updated"]) == (0, 10)
+
+
+def test_crashed_import_is_recovered_then_resumed(dataset, db_path):
+    version = directory_version(db_path)
+    crash_import(dataset, db_path, chunk_size=4)
+
+    crashed = latest_run(db_path)
+    assert (crashed["status"], crashed["rows_done"]) == (directory_import.RUNNING, 4)
+    assert not set(search_triggers("recycling_centers")) & triggers(db_path)
+    assert tables_being_imported(db.get_db(db_path).cursor()) == set()
+
+    # Startup recovery (the caller has recreated the triggers) repairs the indexes the dead run skipped
+    with db.transaction(db_path) as c:
+        ensure_import_tables(c)
+    assert import_status(crashed["id"], db_path)["status"] == directory_import.INTERRUPTED
+    assert directory_version(db_path) == version + 1
+    indexed = db.query_one("SELECT COUNT(DISTINCT center_id) FROM recycling_center_materials", path=db_path)[0]
+    assert indexed == 4
+
+    resumed = DirectoryImport(dataset, "recycling_centers", chunk_size=4, db_path=db_path)
+    assert (resumed.run_id, resumed.resumed_from) == (crashed["id"], 4)
+    report = resumed.run()
+    assert (report["status"], report["rows_done"], report["inserted"]) == (directory_import.COMPLETED, 10, 10)
+    assert db.query_one("SELECT COUNT(*) FROM recycling_centers WHERE import_key IS NOT NULL",
+                        path=db_path)[0] == 10
+
+
+def test_live_import_is_left_alone(dataset, db_path, live_pid):
+    run_id = add_run(db_path, live_pid)
+    version = directory_version(db_path)
+    with db.transaction(db_path) as c:
+        ensure_import_tables(c)
+        assert tables_being_imported(c) == {"recycling_centers"}
+    assert import_status(run_id, db_path)["status"] == directory_import.RUNNING
+    assert directory_version(db_path) == version
+
+
+def test_same_file_cannot_be_imported_twice_at_once(dataset, db_path, live_pid):
+    job = DirectoryImport(dataset, "recycling_centers", db_path=db_path)
+    with db.transaction(db_path) as c:
+        c.execute("UPDATE directory_imports SET owner_pid = ? WHERE id = ?", (live_pid, job.run_id))
+    with pytest.raises(ValueError, match="already being imported"):
+        DirectoryImport(dataset, "recycling_centers", db_path=db_path)
+
+
+def test_dead_owner_and_legacy_runs_count_as_crashed(db_path, dead_pid):
+    dead = add_run(db_path, dead_pid)
+    legacy = add_run(db_path, None, "recyclers")
+    with db.transaction(db_path) as c:
+        assert tables_being_imported(c) == set()
+        ensure_import_tables(c)
+    assert import_status(dead, db_path)["status"] == directory_import.INTERRUPTED
+    assert import_status(legacy, db_path)["status"] == directory_import.INTERRUPTED
@@ -0,0 +1,96 @@
+import time
+
+import numpy as np
+import pytest
+
+from near_duplicates import BRUTE_FORCE_MAX, NearDuplicateIndex, hamming, perceptual_hash
+
+
+def flip(phash, bits):
+    for bit in bits:
+        phash ^= 1 << int(bit)
+    return phash
+
+
+def same_result(a, b):
+    order_a, order_b = np.argsort(a[0]), np.argsort(b[0])
+    return np.array_equal(a[0][order_a], b[0][order_b]) and np.array_equal(a[1][order_a], b[1][order_b])
+
+
+def textured(seed=0):
+    """A 224x224 image of random colour blocks, in [0, 1]"""
+    cells = np.random.default_rng(seed).random((7, 7, 3))
+    return np.kron(cells, np.ones((32, 32, 1))).astype(np.float32)
+
+
+@pytest.mark.parametrize("size", [500, BRUTE_FORCE_MAX + 5000])
+def test_within_matches_brute_force(size):
+    rng = np.random.default_rng(size)
+    index = NearDuplicateIndex(radius=8)
+    hashes = rng.integers(0, 2 ** 63, size, dtype=np.uint64) * 2 + rng.integers(0, 2, size, dtype=np.uint64)
+    queries = [int(h) for h in hashes[:20]]
+    # Plant neighbours at every distance up to and past the radius
+    near = [flip(query, rng.choice(64, distance, replace=False)) for query in queries for distance in range(11)]
+    index.add_many(np.concatenate([hashes, np.array(near, dtype=np.uint64)]), np.full(size + len(near), 0.5),
+                   np.zeros(size + len(near)), np.full(size + len(near), time.time()),
+                   np.ones(size + len(near), dtype=bool))
+    index.rebuild()
+    # Entries added after the rebuild are found through the pending scan
+    index.add(flip(queries[0], [1, 2]), 0.5, 0)
+
+    for query in queries:
+        for radius in (0, 3, 8):
+            rows, distances = index.within(query, radius)
+            assert same_result((rows, distances), index.within_brute_force(query, radius))
+            assert (distances <= radius).all()
+        assert len(index.within(query)[0]) >= 9
+
+
+def test_radius_must_fit_the_hash():
+    with pytest.raises(ValueError):
+        NearDuplicateIndex(radius=32)
+
+
+def test_flat_images_are_not_hashed():
+    flat = np.full((224, 224, 3), 0.6, dtype=np.float32)
+    noisy = flat + np.random.default_rng(1).normal(0, 0.01, flat.shape).astype(np.float32)
+    assert perceptual_hash(flat) is None
+    assert perceptual_hash(noisy) is None
+
+
+def test_hash_is_stable_under_small_changes():
+    image = textured()
+    phash = perceptual_hash(image)
+    assert phash is not None
+    assert perceptual_hash(image[None]) == phash
+    noisy = np.clip(image + np.random.default_rng(2).normal(0, 0.02, image.shape), 0, 1).astype(np.float32)
+    assert hamming(phash, perceptual_hash(noisy)) <= 6
+    assert hamming(phash, perceptual_hash(textured(seed=7))) >= 16
+
+
+def test_match_reports_closest_label_and_own_recent_repeats():
+    index = NearDuplicateIndex(radius=6)
+    base = perceptual_hash(textured())
+    now = time.time()
+    index.add(flip(base, [0]), 0.9, user_id=1, created_at=now)
+    index.add(base, 0.1, user_id=1, created_at=now, labelled=False)  # a reused label: counts, lends nothing
+    index.add(flip(base, [0, 1, 2]), 0.3, user_id=2, created_at=now)
+    index.add(flip(base, [3]), 0.7, user_id=1, created_at=now - 7200)  # outside the repeat window
+
+    match = index.match(base, user_id=1, repeat_window_s=3600)
+    assert match.distance == 0
+    assert match.probability == pytest.approx(0.9)
+    assert match.own_repeats == 2
+
+    assert index.match(base, user_id=3, repeat_window_s=3600).own_repeats == 0
+    assert index.match(flip(base, range(20)), user_id=1, repeat_window_s=3600) == (None, None, 0)
+    assert (index.lookups, index.matches) == (3, 2)
+
+
+def test_oldest_entries_are_dropped_at_capacity():
+    index = NearDuplicateIndex(radius=0, max_entries=3)
+    for phash in range(5):
+        index.add(phash, 0.5, 0)
+    assert len(index) == 3
+    assert len(index.within(0)[0]) == 0
+    assert len(index.within(4)[0]) == 1
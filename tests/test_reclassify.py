@@ -0,0 +1,115 @@
+import hashlib
+import io
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import db
+import reclassify
+from reclassify import Reclassification
+from upload_store import UploadStore
+
+
+def predict(batch):
+    return np.tile(np.array([[0.2, 0.8]], dtype=np.float32), (len(batch), 1))
+
+
+def interpret(preds):
+    return int(np.argmax(preds[0])) == 1
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = UploadStore(str(tmp_path / "uploads"))
+    for shade in (40, 120, 200):
+        buf = io.BytesIO()
+        Image.new("RGB", (64, 48), (shade, 90, 30)).save(buf, "JPEG")
+        data = buf.getvalue()
+        store.save(data, hashlib.sha256(data).hexdigest())
+    return store
+
+
+def job(store, db_path, predict_fn=predict, **kwargs):
+    return Reclassification(store, predict_fn, interpret, "model-b", "model-b.h5", batch_size=1, workers=1,
+                            prefetch=1, db_path=db_path, **kwargs)
+
+
+def add_run(db_path, store, status, pid, files_done=0, last_path=None):
+    with db.transaction(db_path) as c:
+        c.execute('''INSERT INTO reclassify_runs (model_id, model_path, upload_root, status, files_done, last_path,
+                                                  owner_pid)
+                     VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                  ("model-b", "model-b.h5", store.root, status, files_done, last_path, pid))
+        return c.lastrowid
+
+
+def run_row(db_path, run_id):
+    return db.query_one("SELECT status, files_done, owner_pid FROM reclassify_runs WHERE id = ?", (run_id,),
+                        path=db_path)
+
+
+def prediction_count(db_path):
+    return db.query_one("SELECT COUNT(*) FROM predictions WHERE model_id = 'model-b'", path=db_path)[0]
+
+
+def test_complete_run_classifies_every_original(store, db_path):
+    report = job(store, db_path).run()
+    assert (report["status"], report["files_done"], report["errors"]) == (reclassify.COMPLETED, 3, 0)
+    assert report["lossy_originals"]
+    assert prediction_count(db_path) == 3
+
+
+def test_failed_run_resumes_after_last_committed_batch(store, db_path):
+    calls = []
+
+    def flaky(batch):
+        calls.append(len(batch))
+        if len(calls) == 2:
+            raise RuntimeError("worker died")
+        return predict(batch)
+
+    first = job(store, db_path, flaky)
+    with pytest.raises(RuntimeError):
+        first.run()
+    assert run_row(db_path, first.run_id)[:2] == (reclassify.FAILED, 1)
+
+    second = job(store, db_path)
+    assert (second.run_id, second.resumed_from) == (first.run_id, 1)
+    report = second.run()
+    assert (report["status"], report["files_done"]) == (reclassify.COMPLETED, 3)
+    assert prediction_count(db_path) == 3
+
+
+def test_restart_ignores_interrupted_run(store, db_path, dead_pid):
+    old = add_run(db_path, store, reclassify.INTERRUPTED, dead_pid, 2, store.originals()[1])
+    fresh = job(store, db_path, restart=True)
+    assert fresh.run_id != old and fresh.resumed_from == 0
+
+
+def test_live_owner_blocks_a_second_run(store, db_path, live_pid):
+    run_id = add_run(db_path, store, reclassify.RUNNING, live_pid)
+    with pytest.raises(ValueError, match=str(live_pid)):
+        job(store, db_path)
+    assert run_row(db_path, run_id) == (reclassify.RUNNING, 0, live_pid)
+
+
+def test_dead_owner_run_is_taken_over_and_resumed(store, db_path, dead_pid):
+    run_id = add_run(db_path, store, reclassify.RUNNING, dead_pid, 1, store.originals()[0])
+    resumed = job(store, db_path)
+    assert (resumed.run_id, resumed.resumed_from) == (run_id, 1)
+    assert run_row(db_path, run_id) == (reclassify.RUNNING, 1, os.getpid())
+    assert resumed.run()["files_done"] == 3
+    assert prediction_count(db_path) == 2  # the first file was done by the dead run
+
+
+def test_startup_recovery_only_interrupts_dead_owners(store, db_path, live_pid, dead_pid):
+    live = add_run(db_path, store, reclassify.RUNNING, live_pid)
+    dead = add_run(db_path, store, reclassify.RUNNING, dead_pid)
+    legacy = add_run(db_path, store, reclassify.RUNNING, None)
+    with db.transaction(db_path) as c:
+        reclassify.ensure_prediction_tables(c)
+    assert run_row(db_path, live)[0] == reclassify.RUNNING
+    assert run_row(db_path, dead)[0] == reclassify.INTERRUPTED
+    assert run_row(db_path, legacy)[0] == reclassify.INTERRUPTED
@@ -0,0 +1,46 @@
+import sqlite3
+
+import pytest
+
+import db
+import rewards
+
+
+def activity_rows(user_id):
+    return db.query_all("SELECT activity_type, points_earned FROM user_activity WHERE user_id = ?", (user_id,))
+
+
+def test_retry_with_same_key_records_reward_and_activity_once(db_path):
+    activity = [(1, "scan", "Scanned a.jpg - recyclable", 10)]
+    key, created = rewards.record_reward(1, "0xabc", 10, "upload-1", activity)
+    assert (key, created) == ("upload-1", True)
+
+    for _ in range(3):
+        assert rewards.record_reward(1, "0xabc", 10, "upload-1", activity) == ("upload-1", False)
+
+    assert db.query_one("SELECT COUNT(*), SUM(points) FROM pending_rewards") == (1, 10)
+    assert activity_rows(1) == [("scan", 10)]
+
+
+def test_distinct_keys_are_separate_rewards(db_path):
+    first, _ = rewards.record_reward(1, "0xabc", 10, activity=[(1, "scan", "a", 10)])
+    second, _ = rewards.record_reward(1, "0xabc", 10, activity=[(1, "scan", "b", 10)])
+    assert first != second
+    assert db.query_one("SELECT COUNT(*) FROM pending_rewards")[0] == 2
+    assert len(activity_rows(1)) == 2
+
+
+def test_failed_activity_insert_rolls_back_the_reward(db_path):
+    with pytest.raises(sqlite3.IntegrityError):
+        rewards.record_reward(1, "0xabc", 10, "upload-2", [(1, None, "missing type", 10)])
+    assert db.query_one("SELECT COUNT(*) FROM pending_rewards")[0] == 0
+
+    # So the client's retry still creates it, points and all
+    assert rewards.record_reward(1, "0xabc", 10, "upload-2", [(1, "scan", "retry", 10)]) == ("upload-2", True)
+    assert activity_rows(1) == [("scan", 10)]
+
+
+def test_reward_status_reports_pending_reward(db_path):
+    rewards.record_reward(1, "0xabc", 10, "upload-3")
+    (status,) = rewards.reward_status(1, "upload-3")
+    assert (status["id"], status["points"], status["status"]) == ("upload-3", 10, rewards.PENDING)
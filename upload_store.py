@@ -0,0 +1,248 @@
+"""Sharded, content-addressed upload storage with thumbnails and tiered retention.
+
+Layout under the upload folder::
+
+    originals/ab/cd/<sha256>.webp     transcoded original, kept ``original_retention_days``
+    thumbnails/ab/cd/<sha256>.webp    small preview for the UI, kept ``thumbnail_retention_days``
+
+The two shard levels come from the content hash, so no directory grows past
+a few thousand entries even with millions of uploads.
+"""
+import hashlib
+import io
+import os
+import shutil
+import threading
+import time
+import uuid
+
+from PIL import Image, ImageOps
+
+from metrics import Histogram
+
+ORIGINALS = "originals"
+THUMBNAILS = "thumbnails"
+TIERS = (ORIGINALS, THUMBNAILS)
+TRANSCODE_FORMATS = {"webp": ("WEBP", ".webp"), "jpeg": ("JPEG", ".jpg")}
+LEGACY_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+
+
+class UploadStore:
+    """Write, expire and account for stored uploads.
+
+    ``original_format`` is ``webp`` or ``jpeg`` to transcode originals, or
+    ``original`` to keep the uploaded bytes. A retention of 0 days keeps a tier
+    forever. Re-uploading an image refreshes its age.
+    """
+
+    def __init__(self, root, original_format="webp", original_quality=85, thumbnail_size=256,
+                 thumbnail_quality=75, original_retention_days=90, thumbnail_retention_days=365,
+                 sweep_interval_s=3600.0):
+        if original_format not in TRANSCODE_FORMATS and original_format != "original":
+            raise ValueError(f"Unknown upload format {original_format!r} (choose from webp, jpeg, original)")
+        self.root = root
+        self.original_format = original_format
+        self.original_quality = original_quality
+        self.thumbnail_size = thumbnail_size
+        self.thumbnail_quality = thumbnail_quality
+        self.retention_days = {ORIGINALS: original_retention_days, THUMBNAILS: thumbnail_retention_days}
+        self.sweep_interval = sweep_interval_s
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.write_ms_hist = Histogram((1, 2, 5, 10, 25, 50, 100, 250, 500, 1000))
+        self.files_written = 0
+        self.bytes_received = 0
+        self.bytes_stored = 0
+        self.write_errors = 0
+        self.usage = None  # per-tier file / byte totals from the last sweep
+        self.last_sweep = None
+
+    def paths(self, digest, ext=".jpg"):
+        """``(original_path, thumbnail_path)`` for an upload hash"""
+        if self.original_format != "original":
+            ext = TRANSCODE_FORMATS[self.original_format][1]
+        return self._path(ORIGINALS, digest, ext), self._path(THUMBNAILS, digest, ".webp")
+
+    def save(self, data, digest, ext=".jpg"):
+        """Store the original (transcoded) and its thumbnail; returns both paths"""
+        original_path, thumbnail_path = self.paths(digest, ext)
+        started = time.perf_counter()
+        try:
+            img = Image.open(io.BytesIO(data))
+            img.load()
+            exif = img.info.get("exif")
+            if self.original_format == "original":
+                original = data
+            else:
+                original = self._encode(_storable(img), self.original_format, self.original_quality, exif)
+            thumb = ImageOps.exif_transpose(img)
+            thumb.thumbnail((self.thumbnail_size, self.thumbnail_size))
+            thumbnail = self._encode(_storable(thumb), "webp", self.thumbnail_quality)
+            _write_atomic(original_path, original)
+            _write_atomic(thumbnail_path, thumbnail)
+        except Exception as e:
+            with self._lock:
+                self.write_errors += 1
+            print(f"Error storing upload {digest}: {e}")
+            raise
+        with self._lock:
+            self.files_written += 1
+            self.bytes_received += len(data)
+            self.bytes_stored += len(original) + len(thumbnail)
+        self.write_ms_hist.observe((time.perf_counter() - started) * 1000.0)
+        return original_path, thumbnail_path
+
+    def touch(self, digest, ext=".jpg"):
+        """Restart the retention clock of an already stored upload"""
+        for path in self.paths(digest, ext):
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+
+    def originals(self):
+        """Paths of every stored original, sorted"""
+        return sorted(path for path, _ in _walk_files(os.path.join(self.root, ORIGINALS)))
+
+    def sweep(self, now=None):
+        """Delete files past their tier's retention and recount disk usage"""
+        now = now or time.time()
+        usage = {}
+        deleted = {}
+        for tier in TIERS:
+            days = self.retention_days[tier]
+            cutoff = now - days * 86400 if days else None
+            files = size = removed = removed_bytes = 0
+            for path, st in _walk_files(os.path.join(self.root, tier)):
+                if cutoff is not None and st.st_mtime < cutoff:
+                    try:
+                        os.remove(path)
+                        removed += 1
+                        removed_bytes += st.st_size
+                    except OSError as e:
+                        print(f"Error expiring upload {path}: {e}")
+                    continue
+                files += 1
+                size += st.st_size
+            usage[tier] = {"files": files, "bytes": size}
+            deleted[tier] = {"files": removed, "bytes": removed_bytes}
+        self.usage = usage
+        self.last_sweep = {"at": now, "deleted": deleted}
+        return self.last_sweep
+
+    def start_sweeper(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="upload-sweeper", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self):
+        try:
+            disk = shutil.disk_usage(self.root)
+            disk = {"total_bytes": disk.total, "free_bytes": disk.free}
+        except OSError:
+            disk = None
+        with self._lock:
+            return {
+                "original_format": self.original_format,
+                "retention_days": dict(self.retention_days),
+                "files_written": self.files_written,
+                "bytes_received": self.bytes_received,
+                "bytes_stored": self.bytes_stored,
+                "write_errors": self.write_errors,
+                "usage": self.usage,
+                "last_sweep": self.last_sweep,
+                "disk": disk,
+                "write_ms": self.write_ms_hist.snapshot(),
+            }
+
+    def compact_legacy(self, dry_run=False):
+        """Move flat pre-sharding uploads into the sharded layout.
+
+        Each file is rehashed, stored (transcoded, with a thumbnail) under its
+        content hash and removed from the flat folder; its age carries over.
+        Returns ``(files, bytes_before, bytes_after)``.
+        """
+        files = bytes_before = bytes_after = 0
+        seen = set()
+        with os.scandir(self.root) as entries:
+            legacy = [entry for entry in entries
+                      if entry.is_file() and entry.name.lower().endswith(LEGACY_EXTENSIONS)]
+        for entry in legacy:
+            with open(entry.path, "rb") as f:
+                data = f.read()
+            digest = hashlib.sha256(data).hexdigest()
+            ext = os.path.splitext(entry.name)[1].lower()
+            files += 1
+            bytes_before += len(data)
+            if dry_run:
+                continue
+            try:
+                paths = self.save(data, digest, ext)
+            except Exception:
+                continue
+            mtime = entry.stat().st_mtime
+            for path in paths:
+                os.utime(path, (mtime, mtime))
+                if digest not in seen:
+                    bytes_after += os.path.getsize(path)
+            seen.add(digest)
+            os.remove(entry.path)
+        return files, bytes_before, bytes_after
+
+    def _path(self, tier, digest, ext):
+        return os.path.join(self.root, tier, digest[:2], digest[2:4], f"{digest}{ext}")
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Error sweeping uploads: {e}")
+            self._stop.wait(self.sweep_interval)
+
+    @staticmethod
+    def _encode(img, fmt, quality, exif=None):
+        if fmt == "jpeg" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        buf = io.BytesIO()
+        options = {"quality": quality}
+        if exif:
+            options["exif"] = exif
+        img.save(buf, TRANSCODE_FORMATS[fmt][0], **options)
+        return buf.getvalue()
+
+
+def _storable(img):
+    # Keep alpha for WEBP; everything else becomes RGB
+    return img if img.mode in ("RGB", "RGBA", "L") else img.convert("RGBA" if "A" in img.getbands() else "RGB")
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _walk_files(folder):
+    """``(path, stat)`` for every file below ``folder``, via scandir"""
+    if not os.path.isdir(folder):
+        return
+    stack = [folder]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False) and not entry.name.endswith(".tmp"):
+                    yield entry.path, entry.stat()
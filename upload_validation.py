@@ -0,0 +1,244 @@
+"""Streaming upload reader: size limits, format sniffing and hashing as bytes arrive."""
+import hashlib
+import struct
+
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, File, MultipartDecoder, NeedData
+
+CHUNK_SIZE = 64 * 1024
+SNIFF_LIMIT = 1024 * 1024  # JPEG dimensions must appear within the first MiB
+FORMAT_EXTENSIONS = {"PNG": ".png", "JPEG": ".jpg", "WEBP": ".webp"}
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# SOF markers carry the frame size; C4 (DHT), C8 (JPG) and CC (DAC) share the range but do not
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+JPEG_STANDALONE_MARKERS = {0x01} | set(range(0xD0, 0xD8))
+
+
+class UploadRejected(ValueError):
+    """An upload failed validation; ``status`` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class Upload:
+    """A validated upload held in memory, with its content hash and header info."""
+
+    __slots__ = ("filename", "data", "digest", "format", "width", "height")
+
+    def __init__(self, filename, data, digest, fmt, width, height):
+        self.filename = filename
+        self.data = data
+        self.digest = digest
+        self.format = fmt
+        self.width = width
+        self.height = height
+
+    @property
+    def extension(self):
+        return FORMAT_EXTENSIONS[self.format]
+
+
+def sniff_image(header):
+    """``(format, width, height)`` from the first bytes of a PNG, JPEG or WEBP file.
+
+    Returns None while more bytes are needed and raises UploadRejected (415)
+    once the bytes cannot be one of the supported formats.
+    """
+    if len(header) < 12:
+        if PNG_SIGNATURE.startswith(header[:8]) or b"\xff\xd8\xff".startswith(header[:3]) \
+                or b"RIFF".startswith(header[:4]):
+            return None
+        raise UploadRejected("Not a PNG, JPEG or WEBP image", 415)
+    if header.startswith(PNG_SIGNATURE):
+        return _sniff_png(header)
+    if header.startswith(b"\xff\xd8\xff"):
+        return _sniff_jpeg(header)
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return _sniff_webp(header)
+    raise UploadRejected("Not a PNG, JPEG or WEBP image", 415)
+
+
+def _sniff_png(header):
+    if len(header) < 24:
+        return None
+    if header[12:16] != b"IHDR":
+        raise UploadRejected("Corrupt PNG header", 415)
+    width, height = struct.unpack(">II", header[16:24])
+    return "PNG", width, height
+
+
+def _sniff_jpeg(header):
+    i = 2
+    while True:
+        if len(header) < i + 4:
+            return None
+        if header[i] != 0xFF:
+            raise UploadRejected("Corrupt JPEG header", 415)
+        marker = header[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker in JPEG_STANDALONE_MARKERS:
+            i += 2
+            continue
+        if marker in JPEG_SOF_MARKERS:
+            if len(header) < i + 9:
+                return None
+            height, width = struct.unpack(">HH", header[i + 5:i + 9])
+            return "JPEG", width, height
+        if marker in (0xD9, 0xDA):
+            raise UploadRejected("JPEG has no frame header before its image data", 415)
+        i += 2 + struct.unpack(">H", header[i + 2:i + 4])[0]
+
+
+def _sniff_webp(header):
+    if len(header) < 30:
+        return None
+    chunk = header[12:16]
+    if chunk == b"VP8 ":
+        if header[23:26] != b"\x9d\x01\x2a":
+            raise UploadRejected("Corrupt WEBP (VP8) header", 415)
+        width, height = struct.unpack("<HH", header[26:30])
+        return "WEBP", width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L":
+        if header[20] != 0x2F:
+            raise UploadRejected("Corrupt WEBP (VP8L) header", 415)
+        bits = struct.unpack("<I", header[21:25])[0]
+        return "WEBP", (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X":
+        return "WEBP", int.from_bytes(header[24:27], "little") + 1, int.from_bytes(header[27:30], "little") + 1
+    raise UploadRejected("Unsupported WEBP variant", 415)
+
+
+class ImageStreamValidator:
+    """Accumulate an upload chunk by chunk, rejecting it as early as possible.
+
+    The byte limit is checked on every chunk and the pixel limit as soon as
+    the header reveals the dimensions, so oversized or non-image uploads are
+    refused before the rest of the body is read. The SHA-256 digest is
+    computed along the way.
+    """
+
+    def __init__(self, filename, max_bytes, max_pixels):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.size = 0
+        self.info = None
+        self._chunks = []
+        self._header = bytearray()
+        self._hasher = hashlib.sha256()
+
+    def feed(self, chunk):
+        if not chunk:
+            return
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise UploadRejected(f"{self.filename} exceeds the {self.max_bytes} byte upload limit", 413)
+        self._hasher.update(chunk)
+        self._chunks.append(chunk)
+        if self.info is None:
+            self._header += chunk[:SNIFF_LIMIT - len(self._header)]
+            try:
+                info = sniff_image(bytes(self._header))
+            except UploadRejected as e:
+                raise UploadRejected(f"{self.filename}: {e}", e.status) from None
+            self._check(info)
+
+    def finish(self):
+        if self.size == 0:
+            raise UploadRejected(f"{self.filename} is empty", 400)
+        if self.info is None:
+            if len(self._header) >= SNIFF_LIMIT:
+                raise UploadRejected(f"No image dimensions in the first {SNIFF_LIMIT} bytes of {self.filename}", 415)
+            raise UploadRejected(f"{self.filename} is truncated before its image header ends", 415)
+        return Upload(self.filename, b"".join(self._chunks), self._hasher.hexdigest(), *self.info)
+
+    def _check(self, info):
+        if info is None:
+            if len(self._header) >= SNIFF_LIMIT:
+                raise UploadRejected(f"No image dimensions in the first {SNIFF_LIMIT} bytes of {self.filename}", 415)
+            return
+        fmt, width, height = info
+        if width == 0 or height == 0:
+            raise UploadRejected(f"{self.filename} has invalid dimensions {width}x{height}", 415)
+        if width * height > self.max_pixels:
+            raise UploadRejected(f"{self.filename} is {width}x{height} ({width * height} pixels); "
+                                 f"the limit is {self.max_pixels} pixels", 413)
+        self.info = info
+
+
+def validate_image_bytes(filename, data, max_bytes, max_pixels):
+    """Run already-buffered bytes (batch and zip members) through the same checks"""
+    validator = ImageStreamValidator(filename, max_bytes, max_pixels)
+    validator.feed(data)
+    return validator.finish()
+
+
+def read_multipart_file(stream, content_type, field, max_bytes, max_pixels, filename_filter=None):
+    """Stream one file field out of a multipart/form-data body and validate it.
+
+    Reads ``stream`` in CHUNK_SIZE pieces and stops as soon as the file part
+    is complete or rejected; other fields are skipped without buffering.
+    ``filename_filter(filename)`` may raise UploadRejected to refuse the file
+    from its name alone, before any of its bytes are read.
+    """
+    reader = MultipartFileReader(content_type, field, max_bytes, max_pixels, filename_filter)
+    while True:
+        upload = reader.feed(stream.read(CHUNK_SIZE))
+        if upload is not None:
+            return upload
+
+
+class MultipartFileReader:
+    """Push-style ``read_multipart_file`` for bodies that arrive as chunks (ASGI).
+
+    ``feed`` each chunk as it is received and an empty chunk at the end of the
+    body; it returns the validated Upload as soon as the file part is complete.
+    """
+
+    def __init__(self, content_type, field, max_bytes, max_pixels, filename_filter=None):
+        mimetype, options = parse_options_header(content_type or "")
+        boundary = options.get("boundary")
+        if mimetype != "multipart/form-data" or not boundary:
+            raise UploadRejected("Expected a multipart/form-data upload", 400)
+        self.field = field
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.filename_filter = filename_filter
+        self._decoder = MultipartDecoder(boundary.encode(), max_form_memory_size=None)
+        self._validator = None
+        self._in_target = False
+
+    def feed(self, chunk):
+        """Process one chunk (``b""`` at the end); returns the Upload once it is complete, else None"""
+        self._decoder.receive_data(chunk or None)
+        while True:
+            try:
+                event = self._decoder.next_event()
+            except ValueError as e:
+                raise UploadRejected(f"Malformed multipart body: {e}", 400)
+            if isinstance(event, NeedData):
+                return None if chunk else self._finish()
+            if isinstance(event, Epilogue):
+                return self._finish()
+            if isinstance(event, File):
+                self._in_target = event.name == self.field and self._validator is None
+                if self._in_target:
+                    if not event.filename:
+                        raise UploadRejected("Empty file", 400)
+                    if self.filename_filter is not None:
+                        self.filename_filter(event.filename)
+                    self._validator = ImageStreamValidator(event.filename, self.max_bytes, self.max_pixels)
+            elif isinstance(event, Data) and self._in_target:
+                self._validator.feed(event.data)
+                if not event.more_data:
+                    return self._validator.finish()
+
+    def _finish(self):
+        if self._validator is None:
+            raise UploadRejected("No file uploaded", 400)
+        return self._validator.finish()